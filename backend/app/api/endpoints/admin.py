@@ -647,6 +647,8 @@ async def upload_firmware(
         "key": result['key'],
         "filename": result['filename'],
         "size": result['size'],
+        "stored_size": result['stored_size'],
+        "compressed": result['compressed'],
         "bucket": result['bucket'],
         "uploaded_by": admin.username,
         "uploaded_at": result['uploaded_at']
@@ -682,3 +684,228 @@ async def get_firmware_download_url(
     
     return {"url": url, "expires_in": 3600}
 
+
+
+# === SIMILARITY INDEX ===
+
+from fastapi.concurrency import run_in_threadpool
+from app.models.firmware import Firmware
+from app.services.firmware_similarity import similarity_index
+from app.services.uploads import UploadTooLarge, read_upload
+
+
+def index_stock_file(firmware_id: int, content: bytes) -> int:
+    """Сигнатура файла в индекс похожести и сохранение на диск (в пуле потоков)"""
+    similarity_index.ensure_loaded()
+    similarity_index.add(firmware_id, content)
+    similarity_index.save()
+    return len(similarity_index)
+
+
+@router.post("/firmwares/{firmware_id}/similarity")
+async def add_firmware_to_similarity_index(
+    firmware_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Добавить стоковый файл прошивки в индекс похожести.
+    
+    Инкрементальное обновление: сигнатура считается только для
+    этого файла, индекс сохраняется на диск.
+    """
+    result = await db.execute(select(Firmware.id).where(Firmware.id == firmware_id))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Firmware not found")
+    
+    try:
+        upload = await run_in_threadpool(read_upload, file.file, file.filename, size=file.size)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not upload.content:
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    indexed_total = await run_in_threadpool(index_stock_file, firmware_id, upload.content)
+    
+    return {
+        "success": True,
+        "firmware_id": firmware_id,
+        "indexed_total": indexed_total,
+    }
+
+
+# === CUSTOMER ORIGINALS (dedup store) ===
+
+from fastapi.responses import StreamingResponse
+from app.services.chunk_store import chunk_store, parse_ref
+
+
+@router.get("/originals/{file_id}")
+async def download_original(
+    file_id: str,
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Скачать оригинал клиента из дедуплицирующего хранилища.
+    
+    file_id - SHA-256 файла (часть ссылки dedup://... в заказе).
+    """
+    file_id = parse_ref(file_id) or file_id
+    manifest = chunk_store.get_manifest(file_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    filename = manifest.get("filename") or f"{file_id}.bin"
+    return StreamingResponse(
+        chunk_store.iter_file(file_id),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(manifest["size"]),
+        }
+    )
+
+
+@router.post("/originals/gc")
+async def collect_originals_garbage(
+    rebuild_counts: bool = False,
+    current_admin: AdminUser = Depends(require_admin_role)
+):
+    """
+    Сборка мусора: удалить блоки без ссылок.
+    
+    Только для ADMIN роли.
+    """
+    return await chunk_store.gc(rebuild_counts)
+
+
+# === VARIANT STOCK PROFILES ===
+
+import json
+from fastapi import Form
+from app.models.firmware_variant import FirmwareVariant
+from app.services import variant_verifier
+
+
+@router.post("/variants/{variant_id}/profile")
+async def build_variant_profile(
+    variant_id: int,
+    stock: UploadFile = File(...),
+    modified: Optional[UploadFile] = File(None),
+    regions: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Построить профиль стока для Stage варианта.
+    
+    - stock: стоковый файл, из которого собран вариант
+    - modified: файл Stage (если не передан - берётся из S3 по s3_key)
+    - regions: JSON [{"name": "calibration", "start": 0, "end": 65536}, ...]
+    
+    Пропатченные диапазоны вычисляются диффом стока и Stage файла.
+    """
+    result = await db.execute(select(FirmwareVariant).where(FirmwareVariant.id == variant_id))
+    variant = result.scalar_one_or_none()
+    if not variant:
+        raise HTTPException(status_code=404, detail="Variant not found")
+    
+    stock_data = await stock.read()
+    if modified is not None:
+        modified_data = await modified.read()
+    elif variant.s3_key:
+        modified_data = b"".join(s3_storage.open_stream(variant.s3_key))
+    else:
+        modified_data = None
+    
+    try:
+        region_list = json.loads(regions) if regions else None
+        profile = variant_verifier.build_profile(
+            stock_data,
+            regions=region_list,
+            modified=modified_data,
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regions: {e}")
+    
+    variant.stock_profile = profile
+    await db.commit()
+    
+    return {
+        "success": True,
+        "variant_id": variant_id,
+        "file_size": profile["file_size"],
+        "patched_ranges": len(profile["patched_ranges"]),
+        "regions": [
+            {"name": r["name"], "start": r["start"], "end": r["end"], "blocks": r["blocks"]}
+            for r in profile["regions"]
+        ],
+    }
+
+
+# === FIRMWARE PREVIEW (hex / heatmap tiles) ===
+
+from fastapi import Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from app.services.firmware_preview import preview_service
+
+PREVIEW_CACHE_CONTROL = "private, max-age=3600"
+
+
+@router.get("/firmwares/preview/hex")
+async def get_firmware_hex_tile(
+    request: Request,
+    key: str,
+    offset: int = Query(0, ge=0),
+    length: int = Query(4096, gt=0),
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Hex-тайл прошивки из Object Storage (до 64 KB).
+    
+    Скачивается только нужный регион (range GET + локальный блочный кеш).
+    Поддерживает If-None-Match -> 304.
+    """
+    etag = await run_in_threadpool(preview_service.current_etag, key, "hex", offset, min(length, 64 * 1024))
+    if etag is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    tile, etag = await run_in_threadpool(preview_service.hex_tile, key, offset, length)
+    return JSONResponse(tile, headers={"ETag": etag, "Cache-Control": PREVIEW_CACHE_CONTROL})
+
+
+@router.get("/firmwares/preview/heatmap")
+async def get_firmware_heatmap_tile(
+    request: Request,
+    key: str,
+    offset: int = Query(0, ge=0),
+    length: int = Query(65536, gt=0),
+    width: int = Query(256, ge=8, le=2048),
+    word_size: int = Query(1, ge=1, le=2),
+    big_endian: bool = False,
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """
+    Тепловая карта значений (PNG) для региона прошивки (до 1 MB).
+    
+    word_size=2 - 16-битные слова (типично для карт калибровок).
+    """
+    params = (offset, min(length, 1024 * 1024), width, word_size, big_endian)
+    etag = await run_in_threadpool(preview_service.current_etag, key, "heatmap", *params)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    png, etag = await run_in_threadpool(
+        preview_service.heatmap_tile, key, offset, length, width, word_size, big_endian
+    )
+    return Response(
+        content=png,
+        media_type="image/png",
+        headers={"ETag": etag, "Cache-Control": PREVIEW_CACHE_CONTROL}
+    )
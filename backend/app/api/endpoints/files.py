@@ -0,0 +1,36 @@
+"""
+File download endpoints (сжатые объекты Object Storage)
+"""
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.security import decode_download_token
+from app.services.s3_storage import s3_storage
+
+router = APIRouter()
+
+
+@router.get("/download")
+async def download_file(token: str):
+    """
+    Скачать файл по подписанной ссылке.
+    
+    Ссылку выдаёт s3_storage.generate_download_url для сжатых (zstd)
+    объектов - файл распаковывается на лету, клиент получает исходные байты.
+    """
+    key = decode_download_token(token)
+    
+    info = s3_storage.get_object_info(key)
+    if not info:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    filename = s3_storage.download_filename(key)
+    return StreamingResponse(
+        s3_storage.open_stream(key),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(info["size"]),
+        }
+    )
@@ -1,370 +1,752 @@
 """
 API endpoint для поиска прошивки по загруженному BIN файлу
 """
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select, or_
-from typing import Dict, List, Optional, Any
-import tempfile
-import os
-import re
-
-from app.core.database_sync import get_db_sync
+import asyncio
+import json
+import time
+import zipfile
+
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Body, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import async_session_maker, get_db
+from app.core.metrics import timed, track_request
 from app.models.firmware import Firmware
 from app.services.firmware_parser import FirmwareParser
+from app.services.firmware_similarity import similarity_index
+from app.services.batch_search import BatchLimitExceeded, is_archive, parse_in_pool, unpack_archive
+from app.services.catalog_snapshot import catalog_snapshot
+from app.services.chunk_store import chunk_store
+from app.services import variant_verifier
+from app.services.firmware_ids import extract_ids_from_filename, normalize_id
+from app.services.firmware_lookup import (
+    CandidateSource,
+    accepted_match,
+    build_candidates,
+    filename_part_candidates,
+    lookup_candidate_groups,
+    lookup_candidates,
+    make_candidate,
+    ranked_search,
+)
+from app.services.fuzzy_index import fuzzy_index
+from app.services.id_filter import id_filter
+from app.services.search_cache import search_cache
+from app.services.stage_variants import variant_loader, variants_payload
+from app.services.suggest_index import DEFAULT_LIMIT as SUGGEST_LIMIT, MAX_LIMIT as MAX_SUGGEST_LIMIT, suggest_index
+from app.services.uploads import UploadedFile, UploadTooLarge, read_upload
 from loguru import logger
 
 router = APIRouter(prefix="/api/firmware", tags=["firmware"])
 
+# Максимум ID в одном запросе /ids/contains
+MAX_CONTAINS_IDS = 1000
+
+# Максимум кандидатов (OCR) в одном запросе /search/ids
+MAX_SEARCH_IDS = 20
+
+# Сколько ранжированных кандидатов возвращает поиск по ID
+SEARCH_ID_K = 5
+
+# Нечёткое совпадение принимается автоматически, если отличия - только OCR-двойники
+FUZZY_ACCEPT_DISTANCE = 0.5
+
 parser = FirmwareParser()
 
-# Chinese ECU patterns to extract from filename
-FILENAME_PATTERNS = [
-    # Hyundai/Kia Bosch calibration: GRBRB44CQS6-A000, GRBRB44CFS8-5000
-    r'(GR[A-Z0-9]{6,12}[-_]?[A-Z0-9]{4,6})',
-    # Hyundai/Kia software IDs: GN26ST2E2
-    r'(GN[0-9]{2}[A-Z0-9]{4,8})',
-    # Full Chinese calibration: GCQBRB44CQS03A00 (16+ chars)
-    r'([A-Z]{3,5}[A-Z0-9]{10,15})',
-    # UAES/Bosch China: F01R0AD3G0, F01RB0D2T4
-    r'(F01R[0A-Z0-9]{5,10})',
-    # Toyota/Denso style: R7F701202_89663-06N50
-    r'(R7F[0-9]+_[0-9A-Z-]+)',
-    r'([0-9]{5}-[0-9A-Z]{4,6})',
-    # Bosch MED17/EDC17 - extract VI number: vi_004782 -> 004782
-    r'vi_(\d{6,8})',
-    # Bosch serial from filename: _XXXXXXXX_ 10 digits
-    r'_(\d{10})_',
-    # Bosch SW number 27XXXXXXXX or 26XXXXXXXX
-    r'(2[67]\d{8})',
-    # Bosch 1037 format
-    r'(103\d{7,10})',
-]
-
-
-def extract_ids_from_filename(filename: str) -> List[str]:
-    """Extract potential firmware IDs from filename"""
-    ids = []
-    # Remove extension and date patterns
-    clean = re.sub(r'-\d{8}-\d{6}', '', filename)  # Remove date-time
-    clean = re.sub(r'\.\w{2,4}$', '', clean)  # Remove extension
-    
-    # First, add the clean filename itself as potential ID (most reliable)
-    if len(clean) >= 6:
-        ids.append(clean)
-    
-    # Then try patterns
-    for pattern in FILENAME_PATTERNS:
-        matches = re.findall(pattern, clean, re.IGNORECASE)
-        ids.extend(matches)
-    
-    # Remove duplicates but keep order
-    seen = set()
-    unique = []
-    for id in ids:
-        if id.upper() not in seen:
-            seen.add(id.upper())
-            unique.append(id)
-    
-    return unique
-
-
-def smart_search_by_filename(filename: str, db: Session) -> Optional[Any]:
+
+def timings_requested(timings: bool, header: Optional[str]) -> bool:
+    """Блок timings в ответе: ?timings=true или заголовок X-Search-Timings: 1"""
+    return timings or (header or "").strip().lower() in ("1", "true", "yes")
+
+async def smart_search_by_filename(
+    filename: str,
+    db: AsyncSession,
+    include_variants: bool = False,
+) -> Optional[Firmware]:
     """
     Умный поиск по имени файла - разбивает на части и ищет в базе.
     Например: Hyundai_Solaris_1.2_(Оригинал)_GATA-BE42QS09A00_.bin
-    -> пробует найти GATA-BE42QS09A00 в software_id
+    -> пробует найти BE42QS09A00 в software_id
     
     Также: EL4YP2AS1F1D-20260112-184331_E2.bin -> EL4YP2AS1F1D
+    
+    Все части (и сокращённые до 12 символов) ищутся одним запросом,
+    лучшая по рангу - более ранняя часть, точное совпадение выше подстроки.
+    Префикс/подстрока принимается, только если она однозначна.
     """
-    if not filename:
+    candidates = filename_part_candidates(filename)
+    logger.info(f"Smart search parts from filename: {[c['term'] for c in candidates]}")
+    
+    matches = await lookup_candidates(db, candidates, k=2, fuzzy=False, include_variants=include_variants)
+    best = accepted_match(matches)
+    if not best:
         return None
     
-    # Убираем расширение
-    clean = re.sub(r'\.\w{2,4}$', '', filename)
-    
-    # Убираем даты в формате YYYYMMDD или YYYYMMDD-HHMMSS
-    clean = re.sub(r'-?\d{8}(-\d{6})?', '', clean)
-    
-    # Разбиваем на части по _, пробелам, дефисам
-    parts = re.split(r'[_\s\-]+', clean)
-    
-    # Фильтруем части длиннее 6 символов (потенциальные ID)
-    # Исключаем общие слова
-    skip_words = ['hyundai', 'solaris', 'accent', 'toyota', 'kia', 'bmw', 'nissan', 
-                  'оригинал', 'original', 'stage', 'mod', 'tuned', 'stock']
-    potential_ids = [p for p in parts if len(p) >= 6 and p.lower() not in skip_words]
-    
-    logger.info(f"Smart search parts from filename: {potential_ids}")
-    
-    for part in potential_ids:
-        # Ищем полное совпадение части
-        stmt = select(Firmware).where(
-            Firmware.software_id.ilike(f"%{part}%")
-        ).limit(1)
-        result = db.execute(stmt)
-        firmware = result.scalar_one_or_none()
-        if firmware:
-            logger.info(f"Smart search found by part: {part}")
-            return firmware
-        
-        # Пробуем без дефисов и подчёркиваний
-        clean_part = part.replace('-', '').replace('_', '')
-        if clean_part != part:
-            stmt = select(Firmware).where(
-                Firmware.software_id.ilike(f"%{clean_part}%")
-            ).limit(1)
-            result = db.execute(stmt)
-            firmware = result.scalar_one_or_none()
-            if firmware:
-                logger.info(f"Smart search found by clean part: {clean_part}")
-                return firmware
-        
-        # Пробуем первые 10-12 символов (часто ID сокращён)
-        if len(part) > 12:
-            short_part = part[:12]
-            stmt = select(Firmware).where(
-                Firmware.software_id.ilike(f"%{short_part}%")
-            ).limit(1)
-            result = db.execute(stmt)
-            firmware = result.scalar_one_or_none()
-            if firmware:
-                logger.info(f"Smart search found by short part: {short_part}")
-                return firmware
+    logger.info(f"Smart search found by part: {best['matched_id']}")
+    return best["firmware"]
+
+
+async def get_firmware(db: AsyncSession, firmware_id: int, include_variants: bool = False):
+    """Прошивка из снимка каталога (с вариантами); нет в снимке - из БД"""
+    firmware = catalog_snapshot.get(firmware_id)
+    if firmware is None:
+        firmware = await db.get(Firmware, firmware_id, options=[variant_loader(include_variants)])
+    return firmware
+
+
+def firmware_summary(firmware: Firmware) -> Dict:
+    """Краткая информация о прошивке для ответа поиска"""
+    return {
+        "id": firmware.id,
+        "brand": firmware.brand,
+        "series": firmware.series,
+        "ecu_brand": firmware.ecu_brand,
+        "software_id": firmware.software_id,
+        "hardware_id": firmware.hardware_id,
+        "file_size": firmware.file_size,
+        "price": float(firmware.price) if firmware.price else 50.0,
+        "winols_file": firmware.winols_file,
+    }
+
+
+def with_variants(result: Dict, firmware: Firmware) -> Dict:
+    """Добавить в ответ Stage варианты (реальные или шаблоны с ценами)"""
+    payload = variants_payload(firmware)
+    result["variants"] = payload["variants"]
+    if payload.get("note"):
+        result["variants_note"] = payload["note"]
+    return result
+
+
+def candidate_summary(match: Dict) -> Dict:
+    """Элемент ранжированного списка кандидатов"""
+    firmware = match["firmware"]
+    return {
+        "firmware_id": firmware.id,
+        "software_id": firmware.software_id,
+        "brand": firmware.brand,
+        "series": firmware.series,
+        "matched_id": match["matched_id"],
+        "source": match["source"],
+        "match": match["match"],
+        "score": match["score"],
+        "hardware_match": match.get("hardware_match", False),
+    }
+
+
+async def find_similar_firmwares(content: bytes, db: AsyncSession, k: int = 5) -> List[Dict]:
+    """
+    Найти похожие прошивки каталога по содержимому файла (MinHash/LSH).
+    Используется, когда ни один ID не совпал - файл часто оказывается
+    ревизией уже известного стока.
+    """
+    hits = await run_in_threadpool(similarity_index.query, content, k)
+    if not hits:
+        return []
     
-    return None
+    stmt = select(Firmware).where(Firmware.id.in_([h["firmware_id"] for h in hits]))
+    firmwares = {f.id: f for f in (await db.execute(stmt)).scalars().all()}
+    
+    return [
+        {
+            "id": firmware.id,
+            "brand": firmware.brand,
+            "series": firmware.series,
+            "ecu_brand": firmware.ecu_brand,
+            "software_id": firmware.software_id,
+            "similarity": hit["similarity"],
+        }
+        for hit in hits
+        if (firmware := firmwares.get(hit["firmware_id"]))
+    ]
 
 
-@router.post("/search")
-def search_firmware(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db_sync)
+async def store_original(upload: UploadedFile) -> Optional[str]:
+    """
+    Сохранить оригинал клиента в дедуплицирующее хранилище.
+    Возвращает ссылку dedup://<sha256> для Order.original_file_path.
+    Ошибка хранилища не должна ломать поиск.
+    """
+    if not upload.content:
+        return None
+    try:
+        return (await chunk_store.put_file(upload.content, upload.filename, sha256=upload.sha256))["ref"]
+    except Exception as e:
+        logger.error(f"Failed to store original {upload.filename}: {e}")
+        return None
+
+
+def smart_search_result(firmware: Firmware) -> Dict:
+    """Ответ поиска, когда прошивка найдена умным поиском по имени файла"""
+    return {
+        "found": True,
+        "message": "Firmware found by smart filename search",
+        "extracted_id": firmware.software_id,
+        "firmware": firmware_summary(firmware),
+        "parse_result": {"method": "smart_filename_search"},
+        "search_ids": [firmware.software_id],
+    }
+
+
+def upload_candidates(parse_result: Dict, filename: Optional[str]) -> List[Dict]:
+    """Кандидаты: сначала парсер (более надёжно), потом имя файла (особенно для китайских ECU)"""
+    filename_ids = extract_ids_from_filename(filename or "")
+    logger.info(f"IDs from filename: {filename_ids}")
+    return build_candidates(parse_result, filename_ids)
+
+
+def match_result(
+    parse_result: Dict,
+    filename: Optional[str],
+    search_ids: List[str],
+    matches: List[Dict],
+) -> Dict:
+    """Ответ поиска по кандидатам из файла (без similar_firmwares для ненайденных)"""
+    if not search_ids:
+        return {
+            "found": False,
+            "message": "Could not extract firmware ID from file",
+            "parse_result": parse_result,
+        }
+    
+    best = accepted_match(matches)
+    if best:
+        return {
+            "found": True,
+            "message": "Firmware found in database",
+            "extracted_id": best["matched_id"],
+            "firmware": firmware_summary(best["firmware"]),
+            "candidates": [candidate_summary(m) for m in matches],
+            "parse_result": {
+                "confidence": parse_result.get('confidence'),
+                "ecu": parse_result.get('ecu'),
+                "brand": parse_result.get('brand'),
+                "hardware_id": parse_result.get('hardware_id'),
+            },
+            "search_ids": search_ids,
+        }
+    
+    return {
+        "found": False,
+        "message": "Firmware not found in database",
+        "extracted_id": parse_result.get('software_id'),
+        "search_ids": search_ids,
+        "parse_result": parse_result,
+        "candidates": [candidate_summary(m) for m in matches],
+        "suggestion": "This file needs manual processing",
+        "filename": filename,
+    }
+
+
+async def resolve_upload(
+    content: bytes,
+    filename: Optional[str],
+    db: AsyncSession,
+    include_variants: bool = False,
 ) -> Dict:
     """
-    Загрузить BIN файл и найти соответствующую прошивку в базе
+    Найти прошивку по содержимому и имени файла (без original_ref).
     
-    Процесс:
-    1. Загружаем файл во временную папку
-    2. Парсим файл и извлекаем ID
-    3. Также пробуем извлечь ID из имени файла!
-    4. УМНЫЙ ПОИСК: разбиваем имя на части и ищем каждую в базе
-    5. Возвращаем информацию о прошивке
+    1. УМНЫЙ ПОИСК: разбиваем имя на части и ищем каждую в базе
+    2. Парсим файл и извлекаем ID, также ID из имени файла
+    3. Все кандидаты ищем одним запросом и ранжируем (top-k)
+    
+    include_variants - Stage варианты найденной прошивки тем же запросом.
     """
     
     # =============================================
     # СНАЧАЛА: Умный поиск по имени файла (самый надёжный!)
     # =============================================
-    logger.info(f"Processing file: {file.filename}")
-    
-    smart_result = smart_search_by_filename(file.filename, db)
+    with timed("filename_search"):
+        smart_result = await smart_search_by_filename(filename, db, include_variants)
     if smart_result:
-        return {
-            "found": True,
-            "message": "Firmware found by smart filename search",
-            "extracted_id": smart_result.software_id,
-            "firmware": {
-                "id": smart_result.id,
-                "brand": smart_result.brand,
-                "series": smart_result.series,
-                "ecu_brand": smart_result.ecu_brand,
-                "software_id": smart_result.software_id,
-                "hardware_id": smart_result.hardware_id,
-                "file_size": smart_result.file_size,
-                "price": float(smart_result.price) if smart_result.price else 50.0,
-                "winols_file": smart_result.winols_file,
-            },
-            "parse_result": {"method": "smart_filename_search"},
-            "search_ids": [smart_result.software_id],
-        }
+        result = smart_search_result(smart_result)
+        return with_variants(result, smart_result) if include_variants else result
     
-    # Сохраняем во временный файл
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.bin') as tmp_file:
-        content = file.file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
+    # Парсим файл (из памяти, в пуле потоков - не блокирует event loop)
+    logger.info(f"Parsing uploaded file: {filename}")
+    with timed("parse"):
+        parse_result = await run_in_threadpool(parser.parse_data, content)
     
-    try:
-        # Парсим файл
-        logger.info(f"Parsing uploaded file: {file.filename}")
-        parse_result = parser.parse_file(tmp_path)
-        
-        software_id = parse_result.get('software_id')
-        all_matches = parse_result.get('all_matches', [])
-        
-        logger.info(f"Parser found software_id: {software_id}")
-        logger.info(f"Parser all_matches: {all_matches}")
-        
-        # Также пробуем извлечь ID из имени файла (особенно для китайских ECU)
-        filename_ids = extract_ids_from_filename(file.filename or "")
-        logger.info(f"IDs from filename: {filename_ids}")
-        
-        # Комбинируем все возможные ID для поиска
-        # Сначала ID из парсера (более надёжно), потом из имени файла
-        search_ids = []
-        if software_id:
-            search_ids.append(software_id)
-        # Добавляем все найденные паттерны тоже
-        for match in all_matches:
-            if match.get('match') and match['match'] != software_id:
-                search_ids.append(match['match'])
-        search_ids.extend(filename_ids)
-        
-        # Убираем дубликаты
-        seen = set()
-        unique_search_ids = []
-        for sid in search_ids:
-            if sid.upper() not in seen:
-                seen.add(sid.upper())
-                unique_search_ids.append(sid)
-        search_ids = unique_search_ids
-        
-        if not search_ids:
-            return {
-                "found": False,
-                "message": "Could not extract firmware ID from file",
-                "parse_result": parse_result,
-            }
-        
+    logger.info(f"Parser found software_id: {parse_result.get('software_id')}, "
+                f"hardware_id: {parse_result.get('hardware_id')}")
+    logger.info(f"Parser all_matches: {parse_result.get('all_matches', [])}")
+    
+    with timed("candidates"):
+        candidates = upload_candidates(parse_result, filename)
+    search_ids = [c["term"] for c in candidates]
+    
+    matches = []
+    if search_ids:
         logger.info(f"Searching with IDs: {search_ids}")
+        # Все кандидаты одним запросом, ранжированный top-k (при равных SW - по HW номеру)
+        with timed("db_lookup"):
+            matches = await lookup_candidates(
+                db, candidates, k=5, include_variants=include_variants,
+                hardware_id=parse_result.get("hardware_id"),
+            )
+    
+    result = match_result(parse_result, filename, search_ids, matches)
+    if result["found"] and include_variants:
+        with_variants(result, accepted_match(matches)["firmware"])
+    if not result["found"]:
+        with timed("similar"):
+            result["similar_firmwares"] = await find_similar_firmwares(content, db)
+    return result
+
+
+@router.post("/search")
+async def search_firmware(
+    file: UploadFile = File(...),
+    include_variants: bool = False,
+    timings: bool = False,
+    x_search_timings: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+) -> Dict:
+    """
+    Загрузить BIN файл и найти соответствующую прошивку в базе
+    
+    Процесс:
+    1. Читаем файл блоками (SHA-256 по ходу чтения, лимит MAX_UPLOAD_SIZE),
+       оригинал - в дедуплицирующее хранилище
+    2. Результат поиска по (SHA-256, имя) - из кеша Redis, если есть
+    3. Иначе поиск (resolve_upload) и запись в кеш
+    
+    ?include_variants=true - Stage варианты найденной прошивки в том же
+    ответе (variants, variants_note), без отдельного запроса /variants.
+    ?timings=true (или X-Search-Timings: 1) - время этапов и число
+    запросов к БД в блоке timings.
+    """
+    logger.info(f"Processing file: {file.filename}")
+    
+    with track_request("search_upload") as request_timings:
+        try:
+            with timed("read"):
+                upload = await run_in_threadpool(read_upload, file.file, file.filename, None, file.size)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        with timed("store_original"):
+            original_ref = await store_original(upload)
         
-        # Ищем в базе по всем найденным ID
-        firmware = None
-        matched_id = None
+        cache_key = search_cache.content_key(upload.sha256, upload.filename, include_variants=include_variants)
+        with timed("cache_get"):
+            result, version = await search_cache.aget(cache_key)
+        if result is None:
+            result = await resolve_upload(upload.content, upload.filename, db, include_variants)
+            with timed("cache_set"):
+                await search_cache.aset(cache_key, result, version)
+        else:
+            logger.info(f"Search cache hit for {file.filename}")
         
-        for search_id in search_ids:
-            # Ищем напрямую
-            stmt = select(Firmware).where(
-                Firmware.software_id.ilike(f"%{search_id}%")
-            )
-            result = db.execute(stmt)
-            firmware = result.scalar_one_or_none()
-            
-            if firmware:
-                matched_id = search_id
-                break
-            
-            # Пробуем без дефисов и пробелов
-            clean_id = search_id.replace('-', '').replace(' ', '').replace('_', '')
-            stmt = select(Firmware).where(
-                Firmware.software_id.ilike(f"%{clean_id}%")
+        response = {**result, "original_ref": original_ref}
+    
+    if timings_requested(timings, x_search_timings):
+        response["timings"] = request_timings.as_dict()
+    return response
+
+
+async def read_batch(files: List[UploadFile]) -> List[UploadedFile]:
+    """
+    Файлы пакета: несколько загрузок или один ZIP архив.
+    Лимиты BATCH_SEARCH_MAX_FILES / BATCH_SEARCH_MAX_TOTAL_SIZE - ошибка 413.
+    """
+    max_files = settings.BATCH_SEARCH_MAX_FILES
+    max_total_size = settings.BATCH_SEARCH_MAX_TOTAL_SIZE
+    if len(files) > max_files:
+        raise HTTPException(status_code=413, detail=f"Больше {max_files} файлов в запросе")
+    
+    try:
+        if len(files) == 1 and is_archive(files[0].filename):
+            archive = await run_in_threadpool(
+                read_upload, files[0].file, files[0].filename, max_total_size, files[0].size
             )
-            result = db.execute(stmt)
-            firmware = result.scalar_one_or_none()
-            
-            if firmware:
-                matched_id = search_id
-                break
+            return await run_in_threadpool(unpack_archive, archive, max_files, max_total_size)
         
-        if firmware:
-            return {
-                "found": True,
-                "message": "Firmware found in database",
-                "extracted_id": matched_id or software_id,
-                "firmware": {
-                    "id": firmware.id,
-                    "brand": firmware.brand,
-                    "series": firmware.series,
-                    "ecu_brand": firmware.ecu_brand,
-                    "software_id": firmware.software_id,
-                    "hardware_id": firmware.hardware_id,
-                    "file_size": firmware.file_size,
-                    "price": float(firmware.price) if firmware.price else 50.0,
-                    "winols_file": firmware.winols_file,
-                },
-                "parse_result": {
-                    "confidence": parse_result.get('confidence'),
-                    "ecu": parse_result.get('ecu'),
-                    "brand": parse_result.get('brand'),
-                },
-                "search_ids": search_ids,
-            }
+        uploads = []
+        remaining = max_total_size
+        for file in files:
+            if remaining <= 0:
+                raise BatchLimitExceeded(f"Файлы пакета больше {max_total_size} байт")
+            upload = await run_in_threadpool(
+                read_upload, file.file, file.filename,
+                min(settings.MAX_UPLOAD_SIZE, remaining), file.size,
+            )
+            remaining -= upload.size
+            uploads.append(upload)
+        return uploads
+    except (UploadTooLarge, BatchLimitExceeded) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Архив повреждён или не ZIP")
+
+
+def ndjson(event: str, data: Dict) -> bytes:
+    return (json.dumps({"event": event, **data}, ensure_ascii=False, default=str) + "\n").encode()
+
+
+async def stream_batch(uploads: List[UploadedFile]) -> AsyncIterator[bytes]:
+    """
+    События пакетного поиска (NDJSON):
+    - result (cached) - файл с результатом в кеше, сразу
+    - parsed - файл разобран (по мере готовности, в любом порядке)
+    - result - найденная прошивка / не найдено, после общего запроса к БД
+    - done - итог пакета
+    """
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(settings.BATCH_SEARCH_CONCURRENCY)
+    parsed: Dict[int, Dict] = {}
+    found = cached = 0
+    
+    async def prepare(index: int, upload: UploadedFile) -> Dict:
+        """Оригинал в хранилище; результат из кеша или разбор на пуле процессов"""
+        async with semaphore:
+            original_ref = await store_original(upload)
+            cache_key = search_cache.content_key(upload.sha256, upload.filename)
+            result, version = await search_cache.aget(cache_key)
+            item = {"index": index, "upload": upload, "original_ref": original_ref,
+                    "cache_key": cache_key, "version": version, "result": result}
+            if result is None:
+                try:
+                    item["parse_result"] = await parse_in_pool(upload.content)
+                except Exception as e:
+                    logger.error(f"Batch parse failed for {upload.filename}: {e}")
+                    item["error"] = str(e)
+            return item
+    
+    tasks = [prepare(i, upload) for i, upload in enumerate(uploads)]
+    for task in asyncio.as_completed(tasks):
+        item = await task
+        index, upload = item["index"], item["upload"]
+        if item["result"] is not None:
+            cached += 1
+            found += bool(item["result"].get("found"))
+            yield ndjson("result", {**item["result"], "index": index, "filename": upload.filename,
+                                    "cached": True, "original_ref": item["original_ref"]})
+        elif "error" in item:
+            yield ndjson("error", {"index": index, "filename": upload.filename, "message": item["error"]})
         else:
-            return {
-                "found": False,
-                "message": "Firmware not found in database",
-                "extracted_id": software_id,
-                "search_ids": search_ids,
-                "parse_result": parse_result,
-                "suggestion": "This file needs manual processing",
-                "filename": file.filename,
-            }
+            item["candidates"] = upload_candidates(item["parse_result"], upload.filename)
+            parsed[index] = item
+            yield ndjson("parsed", {
+                "index": index,
+                "filename": upload.filename,
+                "software_id": item["parse_result"].get("software_id"),
+                "search_ids": [c["term"] for c in item["candidates"]],
+            })
     
-    finally:
-        # Удаляем временный файл
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    if parsed:
+        # Умный поиск по имени и кандидаты из файла всех файлов - один запрос к БД
+        items = [parsed[i] for i in sorted(parsed)]
+        groups, ks, fuzzies, hardware_ids = [], [], [], []
+        for item in items:
+            groups += [filename_part_candidates(item["upload"].filename), item["candidates"]]
+            ks += [2, 5]
+            fuzzies += [False, True]
+            hardware_ids += [None, item["parse_result"].get("hardware_id")]
+        logger.info(f"Batch search: {len(items)} files, {sum(len(g) for g in groups)} candidates")
+        
+        async with async_session_maker() as db:
+            matches = await lookup_candidate_groups(db, groups, k=ks, fuzzy=fuzzies, hardware_ids=hardware_ids)
+        
+        for item, smart, by_content in zip(items, matches[::2], matches[1::2]):
+            upload = item["upload"]
+            smart = accepted_match(smart)
+            if smart:
+                result = smart_search_result(smart["firmware"])
+            else:
+                search_ids = [c["term"] for c in item["candidates"]]
+                result = match_result(item["parse_result"], upload.filename, search_ids, by_content)
+            # Ненайденные без similar_firmwares - в кеш не пишем (одиночный поиск их дополнит)
+            if result["found"]:
+                found += 1
+                await search_cache.aset(item["cache_key"], result, item["version"])
+            yield ndjson("result", {**result, "index": item["index"], "filename": upload.filename,
+                                    "cached": False, "original_ref": item["original_ref"]})
+    
+    yield ndjson("done", {
+        "files": len(uploads),
+        "found": found,
+        "cached": cached,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    })
+
+
+@router.post("/search/batch")
+async def search_firmware_batch(files: List[UploadFile] = File(...)) -> StreamingResponse:
+    """
+    Пакетный поиск: несколько BIN файлов или один ZIP архив
+    POST /api/firmware/search/batch (multipart, поле files)
+    
+    Файлы разбираются параллельно на пуле процессов (не больше
+    BATCH_SEARCH_CONCURRENCY одновременно на запрос), все ID ищутся
+    одним запросом к БД. Ответ - NDJSON поток (application/x-ndjson),
+    события по мере готовности файлов, см. stream_batch.
+    """
+    uploads = await read_batch(files)
+    logger.info(f"Batch search: {len(uploads)} files")
+    return StreamingResponse(stream_batch(uploads), media_type="application/x-ndjson")
 
 
 @router.get("/search")
-def search_firmware_by_id(
+async def search_firmware_by_id(
     software_id: str,
-    db: Session = Depends(get_db_sync)
+    hardware_id: Optional[str] = None,
+    fuzzy: bool = True,
+    include_variants: bool = False,
+    timings: bool = False,
+    x_search_timings: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
 ) -> Dict:
     """
     Поиск прошивки по software_id (например, после OCR распознавания)
     GET /api/firmware/search?software_id=39101-2F310
+    
+    Если точного совпадения нет - нечёткий поиск с учётом ошибок OCR:
+    единственный ближайший ID с заменами O/0, I/1... принимается сразу,
+    иначе ближайшие ID возвращаются в suggestions.
+    
+    Результат кешируется в Redis по нормализованному ID.
+    ?hardware_id= - только прошивки с этим HW номером (или его началом):
+    один и тот же software_id на разных блоках различается по HW.
+    ?include_variants=true - Stage варианты в том же ответе.
+    ?timings=true (или X-Search-Timings: 1) - время этапов и число
+    запросов к БД в блоке timings.
     """
     logger.info(f"GET search request for software_id: {software_id}")
     
-    # Ищем напрямую с ILIKE
-    stmt = select(Firmware).where(
-        Firmware.software_id.ilike(f"%{software_id}%")
+    with track_request("search_id") as request_timings:
+        cache_key = search_cache.id_key(
+            software_id, fuzzy=fuzzy, include_variants=include_variants, hardware_id=normalize_id(hardware_id)
+        )
+        with timed("cache_get"):
+            result, version = await search_cache.aget(cache_key)
+        if result is None:
+            result = await resolve_software_id(software_id, fuzzy, db, include_variants, hardware_id)
+            with timed("cache_set"):
+                await search_cache.aset(cache_key, result, version)
+        
+        response = {**result, "extracted_id": software_id}
+    
+    if timings_requested(timings, x_search_timings):
+        response["timings"] = request_timings.as_dict()
+    return response
+
+
+def fuzzy_accepted(suggestions: List[Dict]) -> bool:
+    """Ближайший ID принимается, если он однозначный и отличается только OCR-двойниками"""
+    return bool(suggestions) and suggestions[0]["distance"] <= FUZZY_ACCEPT_DISTANCE and (
+        len(suggestions) == 1 or suggestions[1]["distance"] > suggestions[0]["distance"]
     )
-    result = db.execute(stmt)
-    firmware = result.scalar_one_or_none()
+
+
+async def resolve_software_id(
+    software_id: str,
+    fuzzy: bool,
+    db: AsyncSession,
+    include_variants: bool = False,
+    hardware_id: Optional[str] = None,
+) -> Dict:
+    """
+    Найти прошивку по введённому/распознанному ID.
     
-    # Если не найдено, пробуем без дефисов
-    if not firmware:
-        clean_id = software_id.replace('-', '').replace(' ', '').replace('_', '')
-        stmt = select(Firmware).where(
-            Firmware.software_id.ilike(f"%{clean_id}%")
+    Ранжированный поиск (точный > нормализованный > токен > префикс >
+    подстрока > похожий) с LIMIT. Префикс/подстрока принимается, только
+    если она однозначна и достаточно длинная (accepted_match); похожий ID -
+    только если он однозначно ближайший по нечёткому индексу. Иначе
+    found=False и ранжированные candidates. С hardware_id - только
+    прошивки с этим HW (пара SW+HW - составной индекс), без нечёткого
+    поиска по всему каталогу.
+    """
+    with timed("lookup"):
+        ranked = await ranked_search(
+            db, software_id, k=SEARCH_ID_K, fuzzy=fuzzy, include_variants=include_variants,
+            hardware_id=hardware_id,
         )
-        result = db.execute(stmt)
-        firmware = result.scalar_one_or_none()
+    matches = ranked["results"]
+    firmware = ranked["accepted"]["firmware"] if ranked["accepted"] else None
+    match = "direct"
+    
+    with timed("fuzzy"):
+        suggestions = fuzzy_index.search(software_id) if fuzzy and not firmware and not hardware_id else []
+    if fuzzy_accepted(suggestions):
+        best_id = suggestions[0]["firmware_id"]
+        firmware = next((m["firmware"] for m in matches if m["firmware"].id == best_id), None)
+        if firmware is None:
+            with timed("fuzzy_fetch"):
+                firmware = await get_firmware(db, best_id, include_variants)
+        match = "fuzzy"
+        logger.info(f"Fuzzy match for {software_id}: {suggestions[0]}")
     
     if firmware:
-        return {
+        result = {
             "found": True,
             "message": "Firmware found in database",
             "extracted_id": software_id,
-            "firmware": {
-                "id": firmware.id,
-                "brand": firmware.brand,
-                "series": firmware.series,
-                "ecu_brand": firmware.ecu_brand,
-                "software_id": firmware.software_id,
-                "hardware_id": firmware.hardware_id,
-                "file_size": firmware.file_size,
-                "price": float(firmware.price) if firmware.price else 50.0,
-                "winols_file": firmware.winols_file,
-            },
+            "match": match,
+            "firmware": firmware_summary(firmware),
+            "candidates": [candidate_summary(m) for m in matches],
+            "total_estimate": ranked["total_estimate"],
         }
+        return with_variants(result, firmware) if include_variants else result
     else:
         return {
             "found": False,
             "message": "Firmware not found in database",
             "extracted_id": software_id,
+            "suggestions": suggestions,
+            "candidates": [candidate_summary(m) for m in matches],
+            "total_estimate": ranked["total_estimate"],
         }
 
 
+@router.post("/search/ids")
+async def search_firmware_by_ids(
+    ids: List[str] = Body(..., embed=True, min_length=1, max_length=MAX_SEARCH_IDS),
+    fuzzy: bool = Body(True, embed=True),
+    include_variants: bool = Body(False, embed=True),
+    timings: bool = False,
+    x_search_timings: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+) -> Dict:
+    """
+    Поиск по нескольким кандидатам ID (например, все ID с OCR скриншота)
+    POST /api/firmware/search/ids {"ids": ["0261S04567", "O261SO4567"]}
+    
+    Все кандидаты проверяются одним запросом к БД (отсутствующие в
+    каталоге отсекает Bloom-фильтр). Побеждает первый по порядку ID,
+    совпадение которого принимается автоматически (accepted_match); если
+    таких нет - однозначный похожий ID (как в GET /search). В results - совпадение по каждому кандидату.
+    """
+    logger.info(f"Batch ID search: {ids}")
+    
+    with track_request("search_ids") as request_timings:
+        with timed("lookup"):
+            groups = await lookup_candidate_groups(
+                db,
+                [[make_candidate(value, CandidateSource.QUERY)] for value in ids],
+                k=2,
+                fuzzy=False,
+                include_variants=include_variants,
+            )
+        
+        results = []
+        winner = None
+        for value, matches in zip(ids, groups):
+            best = accepted_match(matches)
+            results.append({
+                "id": value,
+                "normalized": normalize_id(value),
+                "found": best is not None,
+                "match": best["match"] if best else None,
+                "firmware_id": best["firmware"].id if best else None,
+            })
+            if best and winner is None:
+                winner = (value, best["firmware"], "direct")
+        
+        suggestions = []
+        if winner is None and fuzzy:
+            with timed("fuzzy"):
+                for value in ids:
+                    found = fuzzy_index.search(value)
+                    suggestions = suggestions or found
+                    if fuzzy_accepted(found):
+                        logger.info(f"Fuzzy match for {value}: {found[0]}")
+                        winner = (value, found[0]["firmware_id"], "fuzzy")
+                        break
+            if winner:
+                value, firmware_id, match = winner
+                with timed("fuzzy_fetch"):
+                    firmware = await get_firmware(db, firmware_id, include_variants)
+                winner = (value, firmware, match) if firmware else None
+        
+        if winner:
+            value, firmware, match = winner
+            response = {
+                "found": True,
+                "message": "Firmware found in database",
+                "extracted_id": value,
+                "match": match,
+                "firmware": firmware_summary(firmware),
+                "results": results,
+            }
+            if include_variants:
+                with_variants(response, firmware)
+        else:
+            response = {
+                "found": False,
+                "message": "Firmware not found in database",
+                "extracted_id": ids[0],
+                "suggestions": suggestions,
+                "results": results,
+            }
+    
+    if timings_requested(timings, x_search_timings):
+        response["timings"] = request_timings.as_dict()
+    return response
+
+
+@router.post("/ids/contains")
+async def ids_contain(
+    ids: List[str] = Body(..., embed=True, max_length=MAX_CONTAINS_IDS),
+) -> Dict:
+    """
+    Пакетная проверка ID по Bloom-фильтру каталога (без запросов к БД)
+    POST /api/firmware/ids/contains {"ids": ["89663-47351", "GARBAGE1"]}
+    
+    maybe_present=false - ID точно нет в каталоге; true - может быть
+    (ложноположительные ответы возможны).
+    """
+    return {
+        "filter_ready": id_filter.ready,
+        "results": [
+            {"id": value, "normalized": normalize_id(value), "maybe_present": present}
+            for value, present in zip(ids, id_filter.contains_many(ids))
+        ],
+    }
+
+
+@router.get("/suggest")
+async def suggest_software_ids(
+    q: str = Query(..., min_length=1, max_length=64),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=MAX_SUGGEST_LIMIT),
+) -> Dict:
+    """
+    Автодополнение software_id и серий (каталог, админка)
+    GET /api/firmware/suggest?q=8966
+    
+    Только in-memory индекс, без запросов к БД; пока индекс не загружен -
+    пустой список и ready=false.
+    """
+    return {
+        "query": q,
+        "ready": suggest_index.ready,
+        "suggestions": suggest_index.suggest(q, limit),
+    }
+
+
 @router.get("/stats")
-def get_firmware_stats(db: Session = Depends(get_db_sync)) -> Dict:
+async def get_firmware_stats(db: AsyncSession = Depends(get_db)) -> Dict:
     """Статистика по прошивкам в базе"""
     from sqlalchemy import func, distinct
     
     # Общее количество
     total_stmt = select(func.count(Firmware.id))
-    total_result = db.execute(total_stmt)
+    total_result = await db.execute(total_stmt)
     total = total_result.scalar()
     
     # Количество марок
     brands_stmt = select(func.count(distinct(Firmware.brand)))
-    brands_result = db.execute(brands_stmt)
+    brands_result = await db.execute(brands_stmt)
     brands_count = brands_result.scalar()
     
     # Количество типов ЭБУ
     ecu_stmt = select(func.count(distinct(Firmware.ecu_brand)))
-    ecu_result = db.execute(ecu_stmt)
+    ecu_result = await db.execute(ecu_stmt)
     ecu_count = ecu_result.scalar()
     
     return {
@@ -375,14 +757,12 @@ def get_firmware_stats(db: Session = Depends(get_db_sync)) -> Dict:
 
 
 @router.get("/{firmware_id}")
-def get_firmware_by_id(
+async def get_firmware_by_id(
     firmware_id: int,
-    db: Session = Depends(get_db_sync)
+    db: AsyncSession = Depends(get_db)
 ) -> Dict:
-    """Получить информацию о прошивке по ID"""
-    stmt = select(Firmware).where(Firmware.id == firmware_id)
-    result = db.execute(stmt)
-    firmware = result.scalar_one_or_none()
+    """Получить информацию о прошивке по ID (снимок каталога, иначе БД)"""
+    firmware = await get_firmware(db, firmware_id)
     
     if not firmware:
         raise HTTPException(status_code=404, detail="Firmware not found")
@@ -403,89 +783,67 @@ def get_firmware_by_id(
 
 
 @router.get("/{firmware_id}/variants")
-def get_firmware_variants(
+async def get_firmware_variants(
     firmware_id: int,
-    db: Session = Depends(get_db_sync)
+    db: AsyncSession = Depends(get_db)
 ) -> Dict:
     """
     Получить все Stage варианты для прошивки.
     Если вариантов нет - возвращаем стандартные шаблоны Stage 1/2/3.
-    """
-    from app.models.firmware_variant import FirmwareVariant, STAGE_TEMPLATES
     
-    # Проверяем что прошивка существует
-    stmt = select(Firmware).where(Firmware.id == firmware_id)
-    result = db.execute(stmt)
-    firmware = result.scalar_one_or_none()
+    Из снимка каталога; нет в снимке - прошивка и варианты одним
+    запросом к БД (JOIN).
+    """
+    firmware = await get_firmware(db, firmware_id, include_variants=True)
     
     if not firmware:
         raise HTTPException(status_code=404, detail="Firmware not found")
     
-    # Получаем варианты из БД
-    stmt = select(FirmwareVariant).where(FirmwareVariant.firmware_id == firmware_id)
-    result = db.execute(stmt)
-    variants = result.scalars().all()
+    return variants_payload(firmware)
+
+
+@router.post("/variants/{variant_id}/verify")
+async def verify_variant_compatibility(
+    variant_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db)
+) -> Dict:
+    """
+    Проверить, что файл клиента - тот самый сток, из которого собран вариант.
+    
+    Сравниваются хеши регионов (код, калибровки) без пропатченных диапазонов.
+    Возвращает совпадение по каждому региону.
+    """
+    from app.models.firmware_variant import FirmwareVariant
+    
+    stmt = select(FirmwareVariant).where(FirmwareVariant.id == variant_id)
+    variant = (await db.execute(stmt)).scalar_one_or_none()
     
-    if variants:
-        # Есть реальные варианты в базе
+    if not variant:
+        raise HTTPException(status_code=404, detail="Variant not found")
+    
+    if not variant.stock_profile:
         return {
-            "firmware_id": firmware_id,
-            "variants": [
-                {
-                    "id": v.id,
-                    "stage": v.stage,
-                    "stage_name": v.stage_name,
-                    "description": v.description,
-                    "power_increase": v.power_increase,
-                    "torque_increase": v.torque_increase,
-                    "modifications": v.modifications,
-                    "price": float(v.price) if v.price else 50.0,
-                    "has_file": v.s3_key is not None,
-                }
-                for v in variants
-            ]
+            "variant_id": variant_id,
+            "verified": False,
+            "message": "Variant has no stock profile, manual check required",
         }
-    else:
-        # Нет вариантов - возвращаем шаблоны
-        # Цены рассчитываем от базовой цены прошивки
-        base_price = float(firmware.price) if firmware.price else 50.0
-        
+    
+    try:
+        upload = await run_in_threadpool(read_upload, file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        result = await run_in_threadpool(variant_verifier.verify, variant.stock_profile, upload.content)
+    except variant_verifier.UnsupportedProfile:
         return {
-            "firmware_id": firmware_id,
-            "variants": [
-                {
-                    "id": None,  # Шаблон, не реальный вариант
-                    "stage": "stage1",
-                    "stage_name": STAGE_TEMPLATES["stage1"]["stage_name"],
-                    "description": STAGE_TEMPLATES["stage1"]["description"],
-                    "power_increase": STAGE_TEMPLATES["stage1"]["power_increase"],
-                    "torque_increase": STAGE_TEMPLATES["stage1"]["torque_increase"],
-                    "modifications": None,
-                    "price": base_price,
-                    "has_file": False,  # Файл будет подготовлен после заказа
-                },
-                {
-                    "id": None,
-                    "stage": "stage2",
-                    "stage_name": STAGE_TEMPLATES["stage2"]["stage_name"],
-                    "description": STAGE_TEMPLATES["stage2"]["description"],
-                    "power_increase": STAGE_TEMPLATES["stage2"]["power_increase"],
-                    "torque_increase": STAGE_TEMPLATES["stage2"]["torque_increase"],
-                    "modifications": None,
-                    "price": base_price * 1.3,  # Stage 2 на 30% дороже
-                    "has_file": False,
-                },
-                {
-                    "id": None,
-                    "stage": "stage3",
-                    "stage_name": STAGE_TEMPLATES["stage3"]["stage_name"],
-                    "description": STAGE_TEMPLATES["stage3"]["description"],
-                    "power_increase": STAGE_TEMPLATES["stage3"]["power_increase"],
-                    "torque_increase": STAGE_TEMPLATES["stage3"]["torque_increase"],
-                    "modifications": None,
-                    "price": base_price * 1.6,  # Stage 3 на 60% дороже
-                    "has_file": False,
-                },
-            ],
-            "note": "Стандартные варианты. Файл будет подготовлен после оплаты."
+            "variant_id": variant_id,
+            "verified": False,
+            "message": "Variant stock profile is outdated, manual check required",
         }
+    
+    return {
+        "variant_id": variant_id,
+        "verified": result["compatible"],
+        **result,
+    }
@@ -4,10 +4,11 @@ Firmware management endpoints
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select
 
 from app.core.database import get_db
 from app.models.firmware import Firmware
+from app.services.firmware_lookup import DEFAULT_K, MAX_K, ranked_search
 
 router = APIRouter()
 
@@ -38,36 +39,39 @@ async def list_firmwares(
 @router.get("/search")
 async def search_firmware(
     software_id: str = Query(..., description="Software ID to search"),
-    hardware_id: str = Query(None, description="Hardware ID (optional)"),
+    hardware_id: str = Query(None, description="Hardware ID or its beginning (optional)"),
+    limit: int = Query(DEFAULT_K, ge=1, le=MAX_K, description="Max results"),
+    fuzzy: bool = Query(False, description="Include similar IDs after substring matches"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Search firmware by software/hardware ID
     This is the main endpoint for auto-matching
+    
+    Ranked: exact > normalized > compound ID token > prefix > substring
+    (> similar with fuzzy=true), at most `limit` results;
+    total_estimate - how many firmwares match in total
     """
-    query = select(Firmware).where(
-        Firmware.software_id.ilike(f"%{software_id}%")
+    # Варианты - тем же запросом (JOIN), как раньше отдавались в results
+    ranked = await ranked_search(
+        db, software_id, k=limit, fuzzy=fuzzy, hardware_id=hardware_id, include_variants=True
     )
+    matches = ranked["results"]
     
-    if hardware_id:
-        query = query.where(
-            Firmware.hardware_id.ilike(f"%{hardware_id}%")
-        )
-    
-    result = await db.execute(query)
-    firmwares = result.scalars().all()
-    
-    if not firmwares:
+    if not matches:
         return {
             "found": False,
             "message": "Прошивка не найдена в базе. Заявка будет передана оператору.",
-            "results": []
+            "results": [],
+            "total_estimate": 0,
         }
     
     return {
         "found": True,
-        "count": len(firmwares),
-        "results": firmwares
+        "count": len(matches),
+        "total_estimate": ranked["total_estimate"],
+        "results": [m["firmware"] for m in matches],
+        "matches": [m["match"] for m in matches],
     }
 
 
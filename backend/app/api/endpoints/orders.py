@@ -69,7 +69,8 @@ async def create_order(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get firmware
+    # Get firmware (from the DB, not the catalog snapshot: price and
+    # S3 key must be current in the order transaction)
     result = await db.execute(
         select(Firmware).where(Firmware.id == request.firmware_id)
     )
@@ -3,14 +3,16 @@ File upload and processing endpoints
 """
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-import aiofiles
-import os
-from datetime import datetime
 
 from app.core.database import get_db
 from app.core.config import settings
 from app.services.firmware_parser import FirmwareParser
+from app.services.chunk_store import chunk_store
+from app.services.firmware_ids import normalize_id
+from app.services.firmware_lookup import ranked_search
+from app.services.uploads import UploadTooLarge, read_upload
 from app.models.order import Order
 from app.models.firmware import Firmware
 
@@ -25,7 +27,7 @@ async def upload_firmware(
 ):
     """
     Upload firmware file for processing
-    1. Save file
+    1. Read (streamed, size-limited) and save file
     2. Parse to extract IDs
     3. Search in database
     4. Create order
@@ -38,38 +40,33 @@ async def upload_firmware(
             detail="Только .bin файлы принимаются"
         )
     
-    # Save file temporarily
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = f"{timestamp}_{file.filename}"
-    upload_path = f"/tmp/motorsoft/uploads/{safe_filename}"
+    # Read spooled upload in chunks (hash + size limit while reading)
+    try:
+        upload = await run_in_threadpool(read_upload, file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-    
-    async with aiofiles.open(upload_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    # Save original to dedup store (only new chunks are written)
+    stored = await chunk_store.put_file(upload.content, upload.filename, upload.sha256)
     
     # Parse firmware
     parser = FirmwareParser()
-    parse_result = parser.parse_file(upload_path)
+    parse_result = await run_in_threadpool(parser.parse_data, upload.content)
     
     # Search in database
-    from sqlalchemy import select
-    
     firmware_match = None
-    if parse_result.get("software_id"):
-        result = await db.execute(
-            select(Firmware).where(
-                Firmware.software_id.ilike(f"%{parse_result['software_id']}%")
-            )
-        )
-        firmware_match = result.scalar_one_or_none()
+    software_id = parse_result.get("software_id")
+    if normalize_id(software_id):
+        # Лучшее совпадение: точное > нормализованное > токен > однозначный префикс/подстрока
+        ranked = await ranked_search(db, software_id, k=2, fuzzy=False)
+        if ranked["accepted"]:
+            firmware_match = ranked["accepted"]["firmware"]
     
     # Create order (use only existing DB columns!)
     order = Order(
         user_id=user_id or 0,
         firmware_id=firmware_match.id if firmware_match else None,
-        original_file_path=upload_path,
+        original_file_path=stored["ref"],
         status="pending" if firmware_match else "manual",
         price=firmware_match.price if firmware_match else 0,
     )
@@ -29,6 +29,11 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Кеш результатов поиска прошивок в Redis (TTL в секундах)
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL: int = 6 * 3600        # найдено
+    SEARCH_CACHE_NEGATIVE_TTL: int = 600    # не найдено (каталог пополняется)
+    
     # Telegram Bot
     TELEGRAM_BOT_TOKEN: str = ""
     
@@ -47,6 +52,13 @@ class Settings(BaseSettings):
     YANDEX_S3_ACCESS_KEY_ID: str = ""
     YANDEX_S3_SECRET_ACCESS_KEY: str = ""
     
+    # Сжатие прошивок в Object Storage (zstd)
+    S3_COMPRESSION: bool = False
+    S3_COMPRESSION_LEVEL: int = 10
+    
+    # Публичный адрес API (ссылки на скачивание сжатых файлов через бэкенд)
+    PUBLIC_API_URL: str = "http://localhost:8000/api/v1"
+    
     # Yandex Vision OCR
     YANDEX_FOLDER_ID: str = "ajed5u8if1re5dntstk5"
     YANDEX_API_KEY: str = ""
@@ -56,6 +68,29 @@ class Settings(BaseSettings):
     
     # File paths
     WINOLS_STORAGE_PATH: str = "/path/to/winols/files"
+    INDEX_STORAGE_PATH: str = "/app/uploads/indexes"  # Персистентные индексы поиска
+    
+    # Максимальный размер загружаемого BIN файла (байт)
+    MAX_UPLOAD_SIZE: int = 32 * 1024 * 1024
+    
+    # Пакетный поиск (/api/firmware/search/batch): файлов и байт на запрос,
+    # файлов одного запроса в разборе одновременно, процессов в пуле разбора
+    BATCH_SEARCH_MAX_FILES: int = 100
+    BATCH_SEARCH_MAX_TOTAL_SIZE: int = 256 * 1024 * 1024
+    BATCH_SEARCH_CONCURRENCY: int = 4
+    BATCH_SEARCH_WORKERS: int = 4
+    
+    # Дедуплицирующее хранилище оригиналов клиентов ("local" или "s3")
+    DEDUP_STORE_BACKEND: str = "local"
+    DEDUP_STORE_PATH: str = "/app/uploads/dedup"
+    DEDUP_S3_PREFIX: str = "dedup/"
+    
+    # Период инкрементального обновления in-memory индексов поиска (сек)
+    SEARCH_INDEX_REFRESH_SECONDS: int = 300
+    
+    # Локальный кеш блоков для просмотра прошивок из S3
+    PREVIEW_CACHE_PATH: str = "/app/uploads/preview_cache"
+    PREVIEW_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2 GB, сверх - удаляются давно не читанные
     
     # Pricing
     DEFAULT_PRICE: float = 50.0
@@ -1,6 +1,7 @@
 """
-Synchronous database connection (temporary)
-Using psycopg2 instead of asyncpg due to connection issues
+Synchronous database connection (psycopg2)
+Used by standalone scripts (imports, index builds, benchmarks);
+API routers use the async engine from app.core.database
 """
 
 from sqlalchemy import create_engine
@@ -0,0 +1,144 @@
+"""
+Метрики запросов: время по этапам, число запросов к БД, гистограммы.
+
+Обработчик открывает track_request(endpoint); внутри него любой код
+(в том числе сервисы и пул потоков - контекст копируется) отмечает
+этапы через `with timed("parse"):`. Запросы к БД считаются событием
+SQLAlchemy. По завершении запроса этапы попадают в гистограммы,
+которые отдаются в текстовом формате Prometheus на /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Границы корзин: секунды этапов и число запросов к БД
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+
+class Histogram:
+    """Гистограмма с метками (кумулятивные корзины, как в Prometheus)."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # метки -> (счётчики корзин, сумма, количество)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+                prefix = f"{labels}," if labels else ""
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return "\n".join(lines)
+
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "search_stage_seconds", "Time spent in each firmware search stage", ("endpoint", "stage"), TIME_BUCKETS
+)
+SEARCH_REQUEST_SECONDS = Histogram(
+    "search_request_seconds", "Total firmware search handler time", ("endpoint",), TIME_BUCKETS
+)
+SEARCH_DB_QUERIES = Histogram(
+    "search_db_queries", "Database queries per firmware search request", ("endpoint",), COUNT_BUCKETS
+)
+
+REGISTRY = (SEARCH_REQUEST_SECONDS, SEARCH_STAGE_SECONDS, SEARCH_DB_QUERIES)
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# =========================================================================
+# ЗАМЕРЫ ЗАПРОСА
+# =========================================================================
+
+class RequestTimings:
+    """Этапы одного запроса (мс) и число запросов к БД."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.db_queries = 0
+        self.total_ms: Optional[float] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Повторяющийся этап (например, несколько запросов) суммируется
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_ms": round(self.total_ms if self.total_ms is not None else
+                              (time.perf_counter() - self.started) * 1000, 2),
+            "stages": {name: round(ms, 2) for name, ms in self.stages.items()},
+            "db_queries": self.db_queries,
+        }
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[RequestTimings]:
+    """Замер обработчика целиком; при выходе - запись в гистограммы."""
+    timings = RequestTimings(endpoint)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - timings.started
+        timings.total_ms = elapsed * 1000
+        SEARCH_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        SEARCH_DB_QUERIES.observe(timings.db_queries, endpoint=endpoint)
+        for stage, ms in timings.stages.items():
+            SEARCH_STAGE_SECONDS.observe(ms / 1000, endpoint=endpoint, stage=stage)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Замер этапа текущего запроса (вне track_request - ничего не делает)."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.db_queries += 1
@@ -56,6 +56,25 @@ def decode_access_token(token: str) -> dict:
         )
 
 
+def create_download_token(key: str, expires_in: int) -> str:
+    """Создать подписанный токен на скачивание файла через бэкенд."""
+    return create_access_token(
+        data={"key": key, "scope": "download"},
+        expires_delta=timedelta(seconds=expires_in)
+    )
+
+
+def decode_download_token(token: str) -> str:
+    """Проверить токен скачивания и вернуть ключ файла."""
+    payload = decode_access_token(token)
+    if payload.get("scope") != "download" or not payload.get("key"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid download token"
+        )
+    return payload["key"]
+
+
 async def get_current_admin(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
@@ -3,12 +3,91 @@ MotorSoft API Backend
 Main FastAPI application entry point
 """
 
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from loguru import logger
 
 from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.metrics import render_metrics
 from app.api import router as api_router
+from app.services.batch_search import shutdown_pool
+from app.services.catalog_delta import CatalogRow, catalog_delta
+from app.services.catalog_snapshot import catalog_snapshot
+from app.services.fuzzy_index import fuzzy_index
+from app.services.id_filter import id_filter
+from app.services.search_cache import search_cache
+from app.services.suggest_index import suggest_index
+from app.services.trigram_index import trigram_index
+
+
+SEARCH_INDEXES = (trigram_index, fuzzy_index, id_filter, suggest_index)
+
+
+async def refresh_search_indexes(full: bool = False):
+    """Обновить in-memory индексы поиска из БД"""
+    async with async_session_maker() as session:
+        delta = await catalog_delta.load(session, full=full or id_filter.overfilled)
+        if delta and not delta.full and catalog_snapshot.ready:
+            # Изменения NOTIFY учтены в catalog_delta - здесь только пропущенные
+            await catalog_snapshot.apply(session, {row.id for row in delta.rows} | delta.removed)
+    
+    for index in SEARCH_INDEXES:
+        index.apply(delta)
+    
+    # Индексы подхватили изменения каталога - кеш результатов устарел
+    if delta and not delta.full:
+        await search_cache.abump_version()
+
+
+async def on_catalog_change(firmware_ids):
+    """Снимок каталога обновлён по NOTIFY - обновить индексы и кеш поиска"""
+    if firmware_ids is None:
+        await refresh_search_indexes(full=True)
+    else:
+        rows, removed = [], set()
+        for firmware_id in firmware_ids:
+            firmware = catalog_snapshot.get(firmware_id)
+            if firmware is None:
+                removed.add(firmware_id)
+            else:
+                rows.append(CatalogRow(
+                    firmware.id, firmware.software_id, firmware.versions_info, firmware.brand, firmware.series
+                ))
+        # Через catalog_delta: периодическое обновление не применит их повторно
+        delta = await catalog_delta.merge(rows, removed)
+        for index in SEARCH_INDEXES:
+            index.apply(delta)
+    # Снимок сообщает только реально изменившиеся прошивки (в том числе
+    # варианты - ответы с include_variants): кеш устарел
+    await search_cache.abump_version()
+
+
+async def search_index_refresher():
+    """
+    Периодическое инкрементальное обновление индексов и проверка снимка
+    каталога (на случай пропущенных NOTIFY)
+    """
+    while True:
+        await asyncio.sleep(settings.SEARCH_INDEX_REFRESH_SECONDS)
+        try:
+            await refresh_search_indexes()
+        except Exception as e:
+            logger.error(f"Search index refresh failed: {e}")
+        try:
+            async with async_session_maker() as session:
+                stale = await catalog_snapshot.is_stale(session)
+                if stale:
+                    logger.warning("Catalog snapshot is stale (missed NOTIFY), reloading")
+                    await catalog_snapshot.load(session)
+            if stale:
+                await search_cache.abump_version()
+        except Exception as e:
+            logger.error(f"Catalog snapshot check failed: {e}")
 
 
 @asynccontextmanager
@@ -16,8 +95,26 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     # Startup
     print("🚀 MotorSoft API Starting...")
+    try:
+        await refresh_search_indexes(full=True)
+    except Exception as e:
+        # Поиск продолжит работать через БД (ILIKE)
+        logger.error(f"Search index initial load failed: {e}")
+    try:
+        async with async_session_maker() as session:
+            await catalog_snapshot.load(session)
+    except Exception as e:
+        # Чтение прошивок пойдёт в БД; слушатель загрузит снимок при подключении
+        logger.error(f"Catalog snapshot initial load failed: {e}")
+    catalog_snapshot.start_listener(async_session_maker, on_catalog_change)
+    refresher = asyncio.create_task(search_index_refresher())
     yield
     # Shutdown
+    await catalog_snapshot.stop_listener()
+    refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await refresher
+    shutdown_pool()
     print("👋 MotorSoft API Shutting down...")
 
 
@@ -59,3 +156,9 @@ async def health_check():
         "database": "connected",  # TODO: actual check
         "redis": "connected",      # TODO: actual check
     }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики поиска в текстовом формате Prometheus"""
+    return render_metrics()
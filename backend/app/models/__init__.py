@@ -9,5 +9,7 @@ from app.models.order import Order
 from app.models.transaction import Transaction
 from app.models.user_activity import UserActivity
 from app.models.tuning_option import TuningOption
+from app.models.firmware_id_token import FirmwareIdToken
+from app.models.dedup import DedupFile, DedupChunk
 
-__all__ = ["User", "Firmware", "FirmwareVariant", "Order", "Transaction", "UserActivity", "TuningOption"]
+__all__ = ["User", "Firmware", "FirmwareVariant", "Order", "Transaction", "UserActivity", "TuningOption", "FirmwareIdToken", "DedupFile", "DedupChunk"]
@@ -0,0 +1,38 @@
+"""
+Dedup store models - учёт файлов и блоков дедуплицирующего хранилища
+
+Сами блоки и манифесты лежат на диске или в S3 (app/services/chunk_store.py),
+в БД - какие файлы сохранены и сколько файлов ссылается на каждый блок.
+Счётчики меняются атомарно в транзакции, поэтому несколько воркеров
+могут писать в хранилище одновременно.
+"""
+
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class DedupFile(Base):
+    """Сохранённый файл (манифест в хранилище)"""
+    __tablename__ = "dedup_files"
+    
+    file_id = Column(String(64), primary_key=True)  # SHA-256 файла
+    filename = Column(String(500), nullable=True)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<DedupFile {self.file_id} ({self.size} bytes)>"
+
+
+class DedupChunk(Base):
+    """Блок и число файлов, которые на него ссылаются"""
+    __tablename__ = "dedup_chunks"
+    
+    digest = Column(String(64), primary_key=True)  # SHA-256 блока
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)  # 0 - удаляется сборкой мусора
+    
+    def __repr__(self):
+        return f"<DedupChunk {self.digest} refs={self.refcount}>"
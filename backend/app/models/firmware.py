@@ -3,7 +3,7 @@ Firmware model - база прошивок
 Синхронизировано с реальной схемой БД (08.01.2026)
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Numeric
+from sqlalchemy import Column, Computed, Integer, String, Float, DateTime, Text, Numeric
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -30,6 +30,22 @@ class Firmware(Base):
     # Identification - КЛЮЧЕВЫЕ ПОЛЯ ДЛЯ ПОИСКА
     software_id = Column(String(255), nullable=True, index=True)  # Номер прошивки: 89663-47351
     hardware_id = Column(String(255), nullable=True)  # HW номер
+    # Нормализованный hardware_id (генерируется БД, см. migrations/009)
+    hardware_id_norm = Column(
+        String(255),
+        Computed(
+            "translate(upper(regexp_replace(hardware_id, '[^A-Za-z0-9]', '', 'g')), 'OQILSBZ', '0011582')",
+            persisted=True,
+        ),
+    )
+    # Нормализованный software_id (генерируется БД, см. migrations/006)
+    software_id_norm = Column(
+        String(255),
+        Computed(
+            "translate(upper(regexp_replace(software_id, '[^A-Za-z0-9]', '', 'g')), 'OQILSBZ', '0011582')",
+            persisted=True,
+        ),
+    )
     
     # File info (TEXT в БД из-за данных импорта)
     file_path = Column(Text, nullable=True)
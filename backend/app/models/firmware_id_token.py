@@ -0,0 +1,33 @@
+"""
+FirmwareIdToken model - токены составных ID прошивок
+
+Поля вроде '37805-5J6-R870(R810)' или versions_info
+'KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600' содержат несколько ID.
+При импорте они режутся на нормализованные токены, и поиск
+находит прошивку точным совпадением по индексу вместо '%...%'.
+"""
+
+from sqlalchemy import Column, Integer, String, ForeignKey
+
+from app.core.database import Base
+
+
+class TokenSource:
+    """Поле, из которого получен токен (порядок - приоритет в ранжировании)"""
+    SOFTWARE_ID = "software_id"
+    VERSIONS_INFO = "versions_info"
+
+
+class FirmwareIdToken(Base):
+    """Нормализованный токен ID прошивки"""
+    __tablename__ = "firmware_id_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    firmware_id = Column(Integer, ForeignKey("firmwares.id", ondelete="CASCADE"), nullable=False, index=True)
+    
+    token = Column(String(255), nullable=False, index=True)  # normalize_id(): 8966347351
+    source_field = Column(String(50), nullable=False)  # software_id, versions_info
+    position = Column(Integer, nullable=False, default=0)  # Порядковый номер токена в поле
+    
+    def __repr__(self):
+        return f"<FirmwareIdToken {self.token} ({self.source_field}) -> {self.firmware_id}>"
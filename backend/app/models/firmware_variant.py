@@ -9,7 +9,7 @@ Stage 3 - максимальная модификация
 Файлы Stage хранятся в Yandex Object Storage.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime, Text, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -44,6 +44,9 @@ class FirmwareVariant(Base):
     s3_key = Column(String(500), nullable=True)  # Ключ в S3: "firmwares/stage1/20260113_xxx.bin"
     file_size = Column(Integer, nullable=True)  # Размер файла в байтах
     
+    # Профиль стока для проверки совместимости (см. services/variant_verifier.py)
+    stock_profile = Column(JSON, nullable=True)  # Хеши регионов без пропатченных диапазонов
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,114 @@
+"""
+Пакетный поиск прошивок: несколько файлов или один архив за запрос.
+
+Файлы из архива читаются теми же блоками с SHA-256 и лимитами, что
+и обычные загрузки. Разбор BIN (регулярные выражения по всему файлу,
+держит GIL) выполняется на общем пуле процессов; сколько файлов одного
+запроса разбирается одновременно, ограничивает вызывающий код.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.firmware_parser import FirmwareParser
+from app.services.uploads import UploadedFile, UploadTooLarge, read_upload
+
+
+ARCHIVE_EXTENSIONS = (".zip",)
+
+# Служебные файлы архиваторов
+_SKIP_PREFIXES = ("__MACOSX/",)
+
+
+class BatchLimitExceeded(ValueError):
+    """Пакет больше лимита: слишком много файлов или исчерпан суммарный размер"""
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def unpack_archive(archive: UploadedFile, max_files: int, max_total_size: int) -> List[UploadedFile]:
+    """
+    Файлы из ZIP архива (без каталогов и служебных файлов).
+
+    Raises:
+        zipfile.BadZipFile: не ZIP
+        BatchLimitExceeded: файлов больше max_files или лимит max_total_size исчерпан
+        UploadTooLarge: файл больше MAX_UPLOAD_SIZE или остатка max_total_size
+    """
+    with zipfile.ZipFile(io.BytesIO(archive.content)) as zf:
+        entries = [
+            info for info in zf.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith(_SKIP_PREFIXES)
+            and not os.path.basename(info.filename).startswith(".")
+        ]
+        if len(entries) > max_files:
+            raise BatchLimitExceeded(f"В архиве больше {max_files} файлов")
+
+        files = []
+        remaining = max_total_size
+        for info in entries:
+            if remaining <= 0:
+                raise BatchLimitExceeded(f"Файлы архива больше {max_total_size} байт")
+            # Размер из заголовка не доверяем - лимит проверяется и при распаковке
+            if info.file_size > remaining:
+                raise UploadTooLarge(max_total_size)
+            with zf.open(info) as member:
+                upload = read_upload(
+                    member,
+                    os.path.basename(info.filename),
+                    max_size=min(settings.MAX_UPLOAD_SIZE, remaining),
+                    size=info.file_size,
+                )
+            remaining -= upload.size
+            files.append(upload)
+    return files
+
+
+# =========================================================================
+# ПУЛ РАЗБОРА
+# =========================================================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+_parser = FirmwareParser()
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    """Общий пул процессов (создаётся при первом пакетном запросе)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.BATCH_SEARCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _parse(content: bytes) -> Dict:
+    return _parser.parse_data(content)
+
+
+async def parse_in_pool(content: bytes) -> Dict:
+    """FirmwareParser.parse_data в отдельном процессе."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(parse_pool(), _parse, content)
+    except BrokenProcessPool:
+        # Упавший процесс ломает весь пул - следующий запрос создаст новый
+        shutdown_pool()
+        raise
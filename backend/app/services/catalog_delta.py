@@ -0,0 +1,116 @@
+"""
+Изменения каталога прошивок для in-memory индексов поиска.
+
+Один загрузчик на все индексы (триграммы, нечёткий поиск, фильтр ID,
+автодополнение): одно чтение каталога на обновление, индексы применяют
+результат через apply(delta).
+
+- Водяной знак - время БД (now() в транзакции чтения), а не часы
+  приложения; перечитывается с запасом WATERMARK_OVERLAP, чтобы не
+  потерять строки транзакций, начатых раньше, а закоммиченных позже.
+  Перечитанные строки сравниваются с прошлым чтением - в изменения
+  попадают только те, что действительно поменялись.
+- Удалённые прошивки находятся сравнением множеств id с прошлым чтением.
+  Там же видны новые id, которые водяной знак пропустил, - они
+  дочитываются.
+- Изменения, уже применённые по NOTIFY (снимок каталога), учитываются
+  через merge() - следующий load() их не повторяет.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.firmware import Firmware
+
+
+# Запас при чтении изменённых строк (длинные транзакции импорта)
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+class CatalogRow(NamedTuple):
+    """Поля прошивки, нужные индексам поиска"""
+    id: int
+    software_id: Optional[str]
+    versions_info: Optional[str]
+    brand: Optional[str]
+    series: Optional[str]
+
+
+class CatalogDelta(NamedTuple):
+    """full - rows содержит весь каталог; иначе изменённые строки и удалённые id"""
+    full: bool
+    rows: List[CatalogRow]
+    removed: Set[int]
+
+    def __bool__(self) -> bool:
+        return self.full or bool(self.rows) or bool(self.removed)
+
+
+CATALOG_COLUMNS = (Firmware.id, Firmware.software_id, Firmware.versions_info, Firmware.brand, Firmware.series)
+
+
+class CatalogDeltaLoader:
+    """Инкрементальное чтение каталога с водяным знаком из БД."""
+
+    def __init__(self):
+        self.watermark: Optional[datetime] = None
+        # Последнее прочитанное состояние каждой прошивки
+        self._rows: Dict[int, CatalogRow] = {}
+        # merge() не должен менять _rows между чтениями одного load()
+        self._lock = asyncio.Lock()
+
+    async def load(self, db: AsyncSession, full: bool = False) -> CatalogDelta:
+        """Весь каталог (full или первый вызов) либо изменения с прошлого вызова."""
+        async with self._lock:
+            return await self._load(db, full)
+
+    async def _load(self, db: AsyncSession, full: bool) -> CatalogDelta:
+        # now() - начало транзакции: всё, что прочитано ниже, не старше него
+        db_now = (await db.execute(select(func.now()))).scalar_one()
+
+        if full or self.watermark is None:
+            rows = [CatalogRow(*row) for row in (await db.execute(select(*CATALOG_COLUMNS))).all()]
+            self._rows = {row.id: row for row in rows}
+            self.watermark = db_now
+            return CatalogDelta(True, rows, set())
+
+        ids = set((await db.execute(select(Firmware.id))).scalars().all())
+        removed = self._rows.keys() - ids
+        unseen = ids - self._rows.keys()
+
+        condition = Firmware.updated_at >= self.watermark - WATERMARK_OVERLAP
+        if unseen:
+            condition = or_(condition, Firmware.id.in_(unseen))
+        result = await db.execute(select(*CATALOG_COLUMNS).where(condition))
+        changed = [row for row in map(CatalogRow._make, result.all()) if self._rows.get(row.id) != row]
+
+        for firmware_id in removed:
+            del self._rows[firmware_id]
+        for row in changed:
+            self._rows[row.id] = row
+        self.watermark = db_now
+        return CatalogDelta(False, changed, removed)
+
+    async def merge(self, rows: Iterable[CatalogRow], removed: Iterable[int]) -> CatalogDelta:
+        """
+        Учесть изменения, прочитанные в обход load() (по NOTIFY).
+        Возвращает только строки, которые действительно изменились.
+        """
+        async with self._lock:
+            if self.watermark is None:
+                # Каталог ещё не читался - первый load() прочитает всё
+                return CatalogDelta(False, [], set())
+            changed = [row for row in rows if self._rows.get(row.id) != row]
+            removed = {firmware_id for firmware_id in removed if firmware_id in self._rows}
+            for firmware_id in removed:
+                del self._rows[firmware_id]
+            for row in changed:
+                self._rows[row.id] = row
+            return CatalogDelta(False, changed, removed)
+
+
+# Глобальный экземпляр
+catalog_delta = CatalogDeltaLoader()
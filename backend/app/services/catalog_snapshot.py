@@ -0,0 +1,348 @@
+"""
+Снимок каталога прошивок в памяти процесса.
+
+Таблицы firmwares и firmware_variants целиком (тысячи строк) хранятся
+по столбцам: id - отсортированный массив numpy (поиск строки через
+searchsorted), числовые поля - массивы, строковые - списки. Варианты
+отсортированы по firmware_id, варианты одной прошивки - непрерывный
+диапазон.
+
+Снимок только для чтения: изменения собираются в новый снимок, который
+подменяет старый одним присваиванием - читатели видят либо старую,
+либо новую версию целиком. Изменения приходят через LISTEN/NOTIFY
+(триггеры из migrations/008); при потере соединения с БД снимок
+перечитывается полностью. Пока снимок не загружен, вызывающий код
+читает из БД.
+
+Страховка от потерянных NOTIFY - is_stale(): число строк и max(updated_at)
+обеих таблиц, запомненные при последнем чтении, против текущих.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import asyncpg
+import numpy as np
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.firmware import Firmware
+from app.models.firmware_variant import FirmwareVariant
+from app.services.stage_variants import variant_loader
+
+
+class VariantRecord(NamedTuple):
+    """Stage вариант из снимка (поля как у FirmwareVariant)"""
+    id: int
+    firmware_id: int
+    stage: str
+    stage_name: str
+    description: Optional[str]
+    power_increase: Optional[str]
+    torque_increase: Optional[str]
+    modifications: Optional[str]
+    price: Optional[float]
+    s3_key: Optional[str]
+    file_size: Optional[int]
+
+
+class FirmwareRecord(NamedTuple):
+    """Прошивка из снимка (поля как у Firmware, без файловых путей и дат)"""
+    id: int
+    winols_file: Optional[str]
+    brand: str
+    series: Optional[str]
+    ecu_brand: Optional[str]
+    software_id: Optional[str]
+    hardware_id: Optional[str]
+    software_id_norm: Optional[str]
+    file_size: Optional[str]
+    price: Optional[float]
+    maps_count: Optional[str]
+    versions_info: Optional[str]
+    variants: Tuple[VariantRecord, ...]
+
+
+FIRMWARE_COLUMNS = [name for name in FirmwareRecord._fields if name not in ("id", "price", "variants")]
+VARIANT_COLUMNS = [name for name in VariantRecord._fields if name not in ("id", "firmware_id", "price")]
+
+# Сколько изменений применять построчно; больше - полная перезагрузка
+MAX_INCREMENTAL_CHANGES = 500
+
+# Пауза перед применением: изменения одной транзакции импорта приходят пачкой
+NOTIFY_DEBOUNCE_SECONDS = 0.5
+
+# Пауза перед повторным подключением слушателя
+RECONNECT_SECONDS = 5
+
+NOTIFY_CHANNEL = "catalog_changed"
+
+
+class CatalogData:
+    """Неизменяемые столбцы одной версии каталога."""
+
+    def __init__(self, firmwares: Iterable[Firmware], variants: Iterable[FirmwareVariant]):
+        firmwares = sorted(firmwares, key=lambda f: f.id)
+        variants = sorted(variants, key=lambda v: (v.firmware_id, v.stage, v.id))
+
+        self.ids = np.fromiter((f.id for f in firmwares), dtype=np.int64, count=len(firmwares))
+        self.prices = np.array([np.nan if f.price is None else float(f.price) for f in firmwares])
+        self.columns: Dict[str, List] = {
+            name: [getattr(f, name) for f in firmwares] for name in FIRMWARE_COLUMNS
+        }
+
+        self.variant_ids = np.fromiter((v.id for v in variants), dtype=np.int64, count=len(variants))
+        self.variant_firmware_ids = np.fromiter(
+            (v.firmware_id for v in variants), dtype=np.int64, count=len(variants)
+        )
+        self.variant_prices = np.array([np.nan if v.price is None else float(v.price) for v in variants])
+        self.variant_columns: Dict[str, List] = {
+            name: [getattr(v, name) for v in variants] for name in VARIANT_COLUMNS
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _position(self, firmware_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self.ids, firmware_id))
+        if position < len(self.ids) and self.ids[position] == firmware_id:
+            return position
+        return None
+
+    def _variants(self, firmware_id: int) -> Tuple[VariantRecord, ...]:
+        start = int(np.searchsorted(self.variant_firmware_ids, firmware_id, side="left"))
+        end = int(np.searchsorted(self.variant_firmware_ids, firmware_id, side="right"))
+        return tuple(
+            VariantRecord(
+                id=int(self.variant_ids[i]),
+                firmware_id=firmware_id,
+                price=None if np.isnan(self.variant_prices[i]) else float(self.variant_prices[i]),
+                **{name: self.variant_columns[name][i] for name in VARIANT_COLUMNS},
+            )
+            for i in range(start, end)
+        )
+
+    def get(self, firmware_id: int) -> Optional[FirmwareRecord]:
+        position = self._position(firmware_id)
+        if position is None:
+            return None
+        price = self.prices[position]
+        return FirmwareRecord(
+            id=firmware_id,
+            price=None if np.isnan(price) else float(price),
+            variants=self._variants(firmware_id),
+            **{name: self.columns[name][position] for name in FIRMWARE_COLUMNS},
+        )
+
+    def rows(self) -> Tuple[List[FirmwareRecord], List[VariantRecord]]:
+        """Все строки (для сборки следующей версии), варианты - отдельным списком."""
+        firmwares = [
+            FirmwareRecord(
+                id=firmware_id,
+                price=None if np.isnan(price) else price,
+                variants=(),
+                **dict(zip(FIRMWARE_COLUMNS, values)),
+            )
+            for firmware_id, price, *values in zip(
+                self.ids.tolist(), self.prices.tolist(), *(self.columns[name] for name in FIRMWARE_COLUMNS)
+            )
+        ]
+        variants = [
+            VariantRecord(
+                id=variant_id,
+                firmware_id=firmware_id,
+                price=None if np.isnan(price) else price,
+                **dict(zip(VARIANT_COLUMNS, values)),
+            )
+            for variant_id, firmware_id, price, *values in zip(
+                self.variant_ids.tolist(),
+                self.variant_firmware_ids.tolist(),
+                self.variant_prices.tolist(),
+                *(self.variant_columns[name] for name in VARIANT_COLUMNS),
+            )
+        ]
+        return firmwares, variants
+
+
+class CatalogSnapshot:
+    """Текущая версия каталога и её обновление по NOTIFY."""
+
+    def __init__(self):
+        self._data: Optional[CatalogData] = None
+        self._listener: Optional[asyncio.Task] = None
+        # Число строк и max(updated_at) таблиц на момент последнего чтения
+        self._fingerprint: Optional[Tuple] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._data is not None
+
+    def __len__(self) -> int:
+        return len(self._data) if self._data is not None else 0
+
+    # =========================================================================
+    # ЧТЕНИЕ
+    # =========================================================================
+
+    def get(self, firmware_id: int) -> Optional[FirmwareRecord]:
+        """Прошивка с вариантами или None (нет в каталоге или снимок не загружен)."""
+        data = self._data
+        return data.get(firmware_id) if data is not None else None
+
+    def variant(self, firmware_id: int, stage: str) -> Optional[VariantRecord]:
+        firmware = self.get(firmware_id)
+        if firmware is None:
+            return None
+        return next((v for v in firmware.variants if v.stage == stage), None)
+
+    # =========================================================================
+    # ЗАГРУЗКА ИЗ БД
+    # =========================================================================
+
+    @staticmethod
+    async def _read_fingerprint(db: AsyncSession) -> Tuple:
+        firmwares = (await db.execute(select(func.count(Firmware.id), func.max(Firmware.updated_at)))).one()
+        variants = (await db.execute(
+            select(func.count(FirmwareVariant.id), func.max(FirmwareVariant.updated_at))
+        )).one()
+        return (*firmwares, *variants)
+
+    async def is_stale(self, db: AsyncSession) -> bool:
+        """
+        Снимок не загружен или таблицы изменились без NOTIFY (два агрегата
+        по таблицам вместо сравнения всего каталога).
+        """
+        return self._data is None or await self._read_fingerprint(db) != self._fingerprint
+
+    async def load(self, db: AsyncSession) -> int:
+        """Полная загрузка обеих таблиц."""
+        # Отпечаток - до чтения строк: изменения между чтениями дадут лишнюю
+        # перезагрузку, а не потерянную
+        fingerprint = await self._read_fingerprint(db)
+        firmwares = (await db.execute(select(Firmware).options(variant_loader(False)))).scalars().all()
+        variants = (await db.execute(select(FirmwareVariant))).scalars().all()
+        self._data = await asyncio.to_thread(CatalogData, firmwares, variants)
+        self._fingerprint = fingerprint
+        logger.info(f"Catalog snapshot loaded: {len(firmwares)} firmwares, {len(variants)} variants")
+        return len(firmwares)
+
+    async def apply(self, db: AsyncSession, firmware_ids: Set[int]) -> Set[int]:
+        """
+        Перечитать прошивки firmware_ids с вариантами и подменить снимок.
+        Прошивок, которых больше нет в БД, в новой версии нет.
+        Возвращает прошивки, которые действительно изменились (с вариантами).
+        """
+        data = self._data
+        if data is None:
+            await self.load(db)
+            return set(firmware_ids)
+
+        fingerprint = await self._read_fingerprint(db)
+        changed = (await db.execute(
+            select(Firmware).where(Firmware.id.in_(firmware_ids)).options(variant_loader(False))
+        )).scalars().all()
+        changed_variants = (await db.execute(
+            select(FirmwareVariant).where(FirmwareVariant.firmware_id.in_(firmware_ids))
+        )).scalars().all()
+
+        def build() -> CatalogData:
+            firmwares, variants = data.rows()
+            firmwares = [f for f in firmwares if f.id not in firmware_ids] + list(changed)
+            variants = [v for v in variants if v.firmware_id not in firmware_ids] + list(changed_variants)
+            return CatalogData(firmwares, variants)
+
+        # Сборка новой версии (десятки мс) - вне цикла событий
+        new_data = await asyncio.to_thread(build)
+        self._data = new_data
+        self._fingerprint = fingerprint
+        return {firmware_id for firmware_id in firmware_ids if data.get(firmware_id) != new_data.get(firmware_id)}
+
+    # =========================================================================
+    # LISTEN/NOTIFY
+    # =========================================================================
+
+    def start_listener(
+        self,
+        session_maker,
+        on_change: Optional[Callable[[Optional[Set[int]]], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Запустить фоновое обновление снимка по NOTIFY catalog_changed.
+
+        on_change(firmware_ids) вызывается после подмены снимка, если
+        прошивки firmware_ids (или их варианты) действительно изменились
+        (None - снимок перечитан полностью).
+        """
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen(session_maker, on_change))
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self, session_maker, on_change) -> None:
+        # asyncpg напрямую: LISTEN держит отдельное соединение вне пула SQLAlchemy
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def notified(connection, pid, channel, payload):
+            queue.put_nowait(payload)
+
+        resync = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(NOTIFY_CHANNEL, notified)
+                logger.info(f"Catalog snapshot: listening on {NOTIFY_CHANNEL}")
+                if resync:
+                    # Уведомления за время разрыва потеряны - полная перезагрузка
+                    async with session_maker() as session:
+                        await self.load(session)
+                    if on_change:
+                        await on_change(None)
+                resync = True
+
+                while True:
+                    payloads = [await queue.get()]
+                    await asyncio.sleep(NOTIFY_DEBOUNCE_SECONDS)
+                    while not queue.empty():
+                        payloads.append(queue.get_nowait())
+
+                    firmware_ids = set()
+                    for payload in payloads:
+                        try:
+                            firmware_ids.add(int(json.loads(payload)["firmware_id"]))
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning(f"Catalog snapshot: bad notification {payload!r}")
+
+                    if not firmware_ids:
+                        continue
+                    full = len(firmware_ids) > MAX_INCREMENTAL_CHANGES
+                    async with session_maker() as session:
+                        if full:
+                            await self.load(session)
+                        else:
+                            firmware_ids = await self.apply(session, firmware_ids)
+                    if on_change and (full or firmware_ids):
+                        await on_change(None if full else firmware_ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog snapshot listener failed: {e}")
+                await asyncio.sleep(RECONNECT_SECONDS)
+            finally:
+                if connection is not None:
+                    await connection.close()
+
+
+# Глобальный экземпляр
+catalog_snapshot = CatalogSnapshot()
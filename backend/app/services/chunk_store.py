@@ -0,0 +1,377 @@
+"""
+Дедуплицирующее хранилище файлов прошивок.
+
+Файл режется на блоки по содержимому (content-defined chunking),
+каждый уникальный блок хранится один раз (ключ - SHA-256 блока).
+Файл описывается манифестом - списком блоков, и собирается обратно
+по нему. Стоковые чтения одного семейства ЭБУ совпадают по большинству
+блоков, поэтому хранение и загрузка в S3 сокращаются в разы.
+
+Учёт ведётся в Postgres (dedup_files, dedup_chunks): файл учитывается
+один раз, блок считает ссылающиеся на него файлы. Счётчики меняются
+атомарно в транзакции записи, поэтому несколько воркеров пишут
+в хранилище одновременно. Блоки с нулевым счётчиком удаляются
+сборкой мусора (gc).
+
+Запись вызывается на каждый поиск по файлу, поэтому учёт идёт через
+асинхронный движок API (app.core.database), а разбиение на блоки
+и обращения к диску/S3 - в пуле потоков.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from loguru import logger
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models.dedup import DedupChunk, DedupFile
+from app.services.chunking import chunk_boundaries
+
+
+MANIFEST_REF_PREFIX = "dedup://"
+
+# Файл уже учтён - строки не будет (повторное сохранение не добавляет ссылок)
+INSERT_FILE_SQL = text(
+    "INSERT INTO dedup_files (file_id, filename, size) VALUES (:file_id, :filename, :size) "
+    "ON CONFLICT (file_id) DO NOTHING RETURNING file_id"
+)
+
+# Атомарное +1 к счётчику блока (строка создаётся при первой ссылке)
+ADD_REF_SQL = text(
+    "INSERT INTO dedup_chunks (digest, size, refcount) VALUES (:digest, :size, 1) "
+    "ON CONFLICT (digest) DO UPDATE SET refcount = dedup_chunks.refcount + 1 "
+    "RETURNING refcount"
+)
+
+
+class LocalChunkBackend:
+    """Хранение блоков и манифестов на локальном диске."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> List[str]:
+        base = self._path(prefix)
+        keys = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    keys.append(os.path.relpath(os.path.join(dirpath, name), self.root))
+        return keys
+
+
+class S3ChunkBackend:
+    """Хранение блоков и манифестов в Yandex Object Storage."""
+
+    def __init__(self, prefix: str):
+        from app.services.s3_storage import s3_storage
+
+        self.client = s3_storage.client
+        self.bucket_name = s3_storage.bucket_name
+        self.prefix = prefix
+
+    def put(self, key: str, data: bytes) -> None:
+        self.client.put_object(
+            Bucket=self.bucket_name,
+            Key=self.prefix + key,
+            Body=data,
+            ContentType="application/octet-stream",
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=self.prefix + key)
+            return response["Body"].read()
+        except ClientError:
+            return None
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete_object(Bucket=self.bucket_name, Key=self.prefix + key)
+        except ClientError:
+            pass
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix + prefix):
+            for obj in page.get("Contents", []):
+                keys.append(obj["Key"][len(self.prefix):])
+        return keys
+
+
+class ChunkStore:
+    """Дедуплицирующее хранилище поверх локального диска или S3."""
+
+    def __init__(self, backend, session_factory=None, avg_chunk_size: int = 8192):
+        self.backend = backend
+        self.avg_chunk_size = avg_chunk_size
+        self._session_factory = session_factory or async_session_maker
+
+    def _session(self) -> AsyncSession:
+        return self._session_factory()
+
+    @staticmethod
+    def _chunk_key(digest: str) -> str:
+        return f"chunks/{digest[:2]}/{digest}"
+
+    @staticmethod
+    def _manifest_key(file_id: str) -> str:
+        return f"manifests/{file_id}.json"
+
+    # =========================================================================
+    # СЧЁТЧИКИ ССЫЛОК
+    # =========================================================================
+
+    @staticmethod
+    async def _add_refs(db: AsyncSession, chunk_sizes: Dict[str, int]) -> List[str]:
+        """
+        +1 ссылка на каждый блок. Возвращает блоки, на которые до этого
+        никто не ссылался - их нужно загрузить в хранилище.
+
+        Строки блокируются до конца транзакции: параллельная запись того же
+        блока ждёт, пока он не будет загружен, а сборка мусора не удалит
+        блок между увеличением счётчика и записью манифеста. Порядок
+        блокировок - по digest (без взаимных блокировок).
+        """
+        new_digests = []
+        for digest in sorted(chunk_sizes):
+            refcount = (await db.execute(
+                ADD_REF_SQL, {"digest": digest, "size": chunk_sizes[digest]}
+            )).scalar_one()
+            if refcount == 1:
+                new_digests.append(digest)
+        return new_digests
+
+    # =========================================================================
+    # ЗАПИСЬ / ЧТЕНИЕ
+    # =========================================================================
+
+    async def put_file(self, data: bytes, filename: Optional[str] = None, sha256: Optional[str] = None) -> Dict:
+        """
+        Сохранить файл. Загружаются только блоки, которых ещё нет в хранилище;
+        повторное сохранение того же файла ничего не меняет.
+        sha256 - уже посчитанный хеш файла (при потоковом чтении загрузки).
+
+        Returns:
+            dict с file_id (SHA-256 файла), ref для Order.original_file_path
+            и статистикой дедупликации
+        """
+        file_id = sha256 or await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        stored_bytes = 0
+
+        async with self._session() as db, db.begin():
+            inserted = (await db.execute(
+                INSERT_FILE_SQL, {"file_id": file_id, "filename": filename, "size": len(data)}
+            )).first()
+
+            if inserted is not None:
+                chunks, first_seen = await asyncio.to_thread(self._split, data)
+                new_digests = await self._add_refs(
+                    db, {digest: len(chunk) for digest, chunk in first_seen.items()}
+                )
+                manifest = {
+                    "file_id": file_id,
+                    "filename": filename,
+                    "size": len(data),
+                    "chunks": chunks,
+                }
+                stored_bytes = await asyncio.to_thread(self._upload, manifest, new_digests, first_seen)
+
+        return {
+            "file_id": file_id,
+            "ref": f"{MANIFEST_REF_PREFIX}{file_id}",
+            "size": len(data),
+            "stored_bytes": stored_bytes,
+        }
+
+    def _split(self, data: bytes) -> Tuple[List[List], Dict[str, memoryview]]:
+        """Блоки файла [digest, размер] и первое вхождение каждого блока."""
+        view = memoryview(data)
+        chunks = []
+        first_seen: Dict[str, memoryview] = {}
+        for start, end in chunk_boundaries(
+            data,
+            avg_size=self.avg_chunk_size,
+            min_size=self.avg_chunk_size // 4,
+            max_size=self.avg_chunk_size * 4,
+        ):
+            digest = hashlib.sha256(view[start:end]).hexdigest()
+            chunks.append([digest, end - start])
+            first_seen.setdefault(digest, view[start:end])
+        return chunks, first_seen
+
+    def _upload(self, manifest: Dict, new_digests: List[str], first_seen: Dict[str, memoryview]) -> int:
+        """Загрузить новые блоки и манифест. Возвращает записанные байты блоков."""
+        stored_bytes = 0
+        for digest in new_digests:
+            self.backend.put(self._chunk_key(digest), bytes(first_seen[digest]))
+            stored_bytes += len(first_seen[digest])
+        self.backend.put(self._manifest_key(manifest["file_id"]), json.dumps(manifest).encode())
+        return stored_bytes
+
+    def get_manifest(self, file_id: str) -> Optional[Dict]:
+        raw = self.backend.get(self._manifest_key(file_id))
+        return json.loads(raw) if raw else None
+
+    def iter_file(self, file_id: str) -> Iterator[bytes]:
+        """Собрать файл по манифесту (поблочно, для стриминга)."""
+        manifest = self.get_manifest(file_id)
+        if manifest is None:
+            raise FileNotFoundError(file_id)
+
+        for digest, _ in manifest["chunks"]:
+            chunk = self.backend.get(self._chunk_key(digest))
+            if chunk is None:
+                raise FileNotFoundError(f"Chunk {digest} of {file_id} is missing")
+            yield chunk
+
+    def get_file(self, file_id: str) -> bytes:
+        """Собрать файл целиком с проверкой SHA-256."""
+        data = b"".join(self.iter_file(file_id))
+        if hashlib.sha256(data).hexdigest() != file_id:
+            raise ValueError(f"Checksum mismatch for {file_id}")
+        return data
+
+    # =========================================================================
+    # УДАЛЕНИЕ / СБОРКА МУСОРА
+    # =========================================================================
+
+    async def delete_file(self, file_id: str) -> bool:
+        """Удалить файл: манифест и по одной ссылке с каждого его блока."""
+        async with self._session() as db, db.begin():
+            deleted = (await db.execute(delete(DedupFile).where(DedupFile.file_id == file_id))).rowcount
+            if not deleted:
+                return False
+
+            manifest = await asyncio.to_thread(self.get_manifest, file_id)
+            for digest in sorted({digest for digest, _ in (manifest or {}).get("chunks", [])}):
+                await db.execute(
+                    update(DedupChunk)
+                    .where(DedupChunk.digest == digest)
+                    .values(refcount=DedupChunk.refcount - 1)
+                )
+            await asyncio.to_thread(self.backend.delete, self._manifest_key(file_id))
+            return True
+
+    async def gc(self, rebuild_counts: bool = False) -> Dict:
+        """
+        Удалить блоки, на которые не ссылается ни один файл.
+
+        Args:
+            rebuild_counts: Пересчитать счётчики по манифестам в хранилище
+                (восстановление после сбоев, переход с refcounts.json)
+                и удалить осиротевшие блоки
+        """
+        if rebuild_counts:
+            await self._rebuild_counts()
+
+        async with self._session() as db, db.begin():
+            # FOR UPDATE: параллельная запись, ссылающаяся на блок, ждёт
+            # конца сборки и загрузит блок заново
+            garbage = (await db.execute(
+                select(DedupChunk.digest).where(DedupChunk.refcount <= 0).with_for_update(skip_locked=True)
+            )).scalars().all()
+            await asyncio.to_thread(self._delete_chunks, garbage)
+            if garbage:
+                await db.execute(delete(DedupChunk).where(DedupChunk.digest.in_(garbage)))
+
+        logger.info(f"Chunk store GC: removed {len(garbage)} chunks")
+        return {"removed_chunks": len(garbage), **await self.stats()}
+
+    def _delete_chunks(self, digests: List[str]) -> None:
+        for digest in digests:
+            self.backend.delete(self._chunk_key(digest))
+
+    def _scan(self) -> Tuple[Dict[str, Dict], Dict[str, List[int]]]:
+        """Файлы по манифестам хранилища и [размер, число ссылок] каждого блока."""
+        files: Dict[str, Dict] = {}
+        chunk_counts: Dict[str, List[int]] = {}
+        for key in self.backend.list("manifests/"):
+            manifest = json.loads(self.backend.get(key) or b"{}")
+            if "file_id" not in manifest:
+                continue
+            files[manifest["file_id"]] = manifest
+            for digest, size in {digest: size for digest, size in manifest.get("chunks", [])}.items():
+                chunk_counts.setdefault(digest, [size, 0])[1] += 1
+        for key in self.backend.list("chunks/"):
+            chunk_counts.setdefault(key.rsplit("/", 1)[-1], [0, 0])
+        return files, chunk_counts
+
+    async def _rebuild_counts(self) -> None:
+        """Счётчики и список файлов заново по манифестам и блокам хранилища."""
+        files, chunk_counts = await asyncio.to_thread(self._scan)
+
+        async with self._session() as db, db.begin():
+            if db.get_bind().dialect.name == "postgresql":
+                # Записи ждут окончания пересчёта
+                await db.execute(text("LOCK TABLE dedup_files, dedup_chunks IN EXCLUSIVE MODE"))
+            await db.execute(delete(DedupChunk))
+            await db.execute(delete(DedupFile))
+            if files:
+                await db.execute(insert(DedupFile), [
+                    {"file_id": file_id, "filename": manifest.get("filename"), "size": manifest.get("size", 0)}
+                    for file_id, manifest in files.items()
+                ])
+            if chunk_counts:
+                await db.execute(insert(DedupChunk), [
+                    {"digest": digest, "size": size, "refcount": refcount}
+                    for digest, (size, refcount) in chunk_counts.items()
+                ])
+
+    async def stats(self) -> Dict:
+        async with self._session() as db:
+            return {
+                "files": (await db.execute(select(func.count()).select_from(DedupFile))).scalar_one(),
+                "chunks": (await db.execute(select(func.count()).select_from(DedupChunk))).scalar_one(),
+            }
+
+
+def create_chunk_store() -> ChunkStore:
+    """Создать хранилище по настройкам (local или s3)."""
+    if settings.DEDUP_STORE_BACKEND == "s3":
+        backend = S3ChunkBackend(prefix=settings.DEDUP_S3_PREFIX)
+    else:
+        backend = LocalChunkBackend(settings.DEDUP_STORE_PATH)
+    return ChunkStore(backend)
+
+
+def parse_ref(ref: Optional[str]) -> Optional[str]:
+    """dedup://<file_id> -> file_id (None для обычных путей)."""
+    if ref and ref.startswith(MANIFEST_REF_PREFIX):
+        return ref[len(MANIFEST_REF_PREFIX):]
+    return None
+
+
+# Глобальный экземпляр
+chunk_store = create_chunk_store()
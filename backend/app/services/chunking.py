@@ -0,0 +1,114 @@
+"""
+Content-defined chunking (CDC) для бинарных файлов прошивок.
+
+Границы блоков определяются содержимым (скользящий хеш по окну),
+а не фиксированными смещениями. Поэтому вставка или правка в одном
+месте файла меняет только соседние блоки - остальные совпадают
+с блоками исходного файла. Используется индексом похожести
+и дедуплицирующим хранилищем.
+"""
+import hashlib
+from typing import List, Tuple
+
+import numpy as np
+
+
+# Версия схемы разбиения: меняется вместе с таблицей или алгоритмом
+# (сохранённые индексы с другой схемой пересобираются)
+CHUNKING_SCHEME = "cdc-gear-blake2b-v1"
+
+# Размер скользящего окна (байт)
+WINDOW_SIZE = 48
+
+
+def hash_constants(label: str, count: int, modulus: int = 2**32, offset: int = 0) -> np.ndarray:
+    """
+    count псевдослучайных констант из blake2b(label:i) в диапазоне
+    [offset, offset + modulus). В отличие от np.random не зависят
+    от версии numpy - на них построены сохранённые данные.
+    """
+    return np.array(
+        [
+            offset + int.from_bytes(
+                hashlib.blake2b(f"{label}:{i}".encode(), digest_size=8).digest(), "little"
+            ) % modulus
+            for i in range(count)
+        ],
+        dtype=np.uint64,
+    )
+
+
+# Значение для каждого байта (границы блоков должны быть одинаковыми
+# между запусками и версиями библиотек)
+_GEAR_TABLE = hash_constants("motorsoft-gear", 256).astype(np.uint32)
+
+
+def chunk_boundaries(
+    data: bytes,
+    avg_size: int = 4096,
+    min_size: int = 1024,
+    max_size: int = 16384,
+) -> List[Tuple[int, int]]:
+    """
+    Разбить данные на блоки по содержимому.
+
+    Хеш окна считается векторно: сумма значений таблицы по окну
+    через cumsum (переполнение uint32 - это просто арифметика по модулю).
+    Граница ставится там, где старшие биты хеша равны нулю.
+
+    Args:
+        data: Бинарные данные
+        avg_size: Целевой средний размер блока (степень двойки)
+        min_size: Минимальный размер блока
+        max_size: Максимальный размер блока
+
+    Returns:
+        Список (start, end) для каждого блока
+    """
+    n = len(data)
+    if n == 0:
+        return []
+    if n <= min_size:
+        return [(0, n)]
+
+    bits = max(1, avg_size.bit_length() - 1)
+
+    values = _GEAR_TABLE[np.frombuffer(data, dtype=np.uint8)]
+    sums = np.cumsum(values, dtype=np.uint32)
+    window_hash = sums.copy()
+    window_hash[WINDOW_SIZE:] -= sums[:-WINDOW_SIZE]
+
+    # Конец блока - позиция после байта, где сработал хеш
+    candidates = np.flatnonzero((window_hash >> np.uint32(32 - bits)) == 0) + 1
+
+    boundaries = []
+    start = 0
+    for end in candidates.tolist():
+        if end - start < min_size:
+            continue
+        while end - start > max_size:
+            boundaries.append((start, start + max_size))
+            start += max_size
+        if end - start >= min_size:
+            boundaries.append((start, end))
+            start = end
+
+    while n - start > max_size:
+        boundaries.append((start, start + max_size))
+        start += max_size
+    if start < n:
+        boundaries.append((start, n))
+
+    return boundaries
+
+
+def iter_chunks(
+    data: bytes,
+    avg_size: int = 4096,
+    min_size: int = 1024,
+    max_size: int = 16384,
+):
+    """Итератор по блокам данных (memoryview без копирования)."""
+    view = memoryview(data)
+    for start, end in chunk_boundaries(data, avg_size, min_size, max_size):
+        yield view[start:end]
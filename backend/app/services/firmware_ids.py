@@ -0,0 +1,165 @@
+"""
+Нормализация идентификаторов прошивок.
+
+Номера в базе хранятся с разделителями (89663-47351, 37805-5J6-R870),
+а в запросах приходят как угодно: без дефисов, в нижнем регистре,
+с пробелами. Для сравнения всё приводится к компактной форме.
+
+Нормализованная форма дополнительно сворачивает символы, которые OCR
+путает (O/0, I/1, S/5, B/8...), и совпадает с колонкой
+firmwares.software_id_norm (migrations/006_add_software_id_norm.sql).
+"""
+import re
+from typing import List, Optional
+
+
+# Сначала убираем всё кроме ASCII, потом upper() - как в SQL-выражении
+# (upper() до фильтра превращал бы 'ß' в 'SS', 'ı' в 'I')
+_NON_ALNUM_RE = re.compile(r'[^A-Za-z0-9]')
+
+# OCR-двойники -> цифры (как translate(..., 'OQILSBZ', '0011582') в SQL)
+CONFUSABLE_FROM = "OQILSBZ"
+CONFUSABLE_TO = "0011582"
+_CONFUSABLES = str.maketrans(CONFUSABLE_FROM, CONFUSABLE_TO)
+
+
+def compact_id(value: Optional[str]) -> str:
+    """Верхний регистр, только латиница и цифры: '89663-47351' -> '8966347351'."""
+    if not value:
+        return ""
+    return _NON_ALNUM_RE.sub('', value).upper()
+
+
+def normalize_id(value: Optional[str]) -> str:
+    """Компактная форма со свёрнутыми OCR-двойниками: 'GATA-BE42QS09' -> 'GATA8E420509'."""
+    return compact_id(value).translate(_CONFUSABLES)
+
+
+# =========================================================================
+# СОСТАВНЫЕ ID
+# =========================================================================
+
+# Части поля между разделителями разных ID (дефис - часть ID: 89663-47351)
+_TOKEN_RE = re.compile(r'[^\s_()\[\]{}#/\\,;:|]+')
+
+# 37805-5J6-R870(R810): альтернативный последний сегмент в скобках
+_ALT_SUFFIX_RE = re.compile(r'([A-Za-z0-9][A-Za-z0-9-]*-)([A-Za-z0-9]+)\(([A-Za-z0-9]+)\)')
+
+_HAS_DIGIT_RE = re.compile(r'\d')
+
+# Короче - это марки, модели и мусор (KIA, E2), а не номера прошивок
+MIN_TOKEN_LENGTH = 5
+
+
+def split_id_tokens(value: Optional[str]) -> List[str]:
+    """
+    Разбить поле с несколькими ID на нормализованные токены (по порядку, без повторов).
+
+    '37805-5J6-R870(R810)' -> ['378055J6R870', '378055J6R810']
+    'KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600' -> ['GAP5DG46F501600']
+    """
+    if not value or not isinstance(value, str):
+        return []
+
+    # (позиция, порядок, часть): альтернатива идёт сразу после исходного ID
+    parts = [(match.start(), 0, match.group()) for match in _TOKEN_RE.finditer(value)]
+    for match in _ALT_SUFFIX_RE.finditer(value):
+        base, last, alt = match.groups()
+        if len(alt) == len(last):
+            parts.append((match.start(), 1, base + alt))
+    parts.sort(key=lambda item: item[:2])
+
+    tokens = []
+    for _, _, part in parts:
+        token = normalize_id(part)
+        if len(token) >= MIN_TOKEN_LENGTH and _HAS_DIGIT_RE.search(part) and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+# =========================================================================
+# ИМЕНА ФАЙЛОВ
+# =========================================================================
+
+_EXTENSION_RE = re.compile(r'\.\w{2,4}$')
+_DATETIME_RE = re.compile(r'-\d{8}-\d{6}')          # -20260112-184331
+_DATE_RE = re.compile(r'-?\d{8}(-\d{6})?')          # 20260112 или 20260112-184331
+_PART_SPLIT_RE = re.compile(r'[_\s\-]+')
+
+# Общие слова в именах файлов - не ID
+FILENAME_SKIP_WORDS = frozenset({
+    'hyundai', 'solaris', 'accent', 'toyota', 'kia', 'bmw', 'nissan',
+    'оригинал', 'original', 'stage', 'mod', 'tuned', 'stock',
+})
+
+# Части имени короче - не ID; длиннее SHORT_PART_LENGTH - пробуем и начало (часто ID сокращён)
+MIN_PART_LENGTH = 6
+SHORT_PART_LENGTH = 12
+
+# Chinese ECU patterns to extract from filename
+FILENAME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Hyundai/Kia Bosch calibration: GRBRB44CQS6-A000, GRBRB44CFS8-5000
+    r'(GR[A-Z0-9]{6,12}[-_]?[A-Z0-9]{4,6})',
+    # Hyundai/Kia software IDs: GN26ST2E2
+    r'(GN[0-9]{2}[A-Z0-9]{4,8})',
+    # Full Chinese calibration: GCQBRB44CQS03A00 (16+ chars)
+    r'([A-Z]{3,5}[A-Z0-9]{10,15})',
+    # UAES/Bosch China: F01R0AD3G0, F01RB0D2T4
+    r'(F01R[0A-Z0-9]{5,10})',
+    # Toyota/Denso style: R7F701202_89663-06N50
+    r'(R7F[0-9]+_[0-9A-Z-]+)',
+    r'([0-9]{5}-[0-9A-Z]{4,6})',
+    # Bosch MED17/EDC17 - extract VI number: vi_004782 -> 004782
+    r'vi_(\d{6,8})',
+    # Bosch serial from filename: _XXXXXXXX_ 10 digits
+    r'_(\d{10})_',
+    # Bosch SW number 27XXXXXXXX or 26XXXXXXXX
+    r'(2[67]\d{8})',
+    # Bosch 1037 format
+    r'(103\d{7,10})',
+)]
+
+
+def _unique(values: List[str]) -> List[str]:
+    seen = set()
+    unique = []
+    for value in values:
+        if value.upper() not in seen:
+            seen.add(value.upper())
+            unique.append(value)
+    return unique
+
+
+def filename_parts(filename: Optional[str]) -> List[str]:
+    """
+    Части имени файла, похожие на ID (для умного поиска).
+
+    Hyundai_Solaris_1.2_(Оригинал)_GATA-BE42QS09A00_.bin -> ['BE42QS09A00']
+    EL4YP2AS1F1D-20260112-184331_E2.bin -> ['EL4YP2AS1F1D']
+    """
+    if not filename:
+        return []
+
+    clean = _DATE_RE.sub('', _EXTENSION_RE.sub('', filename))
+    return _unique([
+        part for part in _PART_SPLIT_RE.split(clean)
+        if len(compact_id(part)) >= MIN_PART_LENGTH and part.lower() not in FILENAME_SKIP_WORDS
+    ])
+
+
+def extract_ids_from_filename(filename: Optional[str]) -> List[str]:
+    """Extract potential firmware IDs from filename"""
+    if not filename:
+        return []
+
+    # Remove date-time and extension
+    clean = _EXTENSION_RE.sub('', _DATETIME_RE.sub('', filename))
+
+    # First, add the clean filename itself as potential ID (most reliable)
+    ids = [clean] if len(clean) >= MIN_PART_LENGTH else []
+
+    # Then try patterns
+    for pattern in FILENAME_PATTERNS:
+        ids.extend(pattern.findall(clean))
+
+    return _unique(ids)
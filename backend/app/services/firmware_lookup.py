@@ -0,0 +1,517 @@
+"""
+Поиск прошивки по набору кандидатов ID за один запрос к БД.
+
+Кандидаты (ID из парсера, все совпадения паттернов, ID из имени файла)
+проверяются одним SELECT: точное совпадение software_id_norm, токены
+составных ID, подстрока (in-memory индекс или GIN pg_trgm) и похожие ID.
+Кандидаты, которых точно нет в каталоге (Bloom-фильтр), в точный поиск
+не попадают; если совпасть не может ни один - запроса к БД нет.
+Найденные прошивки ранжируются по источнику кандидата, его уверенности
+и типу совпадения.
+
+Если известен hardware_id (парсер нашёл HW номер), при равных
+совпадениях software_id выше прошивка с тем же HW: пара (SW, HW)
+проверяется по составному индексу тем же запросом.
+
+ranked_search - тот же запрос для одного введённого ID: top-k с
+обязательным LIMIT и оценкой общего числа совпадений.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.firmware import Firmware
+from app.models.firmware_id_token import FirmwareIdToken
+from app.services.firmware_ids import (
+    SHORT_PART_LENGTH,
+    filename_parts,
+    normalize_id,
+    split_id_tokens,
+)
+from app.services.firmware_queries import hardware_id_matches, software_id_contains
+from app.services.fuzzy_index import fuzzy_index
+from app.services.id_filter import id_filter
+from app.services.stage_variants import variant_loader
+from app.services.trigram_index import trigram_index
+
+
+class CandidateSource:
+    """Откуда взят кандидат ID"""
+    PARSER = "parser"              # software_id из парсера
+    PARSER_MATCH = "parser_match"  # остальные совпадения паттернов (all_matches)
+    FILENAME = "filename"          # ID из имени файла
+    FILENAME_PART = "filename_part"  # часть имени файла (умный поиск)
+    QUERY = "query"                # ID, введённый пользователем
+
+
+# Уверенность по умолчанию для источника
+SOURCE_CONFIDENCE = {
+    CandidateSource.PARSER: 0.9,
+    CandidateSource.PARSER_MATCH: 0.7,
+    CandidateSource.FILENAME: 0.6,
+    CandidateSource.FILENAME_PART: 0.95,
+    CandidateSource.QUERY: 1.0,
+}
+
+# Вес типа совпадения
+MATCH_WEIGHTS = {
+    "exact": 1.0,
+    "normalized": 0.98,
+    "token": 0.95,
+    "prefix": 0.85,
+    "substring": 0.7,
+    "fuzzy": 0.6,    # делится на (1 + расстояние нечёткого индекса)
+    "similar": 0.5,
+}
+
+# Приблизительные совпадения (не принимаются автоматически)
+APPROXIMATE_MATCHES = {"fuzzy", "similar"}
+
+# Не точное совпадение принимается автоматически, только если ID не короче
+# (короткий ID после нормализации совпадает с чем угодно: 'a%b' -> 'A8')
+ACCEPT_MIN_LENGTH = 6
+
+# Сколько строк максимум читаем из БД на все кандидаты
+MAX_ROWS = 200
+
+# ranked_search: результатов по умолчанию / максимум
+DEFAULT_K = 20
+MAX_K = 100
+
+# Дальше total_estimate не считаем (count по GIN)
+TOTAL_ESTIMATE_CAP = 1000
+
+# Сколько похожих ID нечёткого индекса берём на одного кандидата
+MEMORY_HITS_PER_TERM = 20
+
+# Похожесть (pg_trgm) только для достаточно длинных ID и выше порога
+SIMILARITY_MIN_LENGTH = 6
+SIMILARITY_THRESHOLD = 0.6
+
+
+def make_candidate(term: str, source: str, confidence: Optional[float] = None) -> Dict:
+    return {
+        "term": term,
+        "norm": normalize_id(term),
+        "source": source,
+        "confidence": SOURCE_CONFIDENCE[source] if confidence is None else confidence,
+    }
+
+
+def build_candidates(parse_result: Dict, filename_ids: Iterable[str] = ()) -> List[Dict]:
+    """
+    Кандидаты из результата парсера и имени файла (без повторов по нормализованной форме).
+
+    Первым идёт software_id парсера с его confidence, затем остальные
+    совпадения паттернов (строковый поиск - с пониженной уверенностью),
+    затем ID из имени файла.
+    """
+    candidates = []
+
+    software_id = parse_result.get("software_id")
+    if software_id:
+        candidates.append(make_candidate(
+            software_id, CandidateSource.PARSER, parse_result.get("confidence") or None
+        ))
+
+    for match in parse_result.get("all_matches", []):
+        if match.get("match"):
+            confidence = 0.4 if match.get("pattern") == "string_search" else None
+            candidates.append(make_candidate(match["match"], CandidateSource.PARSER_MATCH, confidence))
+
+    for term in filename_ids:
+        candidates.append(make_candidate(term, CandidateSource.FILENAME))
+
+    return unique_candidates(candidates)
+
+
+def filename_part_candidates(filename: Optional[str]) -> List[Dict]:
+    """
+    Кандидаты умного поиска по имени файла.
+
+    Более ранние части имени надёжнее; начало длинной части
+    (ID часто сокращён) - с пониженной уверенностью.
+    """
+    base = SOURCE_CONFIDENCE[CandidateSource.FILENAME_PART]
+    candidates = []
+    for i, part in enumerate(filename_parts(filename)):
+        candidates.append(make_candidate(part, CandidateSource.FILENAME_PART, base - 0.01 * i))
+        if len(part) > SHORT_PART_LENGTH:
+            candidates.append(make_candidate(
+                part[:SHORT_PART_LENGTH], CandidateSource.FILENAME_PART, base - 0.1 - 0.01 * i
+            ))
+    return unique_candidates(candidates)
+
+
+def unique_candidates(candidates: Iterable[Dict]) -> List[Dict]:
+    """Убрать пустые и повторы (остаётся первый - с более надёжным источником)."""
+    seen = set()
+    unique = []
+    for candidate in candidates:
+        if candidate["norm"] and candidate["norm"] not in seen:
+            seen.add(candidate["norm"])
+            unique.append(candidate)
+    return unique
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """Похожесть по триграммам, как similarity() в pg_trgm (для одного слова)."""
+    def grams(value: str) -> set:
+        padded = f"  {value.lower()} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    ga, gb = grams(a), grams(b)
+    return len(ga & gb) / len(ga | gb) if ga or gb else 0.0
+
+
+# =========================================================================
+# ЗАПРОС
+# =========================================================================
+
+def fuzzy_hits(terms: Iterable[str]) -> Optional[Dict[str, Dict[int, float]]]:
+    """
+    Похожие ID из in-memory нечёткого индекса: term -> {firmware_id: расстояние}.
+    None - индекс не загружен (тогда похожесть ищет pg_trgm).
+    """
+    if not fuzzy_index.ready:
+        return None
+    return {
+        term: {hit["firmware_id"]: hit["distance"] for hit in fuzzy_index.search(term, k=MEMORY_HITS_PER_TERM)}
+        for term in terms
+    }
+
+
+def match_tier(candidates: List[Dict], known: List[str]):
+    """
+    SQL-ранг совпадения (для ORDER BY): 0 точный ID, 1 нормализованный,
+    2 токен составного ID, 3 префикс, 4 подстрока, 5 похожий.
+    """
+    terms = [c["norm"] for c in candidates]
+    norm = Firmware.software_id_norm
+    whens = [
+        (func.upper(Firmware.software_id).in_([c["term"].strip().upper() for c in candidates]), 0),
+        (norm.in_(terms), 1),
+    ]
+    if known:
+        whens.append((Firmware.id.in_(
+            select(FirmwareIdToken.firmware_id).where(FirmwareIdToken.token.in_(known))
+        ), 2))
+    whens.append((or_(*(norm.like(f"{term}%") for term in terms)), 3))
+    whens.append((or_(*(norm.like(f"%{term}%") for term in terms)), 4))
+    return case(*whens, else_=5)
+
+
+def candidates_query(
+    candidates: List[Dict],
+    dialect: str = "postgresql",
+    fuzzy: bool = True,
+    limit: int = MAX_ROWS,
+    fuzzy_ids: Optional[Dict[str, Dict[int, float]]] = None,
+    hardware_id: Optional[str] = None,
+    include_variants: bool = False,
+    prefer_hardware_id: Optional[str] = None,
+):
+    """
+    Один SELECT по всем кандидатам (None - ни один кандидат не может совпасть).
+
+    Точные совпадения и токены - btree, только для кандидатов, прошедших
+    Bloom-фильтр каталога; подстрока - позиции из in-memory индекса или
+    GIN pg_trgm (с фильтром hardware_id - всегда GIN: top-k индекса
+    отрезал бы прошивки с нужным HW); похожие ID (fuzzy) - fuzzy_ids из in-memory нечёткого
+    индекса или оператор % pg_trgm. Порядок - match_tier, длина ID, id:
+    LIMIT отрезает худшие совпадения, порядок стабилен между вызовами.
+    hardware_id - фильтр по HW номеру, prefer_hardware_id - прошивки
+    с этим HW выше внутри своего ранга.
+    include_variants - Stage варианты тем же запросом (JOIN).
+    """
+    terms = [c["norm"] for c in candidates]
+    known = [term for term in terms if id_filter.might_contain(term)]
+    norm = Firmware.software_id_norm
+
+    clauses = []
+    if known:
+        clauses.append(norm.in_(known))
+        clauses.append(Firmware.id.in_(
+            select(FirmwareIdToken.firmware_id).where(FirmwareIdToken.token.in_(known))
+        ))
+
+    memory_ids = set()
+    if trigram_index.ready and not hardware_id:
+        for term in terms:
+            memory_ids.update(trigram_index.search(term, limit=limit))
+    else:
+        clauses.extend(software_id_contains(term) for term in terms)
+
+    if fuzzy and fuzzy_ids is not None:
+        for hits in fuzzy_ids.values():
+            memory_ids.update(hits)
+    elif fuzzy and dialect == "postgresql":
+        clauses.extend(
+            norm.op("%")(term) for term in terms if len(term) >= SIMILARITY_MIN_LENGTH
+        )
+
+    if memory_ids:
+        clauses.append(Firmware.id.in_(sorted(memory_ids)))
+
+    if not clauses:
+        return None
+
+    stmt = select(Firmware).where(or_(*clauses)).options(variant_loader(include_variants))
+    if hardware_id:
+        stmt = stmt.where(hardware_id_matches(hardware_id))
+    order = [match_tier(candidates, known)]
+    if normalize_id(prefer_hardware_id):
+        order.append(case((hardware_id_matches(prefer_hardware_id), 0), else_=1))
+    return (
+        stmt
+        .order_by(*order, func.length(norm), Firmware.id)
+        .limit(limit)
+    )
+
+
+async def estimate_total(db: AsyncSession, term: str, hardware_id: Optional[str] = None) -> int:
+    """
+    Сколько прошивок содержат term (оценка для пагинации).
+
+    In-memory индекс считает точно; без него - count по GIN pg_trgm,
+    ограниченный TOTAL_ESTIMATE_CAP строками.
+    """
+    if trigram_index.ready and not hardware_id:
+        return len(trigram_index.search(term))
+
+    matching = select(Firmware.id).where(software_id_contains(term))
+    if hardware_id:
+        matching = matching.where(hardware_id_matches(hardware_id))
+    capped = matching.limit(TOTAL_ESTIMATE_CAP).subquery()
+    return (await db.execute(select(func.count()).select_from(capped))).scalar()
+
+
+# =========================================================================
+# РАНЖИРОВАНИЕ
+# =========================================================================
+
+def _match_kind(
+    candidate: Dict,
+    firmware: Firmware,
+    tokens: List[str],
+    fuzzy: bool,
+    fuzzy_ids: Optional[Dict[str, Dict[int, float]]],
+) -> Optional[tuple]:
+    """(тип совпадения, вес) кандидата с прошивкой или None."""
+    term = candidate["norm"]
+    norm = firmware.software_id_norm or normalize_id(firmware.software_id)
+    if not norm:
+        return None
+    if norm == term:
+        if (firmware.software_id or "").strip().upper() == candidate["term"].strip().upper():
+            return "exact", MATCH_WEIGHTS["exact"]
+        return "normalized", MATCH_WEIGHTS["normalized"]
+    if term in tokens:
+        return "token", MATCH_WEIGHTS["token"]
+    if norm.startswith(term):
+        return "prefix", MATCH_WEIGHTS["prefix"]
+    if term in norm:
+        return "substring", MATCH_WEIGHTS["substring"]
+    if not fuzzy:
+        return None
+    distance = (fuzzy_ids or {}).get(term, {}).get(firmware.id)
+    if distance is not None:
+        return "fuzzy", MATCH_WEIGHTS["fuzzy"] / (1 + distance)
+    if len(term) >= SIMILARITY_MIN_LENGTH:
+        similarity = trigram_similarity(term, norm)
+        if similarity >= SIMILARITY_THRESHOLD:
+            return "similar", MATCH_WEIGHTS["similar"] * similarity
+    return None
+
+
+def rank_matches(
+    candidates: List[Dict],
+    firmwares: Iterable[Firmware],
+    k: int = 5,
+    fuzzy: bool = True,
+    fuzzy_ids: Optional[Dict[str, Dict[int, float]]] = None,
+    hardware_id: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Упорядоченный top-k: для каждой прошивки - лучший кандидат.
+
+    score = уверенность кандидата * вес совпадения; при равенстве -
+    прошивка с тем же HW номером (hardware_id), затем с ID ближе
+    по длине к кандидату, затем меньший id.
+    """
+    hardware_norm = normalize_id(hardware_id)
+    ranked = []
+    for firmware in firmwares:
+        tokens = (
+            split_id_tokens(firmware.software_id) + split_id_tokens(firmware.versions_info)
+        )
+        best = None
+        for candidate in candidates:
+            kind = _match_kind(candidate, firmware, tokens, fuzzy, fuzzy_ids)
+            if kind is None:
+                continue
+            score = candidate["confidence"] * kind[1]
+            if best is None or score > best["score"]:
+                best = {
+                    "firmware": firmware,
+                    "matched_id": candidate["term"],
+                    "source": candidate["source"],
+                    "match": kind[0],
+                    "score": round(score, 4),
+                    "hardware_match": bool(hardware_norm) and (
+                        firmware.hardware_id_norm or normalize_id(firmware.hardware_id)
+                    ).startswith(hardware_norm),
+                }
+        if best:
+            ranked.append(best)
+
+    ranked.sort(key=lambda r: (
+        -r["score"],
+        not r["hardware_match"],
+        abs(len(r["firmware"].software_id_norm or "") - len(normalize_id(r["matched_id"]))),
+        r["firmware"].id,
+    ))
+    return ranked[:k]
+
+
+def accepted_match(matches: List[Dict], total: Optional[int] = None) -> Optional[Dict]:
+    """
+    Совпадение, которое можно принять без подтверждения, или None.
+
+    Точный ID принимается всегда. Нормализованный ID и токен составного
+    ID - если ID не короче ACCEPT_MIN_LENGTH. Префикс и подстрока - если
+    к тому же совпадение однозначно: других прошивок с тем же ID нет
+    среди matches, а total (оценка числа совпадений, если известна)
+    не больше 1. Приблизительные (fuzzy, similar) не принимаются.
+    """
+    for match in matches:
+        if match["match"] == "exact":
+            return match
+        if match["match"] in APPROXIMATE_MATCHES:
+            continue
+        if len(normalize_id(match["matched_id"])) < ACCEPT_MIN_LENGTH:
+            continue
+        if match["match"] in ("normalized", "token"):
+            return match
+        ambiguous = (total is not None and total > 1) or any(
+            other is not match and other["matched_id"] == match["matched_id"]
+            and other["match"] not in APPROXIMATE_MATCHES
+            for other in matches
+        )
+        if not ambiguous:
+            return match
+    return None
+
+
+# =========================================================================
+# ПОИСК
+# =========================================================================
+
+async def lookup_candidates(
+    db: AsyncSession,
+    candidates: List[Dict],
+    k: int = 5,
+    fuzzy: bool = True,
+    include_variants: bool = False,
+    hardware_id: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Найти и ранжировать прошивки по кандидатам (один запрос к БД).
+
+    fuzzy=False - только точные, токены, префиксы и подстроки
+    (без похожих ID, когда ложное совпадение хуже отсутствия).
+    hardware_id - HW номер из парсера: при равных совпадениях выше
+    прошивка с этим HW (не фильтр).
+    """
+    candidates = unique_candidates(candidates)
+    if not candidates:
+        return []
+
+    fuzzy_ids = fuzzy_hits(c["norm"] for c in candidates) if fuzzy else None
+    stmt = candidates_query(
+        candidates, db.get_bind().dialect.name, fuzzy,
+        fuzzy_ids=fuzzy_ids, include_variants=include_variants, prefer_hardware_id=hardware_id,
+    )
+    if stmt is None:
+        return []
+    firmwares = (await db.execute(stmt)).unique().scalars().all()
+    return rank_matches(candidates, firmwares, k, fuzzy, fuzzy_ids, hardware_id)
+
+
+async def lookup_candidate_groups(
+    db: AsyncSession,
+    groups: List[List[Dict]],
+    k: Union[int, Sequence[int]] = 5,
+    fuzzy: Union[bool, Sequence[bool]] = True,
+    include_variants: bool = False,
+    hardware_ids: Optional[Sequence[Optional[str]]] = None,
+) -> List[List[Dict]]:
+    """
+    lookup_candidates для нескольких групп кандидатов одним запросом к БД.
+
+    Кандидаты всех групп объединяются в один SELECT (лимит строк -
+    MAX_ROWS на группу), найденные прошивки ранжируются по каждой
+    группе отдельно. k и fuzzy - общие или по одному на группу,
+    include_variants - Stage варианты тем же запросом, hardware_ids -
+    HW номер из парсера для каждой группы (как в lookup_candidates).
+    Возвращает top-k для каждой группы в том же порядке.
+    """
+    groups = [unique_candidates(group) for group in groups]
+    ks = [k] * len(groups) if isinstance(k, int) else list(k)
+    fuzzies = [fuzzy] * len(groups) if isinstance(fuzzy, bool) else list(fuzzy)
+    hardwares = list(hardware_ids) if hardware_ids is not None else [None] * len(groups)
+
+    merged = unique_candidates(c for group in groups for c in group)
+    fuzzy_ids = fuzzy_hits(c["norm"] for c in merged) if any(fuzzies) else None
+    stmt = None
+    if merged:
+        stmt = candidates_query(
+            merged, db.get_bind().dialect.name, any(fuzzies),
+            limit=MAX_ROWS * len(groups), fuzzy_ids=fuzzy_ids, include_variants=include_variants,
+        )
+    if stmt is None:
+        return [[] for _ in groups]
+
+    firmwares = (await db.execute(stmt)).unique().scalars().all()
+    return [
+        rank_matches(group, firmwares, group_k, group_fuzzy, fuzzy_ids, hardware) if group else []
+        for group, group_k, group_fuzzy, hardware in zip(groups, ks, fuzzies, hardwares)
+    ]
+
+
+async def ranked_search(
+    db: AsyncSession,
+    term: str,
+    k: int = DEFAULT_K,
+    fuzzy: bool = True,
+    hardware_id: Optional[str] = None,
+    include_variants: bool = False,
+) -> Dict:
+    """
+    Поиск по одному введённому ID: top-k и оценка общего числа совпадений.
+
+    Порядок: точный ID > нормализованный > токен составного ID >
+    префикс > подстрока > похожий (fuzzy), затем длина ID и id.
+    k ограничивается MAX_K. hardware_id - дополнительный фильтр,
+    include_variants - Stage варианты тем же запросом.
+
+    Returns:
+        {"results": [{"firmware", "match", "score", ...}], "total_estimate",
+         "accepted": совпадение из results для автоматического выбора или None}
+    """
+    k = max(1, min(k, MAX_K))
+    candidates = unique_candidates([make_candidate(term, CandidateSource.QUERY)])
+    if not candidates:
+        return {"results": [], "total_estimate": 0, "accepted": None}
+
+    fuzzy_ids = fuzzy_hits([candidates[0]["norm"]]) if fuzzy else None
+    stmt = candidates_query(
+        candidates, db.get_bind().dialect.name, fuzzy,
+        limit=k, fuzzy_ids=fuzzy_ids, hardware_id=hardware_id, include_variants=include_variants,
+    )
+    firmwares = (await db.execute(stmt)).unique().scalars().all() if stmt is not None else []
+    results = rank_matches(candidates, firmwares, k, fuzzy, fuzzy_ids, hardware_id)
+
+    total = max(await estimate_total(db, term, hardware_id), len(results))
+    return {"results": results, "total_estimate": total, "accepted": accepted_match(results, total)}
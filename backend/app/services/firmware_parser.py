@@ -96,6 +96,25 @@ class FirmwareParser:
         },
     }
     
+    # Hardware part numbers (the ECU itself, not the software on it)
+    HARDWARE_PATTERNS = {
+        # Bosch: 0261xxxxxx (petrol), 0281xxxxxx (diesel)
+        "bosch_hw": {
+            "regex": rb'(?<![0-9])02[68]1[0-9]{6}(?![0-9])',
+            "ecu": "Bosch",
+        },
+        # Denso: 275700-xxxx
+        "denso_hw": {
+            "regex": rb'275700-[0-9]{4}',
+            "ecu": "Denso",
+        },
+        # Continental/Siemens VDO: A2Cxxxxxxxx
+        "continental_hw": {
+            "regex": rb'A2C[0-9]{8,10}',
+            "ecu": "Continental",
+        },
+    }
+    
     # Known offsets where IDs are typically located
     KNOWN_OFFSETS = {
         "denso": [0x7E0, 0x7EC, 0x800, 0x1FFC, 0x2000],
@@ -144,11 +163,30 @@ class FirmwareParser:
             "file_size": len(data),
             "confidence": 0.0,
             "all_matches": [],
+            "hardware_matches": [],
         }
         
+        # Hardware part numbers first - they must not be taken for software IDs
+        hardware_ids = set()
+        for pattern_name, pattern_info in self.HARDWARE_PATTERNS.items():
+            matches = re.findall(pattern_info["regex"], data)
+            if matches:
+                match = matches[0].decode('ascii', errors='ignore')
+                hardware_ids.update(matches)
+                result["hardware_matches"].append({
+                    "pattern": pattern_name,
+                    "match": match,
+                    "count": len(matches),
+                })
+                if not result["hardware_id"]:
+                    result["hardware_id"] = match
+        
         # Try each pattern
         for pattern_name, pattern_info in self.PATTERNS.items():
-            matches = re.findall(pattern_info["regex"], data)
+            matches = [
+                m for m in re.findall(pattern_info["regex"], data)
+                if not any(m in hw for hw in hardware_ids)
+            ]
             if matches:
                 # Take first match as primary
                 match = matches[0].decode('ascii', errors='ignore')
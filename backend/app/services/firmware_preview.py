@@ -0,0 +1,357 @@
+"""
+Просмотр прошивок из Object Storage без скачивания целиком.
+
+- Блочный кеш на локальном диске поверх S3 range GET:
+  просмотр одного региона 8 MB образа скачивает только этот регион;
+  размер кеша ограничен, давно не читанные объекты удаляются (LRU по mtime)
+- Рендер тайлов: hex-дамп (JSON) и тепловая карта байтов (PNG)
+- Готовые тайлы кешируются в памяти, ETag зависит от ETag объекта
+"""
+import hashlib
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.services.s3_storage import s3_storage
+
+
+# Размер блока кеша (байт)
+CACHE_BLOCK_SIZE = 64 * 1024
+
+# Ограничения на размер тайла
+MAX_HEX_LENGTH = 64 * 1024
+MAX_HEATMAP_LENGTH = 1024 * 1024
+
+# Сколько секунд доверяем закешированным метаданным объекта
+OBJECT_INFO_TTL = 60
+
+# Очистка кеша - после записи такой доли лимита; удаляем до этой доли
+PRUNE_AFTER_WRITE_FRACTION = 0.1
+PRUNE_TARGET_FRACTION = 0.9
+
+# Объекты, читанные за последние секунды, не удаляются (их читают сейчас)
+PRUNE_MIN_IDLE_SECONDS = 60
+
+
+class BlockCache:
+    """Локальный кеш блоков объектов S3 (range GET только недостающих блоков)."""
+
+    def __init__(self, root: str, block_size: int = CACHE_BLOCK_SIZE, max_bytes: Optional[int] = None):
+        self.root = root
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._info: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        # Записано байт с последней очистки; None - очистка ещё не запускалась
+        self._written: Optional[int] = None
+
+    def _object_dir(self, key: str, etag: str) -> str:
+        digest = hashlib.sha1(f"{key}:{etag}".encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def object_info(self, key: str) -> Optional[Dict]:
+        """Метаданные объекта (размер, ETag) с коротким TTL."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._info.get(key)
+            if cached and now - cached[0] < OBJECT_INFO_TTL:
+                return cached[1]
+
+        info = s3_storage.get_object_info(key)
+        if info:
+            with self._lock:
+                self._info[key] = (now, info)
+        return info
+
+    def _store_block(self, directory: str, index: int, data: bytes) -> None:
+        path = os.path.join(directory, str(index))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._written = (self._written or 0) + len(data)
+
+    # =========================================================================
+    # ОГРАНИЧЕНИЕ РАЗМЕРА
+    # =========================================================================
+
+    def _maybe_prune(self) -> None:
+        """Очистка при первой записи и далее после каждых ~10% лимита."""
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._written is not None and self._written < self.max_bytes * PRUNE_AFTER_WRITE_FRACTION:
+                return
+            self._written = 0
+        self.prune()
+
+    def prune(self) -> Dict:
+        """
+        Удалить давно не читанные объекты, пока кеш больше
+        PRUNE_TARGET_FRACTION от лимита. Время последнего чтения -
+        mtime каталога объекта (обновляется в read), поэтому очистка
+        видит чтения всех воркеров с этим каталогом.
+        """
+        if not self._prune_lock.acquire(blocking=False):
+            return {"removed": 0, "size": None}
+        try:
+            objects = []
+            total = 0
+            for prefix in os.scandir(self.root) if os.path.isdir(self.root) else ():
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    try:
+                        size = sum(block.stat().st_size for block in os.scandir(entry.path))
+                        objects.append((entry.stat().st_mtime, size, entry.path))
+                    except FileNotFoundError:
+                        continue  # Удалён другим воркером
+                    total += size
+
+            target = self.max_bytes * PRUNE_TARGET_FRACTION
+            idle_before = time.time() - PRUNE_MIN_IDLE_SECONDS
+            removed = 0
+            for mtime, size, path in sorted(objects):
+                if total <= target or mtime > idle_before:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                removed += 1
+
+            if removed:
+                logger.info(f"Preview cache pruned: {removed} objects, {total / 1024 / 1024:.0f} MB left")
+            return {"removed": removed, "size": total}
+        finally:
+            self._prune_lock.release()
+
+    def _fetch_blocks(self, key: str, info: Dict, directory: str, first: int, last: int) -> None:
+        """Скачать блоки [first, last] одним range GET."""
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, info["size"]) - 1
+        response = s3_storage.client.get_object(
+            Bucket=s3_storage.bucket_name,
+            Key=key,
+            Range=f"bytes={start}-{end}",
+        )
+        data = response["Body"].read()
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            self._store_block(directory, index, data[offset:offset + self.block_size])
+
+    def _fetch_compressed(self, key: str, directory: str) -> None:
+        """
+        Сжатые (zstd) объекты не поддерживают range GET по исходным смещениям -
+        распаковываем поток один раз и кешируем все блоки.
+        """
+        buffer = b""
+        index = 0
+        for chunk in s3_storage.open_stream(key):
+            buffer += chunk
+            while len(buffer) >= self.block_size:
+                self._store_block(directory, index, buffer[:self.block_size])
+                buffer = buffer[self.block_size:]
+                index += 1
+        if buffer:
+            self._store_block(directory, index, buffer)
+
+    def read(self, key: str, offset: int, length: int) -> Tuple[bytes, Dict]:
+        """
+        Прочитать диапазон объекта через кеш.
+
+        Returns:
+            (данные, метаданные объекта)
+        """
+        info = self.object_info(key)
+        if info is None:
+            raise FileNotFoundError(key)
+
+        size = info["size"]
+        offset = max(0, min(offset, size))
+        length = max(0, min(length, size - offset))
+        if length == 0:
+            return b"", info
+
+        directory = self._object_dir(key, info["etag"] or "")
+        os.makedirs(directory, exist_ok=True)
+        # Отметка чтения для LRU-очистки
+        os.utime(directory)
+
+        first = offset // self.block_size
+        last = (offset + length - 1) // self.block_size
+        missing = [i for i in range(first, last + 1) if not os.path.exists(os.path.join(directory, str(i)))]
+
+        if missing:
+            if info["compressed"]:
+                self._fetch_compressed(key, directory)
+            else:
+                # Непрерывные серии недостающих блоков - по одному запросу на серию
+                run_start = prev = missing[0]
+                for index in missing[1:] + [None]:
+                    if index is not None and index == prev + 1:
+                        prev = index
+                        continue
+                    self._fetch_blocks(key, info, directory, run_start, prev)
+                    if index is not None:
+                        run_start = prev = index
+            self._maybe_prune()
+
+        parts = []
+        for index in range(first, last + 1):
+            with open(os.path.join(directory, str(index)), "rb") as f:
+                parts.append(f.read())
+        data = b"".join(parts)
+
+        start = offset - first * self.block_size
+        return data[start:start + length], info
+
+
+# =========================================================================
+# РЕНДЕР ТАЙЛОВ
+# =========================================================================
+
+def render_hex(data: bytes, offset: int, row_size: int = 16) -> List[Dict]:
+    """Hex-дамп: строки {offset, hex, ascii}."""
+    rows = []
+    for i in range(0, len(data), row_size):
+        row = data[i:i + row_size]
+        rows.append({
+            "offset": f"{offset + i:08X}",
+            "hex": row.hex(" ").upper(),
+            "ascii": "".join(chr(b) if 32 <= b < 127 else "." for b in row),
+        })
+    return rows
+
+
+def _heat_palette() -> np.ndarray:
+    """Палитра 256 цветов: синий -> зелёный -> жёлтый -> красный."""
+    x = np.linspace(0.0, 1.0, 256)
+    r = np.clip(2.0 * x - 0.5, 0.0, 1.0)
+    g = np.clip(2.0 - np.abs(4.0 * x - 2.0), 0.0, 1.0)
+    b = np.clip(1.5 - 3.0 * x, 0.0, 1.0)
+    return (np.stack([r, g, b], axis=1) * 255).astype(np.uint8)
+
+
+_PALETTE = _heat_palette()
+
+
+def _png_chunk(tag: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload)) + tag + payload + struct.pack(">I", zlib.crc32(tag + payload))
+
+
+def render_heatmap(data: bytes, width: int = 256, word_size: int = 1, big_endian: bool = False) -> bytes:
+    """
+    Тепловая карта значений (PNG, RGB). Один пиксель - одно слово (8 или 16 бит).
+    """
+    if word_size == 2:
+        usable = len(data) - len(data) % 2
+        values = np.frombuffer(data[:usable], dtype=">u2" if big_endian else "<u2")
+        levels = (values >> 8).astype(np.uint8)
+    else:
+        levels = np.frombuffer(data, dtype=np.uint8)
+
+    height = max(1, -(-len(levels) // width))
+    pixels = np.zeros(height * width, dtype=np.uint8)
+    pixels[:len(levels)] = levels
+    rgb = _PALETTE[pixels.reshape(height, width)]
+
+    # Каждая строка PNG начинается с байта фильтра (0 - без фильтра)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+class TilePreviewService:
+    """Тайлы hex/heatmap с кешем готовых тайлов и ETag."""
+
+    def __init__(self, cache: BlockCache, max_tiles: int = 512):
+        self.cache = cache
+        self.max_tiles = max_tiles
+        self._tiles: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tile_etag(key: str, object_etag: Optional[str], kind: str, *params) -> str:
+        raw = "|".join(str(p) for p in (key, object_etag, kind) + params)
+        return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+    def current_etag(self, key: str, kind: str, *params) -> Optional[str]:
+        """ETag тайла без рендера (для If-None-Match)."""
+        info = self.cache.object_info(key)
+        if info is None:
+            return None
+        return self.tile_etag(key, info["etag"], kind, *params)
+
+    def _cached(self, etag: str, render):
+        with self._lock:
+            if etag in self._tiles:
+                self._tiles.move_to_end(etag)
+                return self._tiles[etag]
+
+        tile = render()
+        with self._lock:
+            self._tiles[etag] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def hex_tile(self, key: str, offset: int, length: int) -> Tuple[Dict, str]:
+        length = min(length, MAX_HEX_LENGTH)
+        etag = self.current_etag(key, "hex", offset, length)
+        if etag is None:
+            raise FileNotFoundError(key)
+
+        def render():
+            data, info = self.cache.read(key, offset, length)
+            return {
+                "key": key,
+                "offset": offset,
+                "length": len(data),
+                "file_size": info["size"],
+                "rows": render_hex(data, offset),
+            }
+
+        return self._cached(etag, render), etag
+
+    def heatmap_tile(
+        self,
+        key: str,
+        offset: int,
+        length: int,
+        width: int = 256,
+        word_size: int = 1,
+        big_endian: bool = False,
+    ) -> Tuple[bytes, str]:
+        length = min(length, MAX_HEATMAP_LENGTH)
+        etag = self.current_etag(key, "heatmap", offset, length, width, word_size, big_endian)
+        if etag is None:
+            raise FileNotFoundError(key)
+
+        def render():
+            data, _ = self.cache.read(key, offset, length)
+            return render_heatmap(data, width, word_size, big_endian)
+
+        return self._cached(etag, render), etag
+
+
+# Глобальный экземпляр
+preview_service = TilePreviewService(
+    BlockCache(settings.PREVIEW_CACHE_PATH, max_bytes=settings.PREVIEW_CACHE_MAX_BYTES)
+)
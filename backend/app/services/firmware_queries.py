@@ -0,0 +1,26 @@
+"""
+SQL-выражения для поиска прошивок.
+
+Выражения совпадают с индексами из migrations/005_add_trigram_indexes.sql,
+migrations/006_add_software_id_norm.sql и 009_add_hardware_id_norm.sql, иначе планировщик не использует
+их и читает всю таблицу. Ранжирование и LIMIT - в firmware_lookup
+(candidates_query, ranked_search).
+"""
+from app.models.firmware import Firmware
+from app.services.firmware_ids import normalize_id
+
+
+def software_id_contains(term: str):
+    """
+    software_id_norm LIKE '%TERM%' - подстрока без учёта регистра,
+    разделителей и OCR-двойников (GIN индекс idx_firmwares_software_id_norm_trgm).
+    """
+    return Firmware.software_id_norm.like(f"%{normalize_id(term)}%")
+
+
+def hardware_id_matches(term: str):
+    """
+    hardware_id_norm LIKE 'TERM%' - HW номер целиком или его начало
+    (вместе с software_id_norm - составной индекс idx_firmwares_software_hardware_norm).
+    """
+    return Firmware.hardware_id_norm.like(f"{normalize_id(term)}%")
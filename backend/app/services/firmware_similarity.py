@@ -0,0 +1,239 @@
+"""
+Индекс похожести бинарных прошивок (MinHash + LSH).
+
+Когда ID не найден в базе, загруженный файл часто оказывается
+ревизией уже известного стока. Файл режется на блоки по содержимому
+(см. chunking), по множеству хешей блоков строится MinHash-сигнатура,
+а LSH-бандинг позволяет за миллисекунды найти кандидатов
+без перебора всего каталога.
+"""
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.services.chunking import CHUNKING_SCHEME, chunk_boundaries, hash_constants
+
+
+# Простое число чуть меньше 2^32: a * x + b помещается в uint64
+_PRIME = np.uint64(4294967291)
+
+# Схема сигнатур (хеши блоков + перестановки MinHash + разбиение);
+# пишется в сохранённый индекс, индекс другой схемы не загружается
+SIMILARITY_SCHEME = f"minhash-blake2b-v1/{CHUNKING_SCHEME}"
+
+
+class FirmwareSimilarityIndex:
+    """
+    MinHash/LSH индекс по стоковым файлам каталога.
+
+    Ключ индекса - Firmware.id. Сигнатуры хранятся матрицей (N, num_perm),
+    LSH-корзины пересобираются из неё при загрузке с диска.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        num_perm: int = 128,
+        bands: int = 32,
+        chunk_avg_size: int = 1024,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.chunk_avg_size = chunk_avg_size
+
+        # Коэффициенты перестановок a*x + b (a != 0)
+        self._a = hash_constants("minhash-a", num_perm, int(_PRIME) - 1, offset=1)
+        self._b = hash_constants("minhash-b", num_perm, int(_PRIME))
+
+        self._lock = threading.Lock()
+        self._ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+        # Первые len(self._ids) строк заняты, ёмкость растёт удвоением
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._buckets: Dict[Tuple[int, bytes], Set[int]] = defaultdict(set)
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # =========================================================================
+    # СИГНАТУРЫ
+    # =========================================================================
+
+    def _block_hashes(self, data: bytes) -> np.ndarray:
+        """Уникальные 32-битные хеши блоков файла."""
+        view = memoryview(data)
+        hashes = [
+            int.from_bytes(hashlib.blake2b(view[start:end], digest_size=4).digest(), "little")
+            for start, end in chunk_boundaries(
+                data,
+                avg_size=self.chunk_avg_size,
+                min_size=self.chunk_avg_size // 4,
+                max_size=self.chunk_avg_size * 4,
+            )
+        ]
+        return np.unique(np.array(hashes, dtype=np.uint64))
+
+    def signature(self, data: bytes) -> np.ndarray:
+        """MinHash-сигнатура файла: минимум (a*x + b) mod p по всем блокам."""
+        shingles = self._block_hashes(data)
+        if shingles.size == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+        permuted = (shingles[:, None] * self._a[None, :] + self._b[None, :]) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    # =========================================================================
+    # ДОБАВЛЕНИЕ / ПОИСК
+    # =========================================================================
+
+    def add(self, firmware_id: int, data: bytes) -> None:
+        """Добавить (или заменить) стоковый файл прошивки в индексе."""
+        self.add_signature(firmware_id, self.signature(data))
+
+    def add_signature(self, firmware_id: int, signature: np.ndarray) -> None:
+        """Добавить готовую сигнатуру (инкрементальное обновление)."""
+        with self._lock:
+            position = self._positions.get(firmware_id)
+            if position is not None:
+                for key in self._band_keys(self._signatures[position]):
+                    self._buckets[key].discard(firmware_id)
+                self._signatures[position] = signature
+            else:
+                position = len(self._ids)
+                if position == len(self._signatures):
+                    grown = np.empty((max(64, position * 2), self.num_perm), dtype=np.uint32)
+                    grown[:position] = self._signatures
+                    self._signatures = grown
+                self._signatures[position] = signature
+                self._positions[firmware_id] = position
+                self._ids.append(firmware_id)
+
+            for key in self._band_keys(signature):
+                self._buckets[key].add(firmware_id)
+
+    def query(
+        self,
+        data: bytes,
+        k: int = 5,
+        min_similarity: float = 0.3,
+    ) -> List[Dict]:
+        """
+        Найти top-k наиболее похожих прошивок каталога.
+
+        Returns:
+            Список {"firmware_id", "similarity"} по убыванию похожести
+        """
+        self.ensure_loaded()
+        return self.query_signature(self.signature(data), k, min_similarity)
+
+    def query_signature(
+        self,
+        signature: np.ndarray,
+        k: int = 5,
+        min_similarity: float = 0.3,
+    ) -> List[Dict]:
+        """Поиск по готовой сигнатуре."""
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            if not candidates:
+                return []
+
+            ids = list(candidates)
+            rows = self._signatures[[self._positions[i] for i in ids]]
+
+        # Доля совпавших минхешей - оценка сходства Жаккара
+        scores = (rows == signature[None, :]).mean(axis=1)
+        order = np.argsort(-scores, kind="stable")[:k]
+
+        return [
+            {"firmware_id": ids[i], "similarity": round(float(scores[i]), 3)}
+            for i in order
+            if scores[i] >= min_similarity
+        ]
+
+    # =========================================================================
+    # ПЕРСИСТЕНТНОСТЬ
+    # =========================================================================
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Сохранить сигнатуры на диск (атомарно через временный файл)."""
+        path = path or self.path
+        if not path:
+            raise ValueError("Index path is not configured")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self._ids, dtype=np.int64),
+                    signatures=self._signatures[:len(self._ids)],
+                    params=np.array([self.num_perm, self.bands, self.chunk_avg_size]),
+                    scheme=np.array(SIMILARITY_SCHEME),
+                )
+            # Под блокировкой: параллельное сохранение пишет тот же tmp_path
+            os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Загрузить сигнатуры с диска и пересобрать LSH-корзины."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+
+        with np.load(path) as stored:
+            scheme = str(stored["scheme"]) if "scheme" in stored.files else None
+            if scheme != SIMILARITY_SCHEME:
+                logger.warning(f"Similarity index {path} built with scheme {scheme}, ignoring (rebuild it)")
+                return False
+            params = stored["params"].tolist()
+            if params != [self.num_perm, self.bands, self.chunk_avg_size]:
+                logger.warning(f"Similarity index {path} built with other params {params}, ignoring")
+                return False
+            ids = stored["ids"].tolist()
+            signatures = stored["signatures"].astype(np.uint32)
+
+        with self._lock:
+            self._ids = ids
+            self._positions = {firmware_id: i for i, firmware_id in enumerate(ids)}
+            self._signatures = signatures
+            self._buckets = defaultdict(set)
+            for firmware_id, signature in zip(ids, signatures):
+                for key in self._band_keys(signature):
+                    self._buckets[key].add(firmware_id)
+            self._loaded = True
+
+        logger.info(f"Similarity index loaded: {len(ids)} firmwares")
+        return True
+
+    def ensure_loaded(self) -> None:
+        """Ленивая загрузка индекса при первом запросе."""
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+
+
+# Глобальный экземпляр
+similarity_index = FirmwareSimilarityIndex(
+    path=os.path.join(settings.INDEX_STORAGE_PATH, "similarity.npz")
+)
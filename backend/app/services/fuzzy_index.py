@@ -0,0 +1,194 @@
+"""
+Нечёткий поиск ID прошивок с учётом ошибок OCR.
+
+ID со скриншотов приходят с заменами O/0, I/1, S/5, B/8 или без
+одного символа. Индекс в стиле SymSpell: для каждого нормализованного
+ID (OCR-двойники уже свёрнуты) хранятся варианты с одним удалённым
+символом. Запрос порождает свои удаления и находит кандидатов
+словарными обращениями - это покрывает пропуск, лишний символ и одну
+замену. Кандидаты ранжируются расстоянием Дамерау-Левенштейна, где
+замена OCR-двойников почти бесплатна.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.services.catalog_delta import CatalogDelta
+from app.services.firmware_ids import compact_id, normalize_id
+
+
+# Пары символов, которые OCR путает (стоимость замены CONFUSION_COST)
+CONFUSABLE_PAIRS = [
+    ("O", "0"), ("Q", "0"), ("D", "0"), ("O", "Q"), ("O", "D"),
+    ("I", "1"), ("L", "1"), ("I", "L"), ("T", "1"),
+    ("S", "5"), ("B", "8"), ("Z", "2"), ("G", "6"), ("A", "4"),
+]
+CONFUSION_COST = 0.25
+
+_CONFUSABLE = {frozenset(pair) for pair in CONFUSABLE_PAIRS}
+
+# Расстояние, дальше которого кандидаты не возвращаются
+DEFAULT_MAX_DISTANCE = 2.0
+
+# Короче - слишком много случайных совпадений
+MIN_QUERY_LENGTH = 5
+
+
+def substitution_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    return CONFUSION_COST if frozenset((a, b)) in _CONFUSABLE else 1.0
+
+
+def confusion_distance(a: str, b: str) -> float:
+    """
+    Взвешенное расстояние Дамерау-Левенштейна (OSA) между компактными ID.
+
+    Вставка, удаление и перестановка соседних символов - 1,
+    замена OCR-двойников - CONFUSION_COST, остальные замены - 1.
+    """
+    rows = len(a) + 1
+    cols = len(b) + 1
+    prev_prev: List[float] = []
+    prev = [float(j) for j in range(cols)]
+    for i in range(1, rows):
+        current = [float(i)] + [0.0] * (cols - 1)
+        for j in range(1, cols):
+            current[j] = min(
+                prev[j] + 1.0,
+                current[j - 1] + 1.0,
+                prev[j - 1] + substitution_cost(a[i - 1], b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], prev_prev[j - 2] + 1.0)
+        prev_prev, prev = prev, current
+    return prev[-1]
+
+
+def deletes(value: str) -> Set[str]:
+    """Варианты строки с одним удалённым символом."""
+    return {value[:i] + value[i + 1:] for i in range(len(value))}
+
+
+class FuzzyIdIndex:
+    """Индекс удалений (SymSpell, расстояние 1) по нормализованным software_id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # нормализованный ID -> {firmware_id: (компактный, исходный software_id)}
+        self._ids: Dict[str, Dict[int, Tuple[str, str]]] = {}
+        # вариант с удалением -> нормализованные ID
+        self._deletes: Dict[str, Set[str]] = {}
+        self._norms: Dict[int, str] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._norms)
+
+    # =========================================================================
+    # ПОСТРОЕНИЕ
+    # =========================================================================
+
+    def _add(self, ids, delete_map, norms, firmware_id: int, software_id: Optional[str]) -> None:
+        norm = normalize_id(software_id)
+        if not norm:
+            return
+        if norm not in ids:
+            ids[norm] = {}
+            for variant in deletes(norm):
+                delete_map.setdefault(variant, set()).add(norm)
+        ids[norm][firmware_id] = (compact_id(software_id), software_id)
+        norms[firmware_id] = norm
+
+    def _discard(self, firmware_id: int) -> None:
+        norm = self._norms.pop(firmware_id, None)
+        if norm is None:
+            return
+        owners = self._ids.get(norm, {})
+        owners.pop(firmware_id, None)
+        if not owners:
+            self._ids.pop(norm, None)
+            for variant in deletes(norm):
+                self._deletes.get(variant, set()).discard(norm)
+
+    def rebuild(self, rows: Iterable[Tuple[int, Optional[str]]]) -> None:
+        """Полная пересборка из (firmware_id, software_id)."""
+        ids: Dict[str, Dict[int, Tuple[str, str]]] = {}
+        delete_map: Dict[str, Set[str]] = {}
+        norms: Dict[int, str] = {}
+        for firmware_id, software_id in rows:
+            self._add(ids, delete_map, norms, firmware_id, software_id)
+
+        with self._lock:
+            self._ids = ids
+            self._deletes = delete_map
+            self._norms = norms
+            self.ready = True
+
+    def upsert(self, firmware_id: int, software_id: Optional[str]) -> None:
+        with self._lock:
+            self._discard(firmware_id)
+            self._add(self._ids, self._deletes, self._norms, firmware_id, software_id)
+
+    def remove(self, firmware_id: int) -> None:
+        with self._lock:
+            self._discard(firmware_id)
+
+    # =========================================================================
+    # ПОИСК
+    # =========================================================================
+
+    def search(self, query: str, k: int = 5, max_distance: float = DEFAULT_MAX_DISTANCE) -> List[Dict]:
+        """
+        Ближайшие ID каталога: [{"firmware_id", "software_id", "distance"}].
+
+        Порядок: расстояние, затем firmware_id.
+        """
+        norm = normalize_id(query)
+        compact = compact_id(query)
+        if len(norm) < MIN_QUERY_LENGTH:
+            return []
+
+        with self._lock:
+            # Совпадение целиком, лишний символ в запросе, пропуск, одна замена
+            candidates = set()
+            if norm in self._ids:
+                candidates.add(norm)
+            query_deletes = deletes(norm)
+            candidates.update(d for d in query_deletes if d in self._ids)
+            candidates.update(self._deletes.get(norm, ()))
+            for variant in query_deletes:
+                candidates.update(self._deletes.get(variant, ()))
+
+            hits = []
+            for candidate in candidates:
+                for firmware_id, (candidate_compact, software_id) in self._ids[candidate].items():
+                    distance = confusion_distance(compact, candidate_compact)
+                    if distance <= max_distance:
+                        hits.append((distance, firmware_id, software_id))
+
+        hits.sort()
+        return [
+            {"firmware_id": firmware_id, "software_id": software_id, "distance": round(distance, 2)}
+            for distance, firmware_id, software_id in hits[:k]
+        ]
+
+    # =========================================================================
+    # ОБНОВЛЕНИЕ ИЗ КАТАЛОГА
+    # =========================================================================
+
+    def apply(self, delta: CatalogDelta) -> None:
+        """Применить изменения каталога (app/services/catalog_delta.py)."""
+        if delta.full:
+            self.rebuild((row.id, row.software_id) for row in delta.rows)
+            logger.info(f"Fuzzy ID index rebuilt: {len(delta.rows)} firmwares, {len(self._deletes)} deletes")
+            return
+        for row in delta.rows:
+            self.upsert(row.id, row.software_id)
+        for firmware_id in delta.removed:
+            self.remove(firmware_id)
+
+
+# Глобальный экземпляр
+fuzzy_index = FuzzyIdIndex()
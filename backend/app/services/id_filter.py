@@ -0,0 +1,208 @@
+"""
+Bloom-фильтр известных ID каталога.
+
+Большинство кандидатов из OCR и имён файлов - мусорные строки, которых
+нет в каталоге. Фильтр по всем нормализованным ID и токенам составных
+ID отвечает "точно нет" без обращения к БД (ложноположительные ответы
+возможны, ложноотрицательные - нет). Точный поиск и поиск по токенам
+делают запрос только для кандидатов, прошедших фильтр.
+
+Фильтр собирается при старте из строк каталога и дополняется
+изменениями (catalog_delta); копия сохраняется в INDEX_STORAGE_PATH.
+"""
+import hashlib
+import math
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.firmware import Firmware
+from app.services.catalog_delta import CatalogDelta
+from app.services.firmware_ids import normalize_id, split_id_tokens
+
+
+class BloomFilter:
+    """Bloom-фильтр на битовом массиве numpy (double hashing по BLAKE2b)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, value: str) -> List[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value: str) -> bool:
+        """
+        Добавить значение. Уже присутствующее (все биты стоят) не
+        считается в count - повторные добавления не заполняют фильтр.
+        """
+        positions = self._positions(value)
+        if self._has(positions):
+            return False
+        for position in positions:
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        return True
+
+    def _has(self, positions: List[int]) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def __contains__(self, value: str) -> bool:
+        return self._has(self._positions(value))
+
+    def save(self, path: str, **meta) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            bits=self.bits,
+            params=np.array([self.capacity, self.num_bits, self.num_hashes, self.count], dtype=np.int64),
+            error_rate=np.array([self.error_rate]),
+            **{name: np.array([value]) for name, value in meta.items()},
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["BloomFilter", dict]:
+        with np.load(path) as data:
+            capacity, num_bits, num_hashes, count = (int(v) for v in data["params"])
+            bloom = cls.__new__(cls)
+            bloom.capacity = capacity
+            bloom.error_rate = float(data["error_rate"][0])
+            bloom.num_bits = num_bits
+            bloom.num_hashes = num_hashes
+            bloom.bits = data["bits"].copy()
+            bloom.count = count
+            meta = {name: data[name][0].item() for name in data.files
+                    if name not in ("bits", "params", "error_rate")}
+        return bloom, meta
+
+
+def catalog_ids(software_id: Optional[str], versions_info: Optional[str]) -> List[str]:
+    """Все нормализованные ID прошивки: software_id_norm и токены составных ID."""
+    ids = split_id_tokens(software_id) + split_id_tokens(versions_info)
+    norm = normalize_id(software_id)
+    if norm:
+        ids.append(norm)
+    return ids
+
+
+class CatalogIdFilter:
+    """Фильтр "может ли такой ID быть в каталоге" по строкам каталога."""
+
+    # Запас ёмкости относительно каталога (для инкрементальных добавлений)
+    HEADROOM = 1.5
+
+    def __init__(self, path: str, error_rate: float = 0.001):
+        self.path = path
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom: Optional[BloomFilter] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def might_contain(self, value: str) -> bool:
+        """False - ID точно нет в каталоге. Фильтр не загружен - всегда True."""
+        bloom = self._bloom
+        if bloom is None:
+            return True
+        norm = normalize_id(value)
+        return bool(norm) and norm in bloom
+
+    def contains_many(self, values: Iterable[str]) -> List[bool]:
+        return [self.might_contain(value) for value in values]
+
+    # =========================================================================
+    # ПОСТРОЕНИЕ
+    # =========================================================================
+
+    def rebuild(
+        self,
+        rows: Iterable[Tuple[Optional[str], Optional[str]]],
+        save: bool = True,
+    ) -> int:
+        """Полная пересборка из (software_id, versions_info)."""
+        ids = set()
+        for software_id, versions_info in rows:
+            ids.update(catalog_ids(software_id, versions_info))
+
+        bloom = BloomFilter(int(len(ids) * self.HEADROOM) + 1024, self.error_rate)
+        for value in ids:
+            bloom.add(value)
+
+        with self._lock:
+            self._bloom = bloom
+        if save:
+            self.save()
+        return len(ids)
+
+    def add(self, software_id: Optional[str], versions_info: Optional[str]) -> int:
+        """Добавить ID прошивки. Возвращает число новых (ранее не входивших) ID."""
+        with self._lock:
+            if self._bloom is None:
+                return 0
+            return sum(self._bloom.add(value) for value in catalog_ids(software_id, versions_info))
+
+    def save(self) -> None:
+        if self._bloom is not None:
+            self._bloom.save(self.path)
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        bloom, _ = BloomFilter.load(self.path)
+        with self._lock:
+            self._bloom = bloom
+        logger.info(f"ID filter loaded: {bloom.count} ids, {bloom.num_bits // 8 // 1024} KB")
+        return True
+
+    # =========================================================================
+    # ОБНОВЛЕНИЕ ИЗ КАТАЛОГА
+    # =========================================================================
+
+    @property
+    def overfilled(self) -> bool:
+        """Добавлений больше расчётной ёмкости - нужна полная пересборка."""
+        bloom = self._bloom
+        return bloom is not None and bloom.count > bloom.capacity
+
+    def apply(self, delta: CatalogDelta) -> None:
+        """
+        Применить изменения каталога (app/services/catalog_delta.py).
+        Удалённые ID остаются в фильтре до полной пересборки
+        (это лишь ложноположительные ответы).
+        """
+        if delta.full:
+            count = self.rebuild((row.software_id, row.versions_info) for row in delta.rows)
+            logger.info(f"ID filter rebuilt: {count} ids")
+            return
+        added = sum(self.add(row.software_id, row.versions_info) for row in delta.rows)
+        if added:
+            self.save()
+
+
+# Глобальный экземпляр
+id_filter = CatalogIdFilter(os.path.join(settings.INDEX_STORAGE_PATH, "id_filter.npz"))
+
+
+@event.listens_for(Session, "after_flush")
+def _add_flushed_firmwares(session: Session, flush_context) -> None:
+    """Новые и изменённые прошивки попадают в фильтр сразу, не дожидаясь обновления."""
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Firmware):
+            id_filter.add(obj.software_id, obj.versions_info)
@@ -0,0 +1,43 @@
+"""
+Токены составных ID прошивок (таблица firmware_id_tokens).
+
+Заполняются при импорте каталога; поиск по ним - точное
+совпадение по btree индексу, без сканирования '%...%'.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.firmware import Firmware
+from app.models.firmware_id_token import FirmwareIdToken, TokenSource
+from app.services.firmware_ids import split_id_tokens
+
+
+def firmware_token_rows(
+    firmware_id: int,
+    software_id: Optional[str],
+    versions_info: Optional[str],
+) -> List[Dict]:
+    """Строки firmware_id_tokens для одной прошивки."""
+    rows = []
+    for source_field, value in (
+        (TokenSource.SOFTWARE_ID, software_id),
+        (TokenSource.VERSIONS_INFO, versions_info),
+    ):
+        for position, token in enumerate(split_id_tokens(value)):
+            rows.append({
+                "firmware_id": firmware_id,
+                "token": token,
+                "source_field": source_field,
+                "position": position,
+            })
+    return rows
+
+
+async def replace_firmware_tokens(db: AsyncSession, firmware: Firmware) -> int:
+    """Перестроить токены прошивки (firmware должна иметь id - после flush)."""
+    await db.execute(delete(FirmwareIdToken).where(FirmwareIdToken.firmware_id == firmware.id))
+    rows = firmware_token_rows(firmware.id, firmware.software_id, firmware.versions_info)
+    db.add_all(FirmwareIdToken(**row) for row in rows)
+    return len(rows)
@@ -3,14 +3,29 @@ Yandex Object Storage (S3-совместимый) сервис для хране
 
 Использует boto3 для работы с Yandex Cloud Object Storage.
 Presigned URLs для безопасной выдачи файлов клиентам.
+
+Опционально файлы сжимаются zstd на лету (S3_COMPRESSION).
+Сжатые объекты хранятся с суффиксом .zst и метаданными
+encoding/original-size и отдаются клиенту через бэкенд
+с потоковой распаковкой - для клиента ничего не меняется.
 """
 import boto3
+import zstandard
 from botocore.exceptions import ClientError
 from datetime import datetime
 import os
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, Iterator
+from urllib.parse import quote
 
 from app.core.config import settings
+from app.core.security import create_download_token
+
+
+# Суффикс ключа сжатых объектов
+COMPRESSED_SUFFIX = ".zst"
+
+# Размер блока при потоковом чтении
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class S3Storage:
@@ -38,40 +53,64 @@ class S3Storage:
         self,
         file_obj: BinaryIO,
         filename: str,
-        content_type: str = 'application/octet-stream'
+        content_type: str = 'application/octet-stream',
+        compress: Optional[bool] = None
     ) -> dict:
         """
         Загрузить файл в Object Storage.
         
         Args:
-            file_obj: Файловый объект для загрузки
+            file_obj: Файловый объект для загрузки (seekable)
             filename: Имя файла в хранилище
             content_type: MIME-тип файла
+            compress: Сжать zstd (по умолчанию - settings.S3_COMPRESSION)
             
         Returns:
             dict с информацией о загруженном файле
+            (size - исходный размер, stored_size - размер в хранилище)
         """
+        if compress is None:
+            compress = settings.S3_COMPRESSION
+        
         try:
             # Уникальное имя с датой
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
             key = f"firmwares/{timestamp}_{filename}"
+            extra_args = {'ContentType': content_type}
+            original_size = None
+            
+            if compress:
+                # Исходный размер - в метаданные, сжатие потоком без копии в памяти
+                file_obj.seek(0, os.SEEK_END)
+                original_size = file_obj.tell()
+                file_obj.seek(0)
+                
+                key += COMPRESSED_SUFFIX
+                extra_args['Metadata'] = {
+                    'encoding': 'zstd',
+                    'original-size': str(original_size),
+                }
+                compressor = zstandard.ZstdCompressor(level=settings.S3_COMPRESSION_LEVEL)
+                file_obj = compressor.stream_reader(file_obj, size=original_size)
             
             self.client.upload_fileobj(
                 file_obj,
                 self.bucket_name,
                 key,
-                ExtraArgs={'ContentType': content_type}
+                ExtraArgs=extra_args
             )
             
             # Получить размер файла
             response = self.client.head_object(Bucket=self.bucket_name, Key=key)
-            size = response.get('ContentLength', 0)
+            stored_size = response.get('ContentLength', 0)
             
             return {
                 'success': True,
                 'key': key,
                 'filename': filename,
-                'size': size,
+                'size': original_size if original_size is not None else stored_size,
+                'stored_size': stored_size,
+                'compressed': compress,
                 'bucket': self.bucket_name,
                 'uploaded_at': datetime.utcnow().isoformat()
             }
@@ -83,6 +122,19 @@ class S3Storage:
                 'filename': filename
             }
     
+    @staticmethod
+    def is_compressed(key: str) -> bool:
+        """Объект сохранён сжатым (zstd)."""
+        return key.endswith(COMPRESSED_SUFFIX)
+    
+    @staticmethod
+    def download_filename(key: str) -> str:
+        """Имя файла для клиента (без суффикса .zst)."""
+        filename = key.split('/')[-1]
+        if filename.endswith(COMPRESSED_SUFFIX):
+            filename = filename[:-len(COMPRESSED_SUFFIX)]
+        return filename
+    
     def generate_download_url(
         self,
         key: str,
@@ -96,6 +148,9 @@ class S3Storage:
         - Нельзя передать другу через день
         - Клиент качает напрямую с Yandex Cloud
         
+        Для сжатых объектов ссылка ведёт на бэкенд (подписанный токен
+        с тем же временем жизни), который распаковывает файл на лету.
+        
         Args:
             key: Ключ (путь) файла в хранилище
             expires_in: Время жизни ссылки в секундах (по умолчанию 1 час)
@@ -103,6 +158,10 @@ class S3Storage:
         Returns:
             Presigned URL или None при ошибке
         """
+        if self.is_compressed(key):
+            token = create_download_token(key, expires_in)
+            return f"{settings.PUBLIC_API_URL}/files/download?token={quote(token)}"
+        
         try:
             url = self.client.generate_presigned_url(
                 'get_object',
@@ -116,6 +175,56 @@ class S3Storage:
         except ClientError:
             return None
     
+    def get_object_info(self, key: str) -> Optional[dict]:
+        """
+        Метаданные объекта: исходный и хранимый размер, сжатие.
+        
+        Returns:
+            dict или None если объекта нет
+        """
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError:
+            return None
+        
+        metadata = response.get('Metadata', {})
+        stored_size = response.get('ContentLength', 0)
+        compressed = metadata.get('encoding') == 'zstd'
+        return {
+            'key': key,
+            'compressed': compressed,
+            'stored_size': stored_size,
+            'size': int(metadata.get('original-size', stored_size)) if compressed else stored_size,
+            'etag': response.get('ETag'),
+        }
+    
+    def open_stream(self, key: str) -> Iterator[bytes]:
+        """
+        Потоковое чтение файла с прозрачной распаковкой zstd.
+        
+        Args:
+            key: Ключ (путь) файла в хранилище
+            
+        Yields:
+            Блоки исходных (распакованных) данных
+        """
+        response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        body = response['Body']
+        
+        if response.get('Metadata', {}).get('encoding') == 'zstd':
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+        else:
+            reader = body
+        
+        try:
+            while True:
+                chunk = reader.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+    
     def delete_file(self, key: str) -> bool:
         """
         Удалить файл из хранилища.
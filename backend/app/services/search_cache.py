@@ -0,0 +1,229 @@
+"""
+Кеш результатов поиска прошивок в Redis.
+
+Ключ - нормализованный ID (GET поиск) или SHA-256 файла и имени
+(POST поиск). Найденные и ненайденные результаты живут с разными TTL.
+Каждая запись хранит версию каталога; версия увеличивается при любом
+изменении прошивок (ORM коммит, импорт WinOLS), и все старые записи
+сразу становятся промахами.
+
+Эндпоинты поиска работают через асинхронный клиент (aget/aset),
+скрипты и события сессии - через синхронный. Redis недоступен -
+поиск работает без кеша.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.firmware_ids import normalize_id
+
+
+VERSION_KEY = "search:catalog_version"
+KEY_PREFIX = "search:v1:"
+
+# После ошибки соединения не обращаемся к Redis столько секунд
+RETRY_AFTER_SECONDS = 30
+
+
+class SearchCache:
+    """Кеш ответов поиска с инвалидацией по версии каталога."""
+
+    def __init__(self, url: str, ttl: int, negative_ttl: int, enabled: bool = True):
+        self.url = url
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self._client: Optional[redis.Redis] = None
+        self._async_client: Optional[aioredis.Redis] = None
+        self._retry_at = 0.0
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                self.url,
+                socket_timeout=0.2,
+                socket_connect_timeout=0.2,
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> aioredis.Redis:
+        if self._async_client is None:
+            self._async_client = aioredis.Redis.from_url(
+                self.url,
+                socket_timeout=0.2,
+                socket_connect_timeout=0.2,
+            )
+        return self._async_client
+
+    def _available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._retry_at
+
+    def _failed(self, e: Exception) -> None:
+        logger.warning(f"Search cache unavailable: {e}")
+        self._retry_at = time.monotonic() + RETRY_AFTER_SECONDS
+
+    # =========================================================================
+    # КЛЮЧИ
+    # =========================================================================
+
+    @staticmethod
+    def id_key(term: str, **flags) -> str:
+        suffix = "".join(f":{name}={flags[name]}" for name in sorted(flags))
+        return f"id:{normalize_id(term)}{suffix}"
+
+    @staticmethod
+    def content_key(sha256: str, filename: Optional[str], **flags) -> str:
+        # Содержимое - по SHA-256 из потокового чтения; имя файла участвует
+        # в поиске (умный поиск по имени)
+        digest = hashlib.sha256(f"{sha256}\0{filename or ''}".encode())
+        suffix = "".join(f":{name}={flags[name]}" for name in sorted(flags))
+        return f"file:{digest.hexdigest()}{suffix}"
+
+    # =========================================================================
+    # ЧТЕНИЕ / ЗАПИСЬ
+    # =========================================================================
+
+    def get(self, key: str) -> Tuple[Optional[Dict], Optional[int]]:
+        """
+        (результат, версия каталога). Результат - None, если записи нет
+        или она записана при другой версии каталога.
+
+        Версию нужно передать в set(): если каталог изменится, пока
+        результат вычисляется, запись сразу окажется устаревшей.
+        """
+        if not self._available():
+            return None, None
+        try:
+            version, raw = self.client.mget(VERSION_KEY, KEY_PREFIX + key)
+        except redis.RedisError as e:
+            self._failed(e)
+            return None, None
+        return self._decode(version, raw)
+
+    async def aget(self, key: str) -> Tuple[Optional[Dict], Optional[int]]:
+        """get() без блокировки event loop."""
+        if not self._available():
+            return None, None
+        try:
+            version, raw = await self.async_client.mget(VERSION_KEY, KEY_PREFIX + key)
+        except redis.RedisError as e:
+            self._failed(e)
+            return None, None
+        return self._decode(version, raw)
+
+    @staticmethod
+    def _decode(version, raw) -> Tuple[Optional[Dict], int]:
+        version = int(version or 0)
+        if raw is None:
+            return None, version
+        entry = json.loads(raw)
+        if entry["version"] != version:
+            return None, version
+        return entry["result"], version
+
+    def set(self, key: str, result: Dict, version: Optional[int]) -> None:
+        if version is None or not self._available():
+            return
+        try:
+            entry, ttl = self._encode(result, version)
+            self.client.set(KEY_PREFIX + key, entry, ex=ttl)
+        except redis.RedisError as e:
+            self._failed(e)
+
+    async def aset(self, key: str, result: Dict, version: Optional[int]) -> None:
+        """set() без блокировки event loop."""
+        if version is None or not self._available():
+            return
+        try:
+            entry, ttl = self._encode(result, version)
+            await self.async_client.set(KEY_PREFIX + key, entry, ex=ttl)
+        except redis.RedisError as e:
+            self._failed(e)
+
+    def _encode(self, result: Dict, version: int) -> Tuple[str, int]:
+        """(запись, TTL)"""
+        ttl = self.ttl if result.get("found") else self.negative_ttl
+        return json.dumps({"version": version, "result": result}, default=str), ttl
+
+    def bump_version(self) -> Optional[int]:
+        """Инвалидировать весь кеш (каталог изменился)."""
+        if not self._available():
+            return None
+        try:
+            version = self.client.incr(VERSION_KEY)
+        except redis.RedisError as e:
+            self._failed(e)
+            return None
+        logger.info(f"Search cache: catalog version -> {version}")
+        return version
+
+    async def abump_version(self) -> Optional[int]:
+        """bump_version() без блокировки event loop."""
+        if not self._available():
+            return None
+        try:
+            version = await self.async_client.incr(VERSION_KEY)
+        except redis.RedisError as e:
+            self._failed(e)
+            return None
+        logger.info(f"Search cache: catalog version -> {version}")
+        return version
+
+
+# Глобальный экземпляр
+search_cache = SearchCache(
+    settings.REDIS_URL,
+    ttl=settings.SEARCH_CACHE_TTL,
+    negative_ttl=settings.SEARCH_CACHE_NEGATIVE_TTL,
+    enabled=settings.SEARCH_CACHE_ENABLED,
+)
+
+
+# =========================================================================
+# ИНВАЛИДАЦИЯ ПРИ ИЗМЕНЕНИИ КАТАЛОГА
+# =========================================================================
+
+_CATALOG_TABLES = {"firmwares", "firmware_id_tokens", "firmware_variants"}
+
+# Запущенные из after_commit задачи (event loop держит только слабые ссылки)
+_pending_bumps: Set[asyncio.Task] = set()
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_catalog_changed(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if getattr(obj, "__tablename__", None) in _CATALOG_TABLES:
+            session.info["catalog_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session: Session) -> None:
+    if not session.info.pop("catalog_changed", False):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Скрипты и синхронные сессии вне event loop
+        search_cache.bump_version()
+        return
+    # AsyncSession: хук вызывается в потоке event loop - не блокируем его
+    task = loop.create_task(search_cache.abump_version())
+    _pending_bumps.add(task)
+    task.add_done_callback(_pending_bumps.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session: Session) -> None:
+    session.info.pop("catalog_changed", None)
@@ -0,0 +1,83 @@
+"""
+Stage варианты прошивки для ответов API.
+
+Реальные варианты из firmware_variants или, если их нет, стандартные
+шаблоны Stage 1/2/3 с ценой от базовой цены прошивки. Один и тот же
+payload отдают /api/firmware/{id}/variants и поиск с include_variants.
+"""
+from typing import Dict, List
+
+from sqlalchemy.orm import joinedload, noload
+
+from app.models.firmware import Firmware
+from app.models.firmware_variant import FirmwareVariant, STAGE_TEMPLATES
+
+
+DEFAULT_PRICE = 50.0
+
+# Наценка шаблонов к базовой цене прошивки
+TEMPLATE_PRICE_FACTORS = {
+    "stage1": 1.0,
+    "stage2": 1.3,  # Stage 2 на 30% дороже
+    "stage3": 1.6,  # Stage 3 на 60% дороже
+}
+
+TEMPLATES_NOTE = "Стандартные варианты. Файл будет подготовлен после оплаты."
+
+
+def variant_loader(include_variants: bool):
+    """
+    Опция загрузки Firmware.variants: JOIN в том же запросе или не грузить
+    вовсе (по умолчанию relationship делает отдельный selectin-запрос).
+    """
+    return joinedload(Firmware.variants) if include_variants else noload(Firmware.variants)
+
+
+def variant_summary(variant: FirmwareVariant) -> Dict:
+    return {
+        "id": variant.id,
+        "stage": variant.stage,
+        "stage_name": variant.stage_name,
+        "description": variant.description,
+        "power_increase": variant.power_increase,
+        "torque_increase": variant.torque_increase,
+        "modifications": variant.modifications,
+        "price": float(variant.price) if variant.price else DEFAULT_PRICE,
+        "has_file": variant.s3_key is not None,
+    }
+
+
+def template_variants(base_price: float) -> List[Dict]:
+    return [
+        {
+            "id": None,  # Шаблон, не реальный вариант
+            "stage": stage,
+            "stage_name": template["stage_name"],
+            "description": template["description"],
+            "power_increase": template["power_increase"],
+            "torque_increase": template["torque_increase"],
+            "modifications": None,
+            "price": base_price * TEMPLATE_PRICE_FACTORS[stage],
+            "has_file": False,  # Файл будет подготовлен после заказа
+        }
+        for stage, template in STAGE_TEMPLATES.items()
+    ]
+
+
+def variants_payload(firmware: Firmware) -> Dict:
+    """
+    {"firmware_id", "variants"[, "note"]} - firmware.variants должны быть
+    уже загружены (variant_loader(True)).
+    """
+    if firmware.variants:
+        return {
+            "firmware_id": firmware.id,
+            "variants": [variant_summary(v) for v in firmware.variants],
+        }
+
+    base_price = float(firmware.price) if firmware.price else DEFAULT_PRICE
+    return {
+        "firmware_id": firmware.id,
+        "variants": template_variants(base_price),
+        "note": TEMPLATES_NOTE,
+    }
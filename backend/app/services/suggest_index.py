@@ -0,0 +1,162 @@
+"""
+In-memory индекс автодополнения software_id и серий.
+
+Ключи (нормализованный software_id, серия в верхнем регистре) лежат
+в отсортированных списках. Все ключи с префиксом q - непрерывный
+диапазон, его начало находит bisect, дальше - проход до первого
+ключа без префикса. Запрос не обращается к БД; индекс обновляется
+вместе с остальными индексами поиска (catalog_delta).
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.services.catalog_delta import CatalogDelta
+from app.services.firmware_ids import normalize_id
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# (firmware_id, software_id, brand, series)
+Row = Tuple[int, Optional[str], Optional[str], Optional[str]]
+
+
+def series_key(series: Optional[str]) -> str:
+    return " ".join((series or "").upper().split())
+
+
+class SuggestIndex:
+    """Префиксный поиск по отсортированным ключам (bisect)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (ключ, firmware_id) по возрастанию
+        self._ids: List[Tuple[str, int]] = []
+        self._series: List[Tuple[str, int]] = []
+        # firmware_id -> (software_id, brand, series)
+        self._firmwares: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._firmwares)
+
+    # =========================================================================
+    # ПОСТРОЕНИЕ
+    # =========================================================================
+
+    def rebuild(self, rows: Iterable[Row]) -> None:
+        """Полная пересборка из (firmware_id, software_id, brand, series)."""
+        ids = []
+        series = []
+        firmwares = {}
+        for firmware_id, software_id, brand, firmware_series in rows:
+            firmwares[firmware_id] = (software_id, brand, firmware_series)
+            if normalize_id(software_id):
+                ids.append((normalize_id(software_id), firmware_id))
+            if series_key(firmware_series):
+                series.append((series_key(firmware_series), firmware_id))
+        ids.sort()
+        series.sort()
+
+        with self._lock:
+            self._ids = ids
+            self._series = series
+            self._firmwares = firmwares
+            self.ready = True
+
+    def _discard(self, firmware_id: int) -> None:
+        old = self._firmwares.pop(firmware_id, None)
+        if old is None:
+            return
+        for keys, key in ((self._ids, normalize_id(old[0])), (self._series, series_key(old[2]))):
+            position = bisect_left(keys, (key, firmware_id))
+            if position < len(keys) and keys[position] == (key, firmware_id):
+                del keys[position]
+
+    def upsert(self, firmware_id: int, software_id: Optional[str], brand: Optional[str], series: Optional[str]) -> None:
+        """Добавить/обновить одну прошивку."""
+        with self._lock:
+            self._discard(firmware_id)
+            self._firmwares[firmware_id] = (software_id, brand, series)
+            if normalize_id(software_id):
+                insort(self._ids, (normalize_id(software_id), firmware_id))
+            if series_key(series):
+                insort(self._series, (series_key(series), firmware_id))
+
+    def remove(self, firmware_id: int) -> None:
+        with self._lock:
+            self._discard(firmware_id)
+
+    # =========================================================================
+    # ПОИСК
+    # =========================================================================
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """
+        До limit дополнений: сначала software_id с префиксом query
+        (в порядке ключей), затем серии (одна строка на серию).
+        """
+        limit = max(1, min(limit, MAX_LIMIT))
+        id_prefix = normalize_id(query)
+        series_prefix = series_key(query)
+        suggestions: List[Dict] = []
+
+        with self._lock:
+            if id_prefix:
+                keys = self._ids
+                position = bisect_left(keys, (id_prefix, -1))
+                while position < len(keys) and len(suggestions) < limit:
+                    key, firmware_id = keys[position]
+                    if not key.startswith(id_prefix):
+                        break
+                    position += 1
+                    software_id, brand, series = self._firmwares[firmware_id]
+                    suggestions.append({
+                        "type": "software_id",
+                        "value": software_id,
+                        "firmware_id": firmware_id,
+                        "brand": brand,
+                        "series": series,
+                    })
+
+            if series_prefix:
+                keys = self._series
+                position = bisect_left(keys, (series_prefix, -1))
+                while position < len(keys) and len(suggestions) < limit:
+                    key, firmware_id = keys[position]
+                    if not key.startswith(series_prefix):
+                        break
+                    # Одна строка на серию - остальные прошивки серии пропускаем
+                    position = bisect_left(keys, (key, float("inf")), position)
+                    _, brand, series = self._firmwares[firmware_id]
+                    suggestions.append({
+                        "type": "series",
+                        "value": series,
+                        "firmware_id": None,
+                        "brand": brand,
+                        "series": series,
+                    })
+
+        return suggestions
+
+    # =========================================================================
+    # ОБНОВЛЕНИЕ ИЗ КАТАЛОГА
+    # =========================================================================
+
+    def apply(self, delta: CatalogDelta) -> None:
+        """Применить изменения каталога (app/services/catalog_delta.py)."""
+        if delta.full:
+            self.rebuild((row.id, row.software_id, row.brand, row.series) for row in delta.rows)
+            logger.info(f"Suggest index rebuilt: {len(self._ids)} IDs, {len(self._series)} series keys")
+            return
+        for row in delta.rows:
+            self.upsert(row.id, row.software_id, row.brand, row.series)
+        for firmware_id in delta.removed:
+            self.remove(firmware_id)
+
+
+# Глобальный экземпляр
+suggest_index = SuggestIndex()
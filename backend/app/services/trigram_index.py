@@ -0,0 +1,157 @@
+"""
+In-memory триграммный индекс по Firmware.software_id.
+
+Поиск подстроки через ILIKE '%x%' - это полный проход по таблице.
+Индекс хранит для каждой триграммы нормализованного ID список строк
+(posting list); запрос пересекает списки своих триграмм, начиная
+с самого короткого, и проверяет оставшихся кандидатов. Время поиска
+зависит от размера posting list'ов, а не от размера каталога.
+"""
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.services.catalog_delta import CatalogDelta
+from app.services.firmware_ids import normalize_id
+
+
+# Если после пересечения кандидатов больше - пересекаем со следующим списком
+_INTERSECT_THRESHOLD = 64
+
+
+def trigrams(value: str) -> set:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class TrigramIndex:
+    """Подстрочный поиск по нормализованным software_id (как software_id_norm)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._firmware_ids = array('i')
+        self._values: List[Optional[str]] = []
+        self._positions: Dict[int, int] = {}
+        self._postings: Dict[str, array] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    # =========================================================================
+    # ПОСТРОЕНИЕ
+    # =========================================================================
+
+    def rebuild(self, rows: Iterable[Tuple[int, Optional[str]]]) -> None:
+        """Полная пересборка из (firmware_id, software_id)."""
+        firmware_ids = array('i')
+        values: List[Optional[str]] = []
+        positions: Dict[int, int] = {}
+        postings: Dict[str, array] = {}
+
+        for firmware_id, software_id in rows:
+            value = normalize_id(software_id)
+            position = len(values)
+            firmware_ids.append(firmware_id)
+            values.append(value)
+            positions[firmware_id] = position
+            for gram in trigrams(value):
+                postings.setdefault(gram, array('i')).append(position)
+
+        with self._lock:
+            self._firmware_ids = firmware_ids
+            self._values = values
+            self._positions = positions
+            self._postings = postings
+            self.ready = True
+
+    def upsert(self, firmware_id: int, software_id: Optional[str]) -> None:
+        """Добавить/обновить одну прошивку (старая позиция становится пустой)."""
+        value = normalize_id(software_id)
+        with self._lock:
+            old = self._positions.get(firmware_id)
+            if old is not None:
+                if self._values[old] == value:
+                    return
+                self._values[old] = None
+
+            position = len(self._values)
+            self._firmware_ids.append(firmware_id)
+            self._values.append(value)
+            self._positions[firmware_id] = position
+            for gram in trigrams(value):
+                self._postings.setdefault(gram, array('i')).append(position)
+
+    def remove(self, firmware_id: int) -> None:
+        with self._lock:
+            position = self._positions.pop(firmware_id, None)
+            if position is not None:
+                self._values[position] = None
+
+    # =========================================================================
+    # ПОИСК
+    # =========================================================================
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """
+        Firmware.id, у которых нормализованный software_id содержит query.
+
+        Порядок: точное совпадение, префикс, затем более короткие ID
+        (ближе к запросу), затем по id - стабильно между вызовами.
+        """
+        needle = normalize_id(query)
+        if not needle:
+            return []
+
+        with self._lock:
+            values = self._values
+            grams = trigrams(needle)
+
+            if grams:
+                lists = sorted((self._postings.get(g) for g in grams), key=lambda p: len(p) if p else 0)
+                if not lists[0]:
+                    return []
+                candidates = set(lists[0])
+                for posting in lists[1:]:
+                    if len(candidates) <= _INTERSECT_THRESHOLD:
+                        break
+                    candidates.intersection_update(posting)
+            else:
+                # Запрос короче триграммы - полный проход (редкий случай)
+                candidates = range(len(values))
+
+            hits = [
+                (
+                    values[pos] != needle,
+                    not values[pos].startswith(needle),
+                    len(values[pos]),
+                    self._firmware_ids[pos],
+                )
+                for pos in candidates
+                if values[pos] is not None and needle in values[pos]
+            ]
+
+        hits.sort()
+        if limit is not None:
+            hits = hits[:limit]
+        return [hit[-1] for hit in hits]
+
+    # =========================================================================
+    # ОБНОВЛЕНИЕ ИЗ КАТАЛОГА
+    # =========================================================================
+
+    def apply(self, delta: CatalogDelta) -> None:
+        """Применить изменения каталога (app/services/catalog_delta.py)."""
+        if delta.full:
+            self.rebuild((row.id, row.software_id) for row in delta.rows)
+            logger.info(f"Trigram index rebuilt: {len(delta.rows)} firmwares")
+            return
+        for row in delta.rows:
+            self.upsert(row.id, row.software_id)
+        for firmware_id in delta.removed:
+            self.remove(firmware_id)
+
+
+# Глобальный экземпляр
+trigram_index = TrigramIndex()
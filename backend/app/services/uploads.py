@@ -0,0 +1,84 @@
+"""
+Потоковое чтение загруженных файлов.
+
+UploadFile уже лежит в SpooledTemporaryFile. Файл читается из него
+блоками: SHA-256 считается по ходу чтения, лимит размера проверяется
+до того, как файл целиком окажется в памяти. Результат - один буфер,
+с которым напрямую работают парсер, поиск, кеш и хранилище (без
+временных файлов и повторного чтения с диска).
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+from app.core.config import settings
+
+
+# Размер блока чтения
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Файл больше MAX_UPLOAD_SIZE"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Файл больше допустимого размера ({max_size} байт)")
+        self.max_size = max_size
+
+
+@dataclass
+class UploadedFile:
+    """Содержимое загруженного файла и его SHA-256"""
+    content: bytes
+    sha256: str
+    filename: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+
+def read_upload(
+    file: BinaryIO,
+    filename: Optional[str] = None,
+    max_size: Optional[int] = None,
+    size: Optional[int] = None,
+) -> UploadedFile:
+    """
+    Прочитать файл блоками с подсчётом SHA-256.
+
+    size - заранее известный размер (UploadFile.size, заголовок архива);
+    без него размер спула определяется через seek.
+
+    Raises:
+        UploadTooLarge: файл больше max_size (по умолчанию MAX_UPLOAD_SIZE)
+    """
+    if max_size is None:
+        max_size = settings.MAX_UPLOAD_SIZE
+
+    # Размер известен заранее - слишком большой файл не читаем вовсе
+    if size is None:
+        try:
+            file.seek(0, 2)
+            size = file.tell()
+            file.seek(0)
+        except (AttributeError, OSError):
+            size = None
+    if size is not None and size > max_size:
+        raise UploadTooLarge(max_size)
+
+    digest = hashlib.sha256()
+    chunks = []
+    read = 0
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        read += len(chunk)
+        if read > max_size:
+            raise UploadTooLarge(max_size)
+        digest.update(chunk)
+        chunks.append(chunk)
+
+    content = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return UploadedFile(content=content, sha256=digest.hexdigest(), filename=filename)
@@ -0,0 +1,191 @@
+"""
+Проверка совместимости файла клиента со Stage вариантом.
+
+Вариант строится из конкретного стока. Совпадение software_id
+не гарантирует, что у клиента тот же сток, поэтому для варианта
+хранится профиль: хеши фиксированных регионов (код, калибровки)
+без пропатченных диапазонов. Файл клиента проверяется за один
+векторный проход по блокам - ответ за миллисекунды.
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Версия схемы профиля (веса хеша блока, размер блока) - хранится
+# в профиле, verify() проверяет по весам той же версии
+PROFILE_VERSION = 1
+
+# Размер блока (байт) - гранулярность маскирования патчей
+BLOCK_SIZE = 256
+
+# Веса для хеша блока: сумма word[i] * weight[i] по модулю 2^64 (нечётные).
+# Константы, а не генератор: на них построены все сохранённые профили
+_WEIGHTS_BY_VERSION = {
+    1: np.array([
+        0x5B9AA4F2A93FD6F5, 0x6581ECFB99E58F3F, 0x1927AA2F42B1D017, 0x707AA4B9B9FCD14B,
+        0x4CCB9B051205AB1B, 0x5BA4331CE89E4291, 0x619454E42F635EAB, 0x5FCF11FD01714A73,
+        0x0BD023BA193A0FAB, 0x6B1BCBE10BE10405, 0x7CC5BB09A849CE69, 0x46BF60A6D2206575,
+        0x706C21A9030E660B, 0x231107A36DED784F, 0x0AF34B8BE1A8FE7D, 0x0E68FAE0F463A235,
+        0x434B5ED5973C103D, 0x597D733062089803, 0x45473BF94A7F8B6D, 0x483153F89FF4E6C7,
+        0x6D5A310A8903D1E1, 0x4AB7D5EDB2497F9B, 0x7208FDE083ABE31B, 0x33330BB3519EBD15,
+        0x7F7CE3002C5C7A4D, 0x5B8C3FBF80B89C07, 0x0233170763E3B5EF, 0x2B02E00BC1968099,
+        0x59C61E566195A9B5, 0x7A7A878C3DCB1D63, 0x4CE1E10F1712EC2F, 0x4C4A65393E4E41B3,
+    ], dtype=np.uint64),
+}
+
+
+class UnsupportedProfile(ValueError):
+    """Профиль построен по другой схеме - нужно пересобрать"""
+
+
+def block_hashes(data: bytes, block_size: int = BLOCK_SIZE, version: int = PROFILE_VERSION) -> np.ndarray:
+    """
+    64-битные хеши всех блоков файла одним векторным проходом.
+
+    Последний неполный блок дополняется нулями.
+    """
+    weights = _WEIGHTS_BY_VERSION.get(version)
+    if weights is None or block_size != len(weights) * 8:
+        raise UnsupportedProfile(f"Unsupported profile version {version} / block size {block_size}")
+
+    padded_size = -(-len(data) // block_size) * block_size
+    buffer = np.zeros(padded_size, dtype=np.uint8)
+    buffer[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+
+    words = buffer.view("<u8").reshape(-1, block_size // 8)
+    return (words * weights).sum(axis=1, dtype=np.uint64)
+
+
+def diff_ranges(stock: bytes, modified: bytes, block_size: int = BLOCK_SIZE) -> List[Tuple[int, int]]:
+    """Диапазоны (start, end), где мод отличается от стока (с точностью до блока)."""
+    stock_hashes = block_hashes(stock, block_size)
+    modified_hashes = block_hashes(modified, block_size)
+
+    count = max(len(stock_hashes), len(modified_hashes))
+    changed = np.ones(count, dtype=bool)
+    common = min(len(stock_hashes), len(modified_hashes))
+    changed[:common] = stock_hashes[:common] != modified_hashes[:common]
+
+    ranges = []
+    for block in np.flatnonzero(changed).tolist():
+        start = block * block_size
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], start + block_size)
+        else:
+            ranges.append((start, start + block_size))
+    return ranges
+
+
+def _region_blocks(
+    start: int,
+    end: int,
+    patched_mask: np.ndarray,
+    block_size: int,
+) -> np.ndarray:
+    """Индексы блоков региона, не затронутых патчами."""
+    first = start // block_size
+    last = -(-end // block_size)
+    blocks = np.arange(first, last)
+    blocks = blocks[blocks < len(patched_mask)]
+    return blocks[~patched_mask[blocks]]
+
+
+def _digest(hashes: np.ndarray) -> str:
+    return hashlib.sha256(hashes.astype("<u8").tobytes()).hexdigest()
+
+
+def build_profile(
+    stock: bytes,
+    regions: Optional[List[Dict]] = None,
+    patched_ranges: Optional[List[Tuple[int, int]]] = None,
+    modified: Optional[bytes] = None,
+    block_size: int = BLOCK_SIZE,
+) -> Dict:
+    """
+    Построить профиль стока для варианта.
+
+    Args:
+        stock: Стоковый файл, из которого сделан вариант
+        regions: Регионы [{"name", "start", "end"}] (по умолчанию - весь файл)
+        patched_ranges: Пропатченные диапазоны [(start, end)], исключаются из хешей
+        modified: Файл Stage - если передан, патчи вычисляются диффом со стоком
+
+    Returns:
+        Профиль (JSON-совместимый dict) для FirmwareVariant.stock_profile
+    """
+    hashes = block_hashes(stock, block_size)
+
+    patched = list(patched_ranges or [])
+    if modified is not None:
+        patched.extend(diff_ranges(stock, modified, block_size))
+
+    patched_mask = np.zeros(len(hashes), dtype=bool)
+    for start, end in patched:
+        patched_mask[start // block_size:-(-end // block_size)] = True
+
+    regions = regions or [{"name": "full", "start": 0, "end": len(stock)}]
+    profile_regions = []
+    for region in regions:
+        start, end = int(region["start"]), int(region["end"])
+        if start < 0 or end > len(stock) or start >= end:
+            raise ValueError(f"Region {region.get('name')} is out of file bounds")
+
+        blocks = _region_blocks(start, end, patched_mask, block_size)
+        profile_regions.append({
+            "name": region.get("name") or f"{start:#x}-{end:#x}",
+            "start": start,
+            "end": end,
+            "blocks": int(len(blocks)),
+            "hash": _digest(hashes[blocks]),
+        })
+
+    return {
+        "version": PROFILE_VERSION,
+        "block_size": block_size,
+        "file_size": len(stock),
+        "sha256": hashlib.sha256(stock).hexdigest(),
+        "patched_ranges": [[start, end] for start, end in patched],
+        "regions": profile_regions,
+    }
+
+
+def verify(profile: Dict, data: bytes) -> Dict:
+    """
+    Проверить файл клиента по профилю варианта.
+
+    Returns:
+        {"compatible", "exact", "file_size_match", "regions": [{"name", "match", ...}]}
+
+    Raises:
+        UnsupportedProfile: профиль другой версии схемы
+    """
+    block_size = profile["block_size"]
+    hashes = block_hashes(data, block_size, profile.get("version"))
+
+    patched_mask = np.zeros(max(len(hashes), -(-profile["file_size"] // block_size)), dtype=bool)
+    for start, end in profile.get("patched_ranges", []):
+        patched_mask[start // block_size:-(-end // block_size)] = True
+
+    regions = []
+    for region in profile["regions"]:
+        match = region["end"] <= len(data)
+        if match:
+            blocks = _region_blocks(region["start"], region["end"], patched_mask, block_size)
+            match = _digest(hashes[blocks]) == region["hash"]
+
+        regions.append({
+            "name": region["name"],
+            "start": region["start"],
+            "end": region["end"],
+            "match": match,
+        })
+
+    file_size_match = len(data) == profile["file_size"]
+    return {
+        "compatible": file_size_match and all(r["match"] for r in regions),
+        "exact": file_size_match and hashlib.sha256(data).hexdigest() == profile["sha256"],
+        "file_size_match": file_size_match,
+        "regions": regions,
+    }
@@ -11,6 +11,7 @@ from sqlalchemy import select
 from loguru import logger
 
 from app.models.firmware import Firmware
+from app.services.id_tokens import replace_firmware_tokens
 
 
 class WinOLSImporter:
@@ -130,6 +131,7 @@ class WinOLSImporter:
             if update_existing:
                 # Update existing record
                 self._update_firmware(existing, row)
+                await replace_firmware_tokens(self.db, existing)
                 return "updated"
             else:
                 return "skipped"
@@ -137,6 +139,8 @@ class WinOLSImporter:
             # Create new record
             firmware = self._create_firmware(row, winols_id)
             self.db.add(firmware)
+            await self.db.flush()  # нужен firmware.id для токенов
+            await replace_firmware_tokens(self.db, firmware)
             return "created"
     
     def _create_firmware(self, row: pd.Series, winols_id: Optional[str]) -> Firmware:
@@ -0,0 +1,174 @@
+"""
+Нагрузочный бенчмарк API поиска прошивок
+
+Отправляет на запущенный сервер N параллельных запросов поиска
+(GET по software_id или POST с BIN файлами) и для каждого уровня
+параллельности печатает пропускную способность и латентность
+(p50/p95/p99). ID берутся из каталога (часть - заведомо
+несуществующие, как мусор OCR).
+
+Сравнение до/после: прогнать на старой версии сервера с --save before.json,
+затем на новой с --compare before.json. Чтобы мерить сам поиск, а не
+кеш Redis, сервер запускают с SEARCH_CACHE_ENABLED=false (для POST
+достаточно --no-cache).
+
+Usage: python3 bench_search_concurrency.py [--url http://localhost:8000/api/v1/api/firmware]
+           [--mode get|post] [--concurrency 50 100 200] [--requests 2000]
+           [--files DIR] [--no-cache] [--save out.json] [--compare before.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+from loguru import logger
+from sqlalchemy import func, select
+
+from app.core.database_sync import SessionLocal
+from app.models.firmware import Firmware
+
+
+# Доля запросов с несуществующим ID
+MISS_RATIO = 0.2
+
+
+def sample_ids(count: int) -> list:
+    """ID из каталога и заведомо отсутствующие"""
+    db = SessionLocal()
+    try:
+        ids = db.execute(
+            select(Firmware.software_id)
+            .where(Firmware.software_id.isnot(None))
+            .order_by(func.random())
+            .limit(count)
+        ).scalars().all()
+    finally:
+        db.close()
+
+    misses = [f"ZX{random.randint(10 ** 7, 10 ** 8)}Q" for _ in range(int(count * MISS_RATIO))]
+    return list(ids) + misses
+
+
+def sample_files(path: str) -> list:
+    """(имя, содержимое) BIN файлов из каталога"""
+    files = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(".bin"):
+            with open(os.path.join(path, name), "rb") as f:
+                files.append((name, f.read()))
+    return files
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_level(client: httpx.AsyncClient, args, payloads: list, concurrency: int) -> dict:
+    """Все запросы уровня через семафор на concurrency одновременных"""
+    semaphore = asyncio.Semaphore(concurrency)
+    timings, errors = [], 0
+
+    async def one(payload):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if args.mode == "get":
+                    response = await client.get(f"{args.url}/search", params={"software_id": payload})
+                else:
+                    name, content = payload
+                    if args.no_cache:
+                        # Уникальное имя - промах кеша Redis, полный поиск
+                        name = f"{uuid.uuid4().hex[:8]}_{name}"
+                    response = await client.post(
+                        f"{args.url}/search", files={"file": (name, content, "application/octet-stream")}
+                    )
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    batch = [random.choice(payloads) for _ in range(args.requests)]
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in batch))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(batch),
+        "errors": errors,
+        "rps": len(batch) / elapsed,
+        "p50": statistics.median(timings),
+        "p95": percentile(timings, 0.95),
+        "p99": percentile(timings, 0.99),
+    }
+
+
+async def run(args) -> list:
+    if args.mode == "get":
+        payloads = sample_ids(args.sample)
+    else:
+        if not args.files:
+            raise SystemExit("--mode post требует --files DIR")
+        payloads = sample_files(args.files)
+    if not payloads:
+        raise SystemExit("Нет данных для запросов")
+    logger.info(f"Payloads: {len(payloads)} ({args.mode})")
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        # Прогрев: индексы, пулы соединений
+        await run_level(client, argparse.Namespace(**{**vars(args), "requests": 50}), payloads, 10)
+        for concurrency in args.concurrency:
+            result = await run_level(client, args, payloads, concurrency)
+            logger.info(f"concurrency {concurrency}: {result['rps']:.1f} req/s, p99 {result['p99']:.1f} ms")
+            results.append(result)
+    return results
+
+
+def print_results(results: list, before: list = None):
+    before = {r["concurrency"]: r for r in before or []}
+    print(f"\n{'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}", end="")
+    print(f"  {'req/s before':>12} {'p99 before':>11}" if before else "")
+    for r in results:
+        print(f"{r['concurrency']:>5} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f} {r['errors']:>7}", end="")
+        old = before.get(r["concurrency"])
+        if old:
+            print(f"  {old['rps']:>12.1f} {old['p99']:>11.1f}"
+                  f"  (x{r['rps'] / max(old['rps'], 1e-6):.2f} req/s, p99 x{r['p99'] / max(old['p99'], 1e-6):.2f})")
+        else:
+            print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/api/v1/api/firmware", help="Базовый URL роутера поиска")
+    parser.add_argument("--mode", choices=("get", "post"), default="get", help="GET по ID или POST с файлом")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 200], help="Уровни параллельности")
+    parser.add_argument("--requests", type=int, default=2000, help="Запросов на уровень")
+    parser.add_argument("--sample", type=int, default=500, help="Сколько ID взять из каталога")
+    parser.add_argument("--files", help="Каталог с BIN файлами (для --mode post)")
+    parser.add_argument("--no-cache", action="store_true", help="POST: обходить кеш Redis (уникальные имена файлов)")
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    before = None
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+    print_results(results, before)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,148 @@
+"""
+Бенчмарк поиска по подстроке: Seq Scan против GIN (pg_trgm) индекса
+
+Строит временную таблицу - каталог firmwares, увеличенный в N раз
+(копии с суффиксом), создаёт те же индексы, что migrations/005 и 006,
+и для выборки запросов сравнивает EXPLAIN ANALYZE с запрещённым индексом
+и план, который выбирает планировщик.
+
+Таблица временная (TEMP) - каталог не меняется.
+
+Usage: python3 bench_trigram_search.py [--scale 50] [--queries 20] [--runs 3]
+"""
+import argparse
+import json
+import random
+import statistics
+
+from sqlalchemy import text
+from loguru import logger
+
+from app.core.database_sync import engine
+from app.services.firmware_ids import CONFUSABLE_FROM, CONFUSABLE_TO, normalize_id
+
+
+TABLE = "bench_firmwares"
+
+# То же выражение, что генерирует колонку firmwares.software_id_norm
+NORM_EXPR = (
+    "translate(upper(regexp_replace(software_id, '[^A-Za-z0-9]', '', 'g')), "
+    f"'{CONFUSABLE_FROM}', '{CONFUSABLE_TO}')"
+)
+
+
+def build_table(conn, scale: int) -> int:
+    """Временная таблица с каталогом x scale"""
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    conn.execute(text(f"""
+        CREATE TEMP TABLE {TABLE} AS
+        SELECT f.id * :scale + g AS id,
+               CASE WHEN g = 0 THEN f.software_id ELSE f.software_id || '-' || g END AS software_id,
+               f.hardware_id
+        FROM firmwares f CROSS JOIN generate_series(0, :scale - 1) g
+        WHERE f.software_id IS NOT NULL
+    """), {"scale": scale})
+
+    rows = conn.execute(text(f"SELECT count(*) FROM {TABLE}")).scalar()
+    if rows == 0:
+        # Пустой каталог - синтетические ID вида 89663-47351
+        conn.execute(text(f"""
+            INSERT INTO {TABLE} (id, software_id, hardware_id)
+            SELECT g,
+                   upper(substr(md5(g::text), 1, 5)) || '-' || upper(substr(md5(g::text), 6, 5)),
+                   upper(substr(md5((-g)::text), 1, 10))
+            FROM generate_series(1, 1000 * :scale) g
+        """), {"scale": scale})
+        rows = conn.execute(text(f"SELECT count(*) FROM {TABLE}")).scalar()
+
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING gin (software_id gin_trgm_ops)"))
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING gin (hardware_id gin_trgm_ops)"))
+    conn.execute(text(f"CREATE INDEX ON {TABLE} USING gin (({NORM_EXPR}) gin_trgm_ops)"))
+    conn.execute(text(f"ANALYZE {TABLE}"))
+    return rows
+
+
+def sample_queries(conn, count: int) -> list:
+    """Запросы как от клиентов: полный ID, без дефисов, фрагмент"""
+    ids = [row[0] for row in conn.execute(
+        text(f"SELECT software_id FROM {TABLE} ORDER BY random() LIMIT :count"), {"count": count}
+    )]
+
+    queries = []
+    for software_id in ids:
+        compact = "".join(c for c in software_id.upper() if c.isalnum())
+        queries.append(("full", software_id))
+        queries.append(("compact", compact))
+        if len(compact) > 8:
+            start = random.randint(0, len(compact) - 6)
+            queries.append(("fragment", compact[start:start + 6]))
+    return queries
+
+
+def explain(conn, term: str, force_seq: bool) -> tuple:
+    """(узел сканирования, время выполнения ms)"""
+    conn.execute(text("SET LOCAL enable_bitmapscan = " + ("off" if force_seq else "on")))
+    conn.execute(text("SET LOCAL enable_indexscan = " + ("off" if force_seq else "on")))
+
+    plan = conn.execute(
+        text(f"""
+            EXPLAIN (ANALYZE, FORMAT JSON)
+            SELECT id FROM {TABLE}
+            WHERE {NORM_EXPR} LIKE :pattern
+            ORDER BY length({NORM_EXPR}), id
+            LIMIT 20
+        """),
+        {"pattern": f"%{normalize_id(term)}%"},
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    node = plan[0]["Plan"]
+    while node.get("Plans") and "Scan" not in node["Node Type"]:
+        node = node["Plans"][0]
+    return node["Node Type"], plan[0]["Execution Time"]
+
+
+def run(scale: int, queries_count: int, runs: int):
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            rows = build_table(conn, scale)
+            logger.info(f"Bench table: {rows} rows (scale x{scale})")
+
+            queries = sample_queries(conn, queries_count)
+            results = {}
+            for kind, term in queries:
+                for mode, force_seq in (("seq", True), ("planner", False)):
+                    nodes, timings = set(), []
+                    for _ in range(runs):
+                        node, ms = explain(conn, term, force_seq)
+                        nodes.add(node)
+                        timings.append(ms)
+                    results.setdefault((kind, mode), []).append(statistics.median(timings))
+                    results.setdefault((kind, mode, "nodes"), set()).update(nodes)
+        finally:
+            trans.rollback()
+
+    print(f"\n{'query':<10} {'plan':<8} {'median ms':>10} {'p95 ms':>10}  scan nodes")
+    for kind in ("full", "compact", "fragment"):
+        for mode in ("seq", "planner"):
+            timings = sorted(results.get((kind, mode), []))
+            if not timings:
+                continue
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            nodes = ", ".join(sorted(results[(kind, mode, "nodes")]))
+            print(f"{kind:<10} {mode:<8} {statistics.median(timings):>10.2f} {p95:>10.2f}  {nodes}")
+        seq = results.get((kind, "seq"))
+        planner = results.get((kind, "planner"))
+        if seq and planner:
+            print(f"{'':<10} speedup x{statistics.median(seq) / max(statistics.median(planner), 1e-6):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=50, help="Во сколько раз увеличить каталог")
+    parser.add_argument("--queries", type=int, default=20, help="Сколько ID взять для запросов")
+    parser.add_argument("--runs", type=int, default=3, help="Повторов на запрос")
+    args = parser.parse_args()
+    run(args.scale, args.queries, args.runs)
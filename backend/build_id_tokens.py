@@ -0,0 +1,61 @@
+"""
+Скрипт для пересборки таблицы firmware_id_tokens и Bloom-фильтра ID
+
+Режет software_id и versions_info всех прошивок на нормализованные
+токены (split_id_tokens) и перезаписывает таблицу целиком,
+затем пересобирает INDEX_STORAGE_PATH/id_filter.npz.
+Нужен после миграции 007 и после импорта в обход WinOLSImporter.
+
+Usage: python3 build_id_tokens.py
+"""
+import time
+
+from sqlalchemy import delete, insert, select
+from loguru import logger
+
+from app.core.database_sync import SessionLocal
+from app.models.firmware import Firmware
+from app.models.firmware_id_token import FirmwareIdToken
+from app.services.id_filter import id_filter
+from app.services.id_tokens import firmware_token_rows
+from app.services.search_cache import search_cache
+
+
+BATCH_SIZE = 5000
+
+
+def build_tokens():
+    """Пересобрать токены всех прошивок"""
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Firmware.id, Firmware.software_id, Firmware.versions_info)
+        ).all()
+        logger.info(f"Firmwares: {len(rows)}")
+        
+        tokens = []
+        for firmware_id, software_id, versions_info in rows:
+            tokens.extend(firmware_token_rows(firmware_id, software_id, versions_info))
+        
+        db.execute(delete(FirmwareIdToken))
+        for i in range(0, len(tokens), BATCH_SIZE):
+            db.execute(insert(FirmwareIdToken), tokens[i:i + BATCH_SIZE])
+        db.commit()
+    finally:
+        db.close()
+    
+    # Bloom-фильтр каталога (сервер подхватит файл при старте)
+    id_filter.rebuild((software_id, versions_info) for _, software_id, versions_info in rows)
+    
+    # Bulk insert не проходит через ORM события - сбрасываем кеш поиска явно
+    search_cache.bump_version()
+    
+    logger.success(
+        f"✅ Токены пересобраны: {len(tokens)} токенов для {len(rows)} прошивок "
+        f"за {time.monotonic() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    build_tokens()
@@ -0,0 +1,69 @@
+"""
+Скрипт для построения индекса похожести (MinHash/LSH) по стоковым файлам
+
+Берёт все прошивки с file_path, читает файлы с диска
+(абсолютный путь или относительно WINOLS_STORAGE_PATH)
+и сохраняет индекс в INDEX_STORAGE_PATH/similarity.npz.
+
+Usage: python3 build_similarity_index.py [--rebuild]
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import select
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database_sync import SessionLocal
+from app.models.firmware import Firmware
+from app.services.firmware_similarity import similarity_index
+
+
+def resolve_path(file_path: str) -> str:
+    """Путь к стоковому файлу на диске"""
+    if os.path.isabs(file_path):
+        return file_path
+    return os.path.join(settings.WINOLS_STORAGE_PATH, file_path)
+
+
+def build_index(rebuild: bool = False):
+    """Построить индекс (или дополнить существующий)"""
+    if not rebuild:
+        similarity_index.load()
+    
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Firmware.id, Firmware.file_path).where(Firmware.file_path.isnot(None))
+        ).all()
+    finally:
+        db.close()
+    
+    logger.info(f"Firmwares with file_path: {len(rows)}")
+    
+    started = time.monotonic()
+    added = 0
+    missing = 0
+    for firmware_id, file_path in rows:
+        path = resolve_path(file_path)
+        if not os.path.isfile(path):
+            missing += 1
+            continue
+        
+        with open(path, 'rb') as f:
+            similarity_index.add(firmware_id, f.read())
+        added += 1
+        
+        if added % 500 == 0:
+            logger.info(f"Indexed {added}/{len(rows)}...")
+    
+    similarity_index.save()
+    logger.success(
+        f"✅ Индекс сохранён: {len(similarity_index)} прошивок "
+        f"(добавлено {added}, нет файла {missing}) за {time.monotonic() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    build_index(rebuild="--rebuild" in sys.argv)
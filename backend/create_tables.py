@@ -9,6 +9,8 @@ from app.models.firmware_variant import FirmwareVariant
 from app.models.order import Order
 from app.models.transaction import Transaction
 from app.models.admin_user import AdminUser
+from app.models.firmware_id_token import FirmwareIdToken
+from app.models.dedup import DedupFile, DedupChunk
 from loguru import logger
 
 
@@ -3,8 +3,13 @@
 """
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 from loguru import logger
 
+from app.services.id_filter import id_filter
+from app.services.id_tokens import firmware_token_rows
+from app.services.search_cache import search_cache
+
 # Параметры подключения
 DB_PARAMS = {
     'host': '127.0.0.1',
@@ -58,6 +63,7 @@ def import_firmwares():
                         winols_created_at, winols_updated_at, maps_count,
                         versions_info, winols_file, price
                     ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
                 """, (
                     row.get('brand'),
                     row.get('series'),
@@ -71,6 +77,15 @@ def import_firmwares():
                     row.get('winols_file'),
                     50.0  # Цена по умолчанию
                 ))
+                firmware_id = cursor.fetchone()[0]
+                
+                # Токены составных ID для точного поиска
+                tokens = firmware_token_rows(firmware_id, row.get('software_id'), row.get('versions_info'))
+                if tokens:
+                    execute_values(cursor, """
+                        INSERT INTO firmware_id_tokens (firmware_id, token, source_field, position)
+                        VALUES %s
+                    """, [(t['firmware_id'], t['token'], t['source_field'], t['position']) for t in tokens])
                 inserted += 1
                 
                 if inserted % 500 == 0:
@@ -83,6 +98,7 @@ def import_firmwares():
         
         # Коммитим изменения
         conn.commit()
+        search_cache.bump_version()  # Сбросить кеш результатов поиска
         logger.success(f"✅ Импорт завершён! Добавлено {inserted} прошивок (ошибок: {errors})")
         
         # Закрываем соединение
@@ -95,6 +111,11 @@ def import_firmwares():
         cursor.execute("SELECT COUNT(*) FROM firmwares")
         count = cursor.fetchone()[0]
         logger.info(f"📊 Всего прошивок в базе: {count}")
+        
+        # Пересобираем Bloom-фильтр ID каталога
+        cursor.execute("SELECT software_id, versions_info FROM firmwares")
+        ids_count = id_filter.rebuild(cursor.fetchall())
+        logger.info(f"🔎 Фильтр ID каталога: {ids_count} ID")
         cursor.close()
         conn.close()
         
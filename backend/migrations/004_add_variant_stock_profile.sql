@@ -0,0 +1,9 @@
+-- Migration: Add stock profile to firmware variants
+-- Date: 2026-10-18
+
+-- Профиль стока, из которого собран Stage вариант:
+-- хеши регионов (код, калибровки) без пропатченных диапазонов.
+-- По нему файл клиента проверяется на совместимость с вариантом.
+ALTER TABLE firmware_variants ADD COLUMN IF NOT EXISTS stock_profile JSONB;
+
+COMMENT ON COLUMN firmware_variants.stock_profile IS 'JSON: block_size, file_size, sha256, patched_ranges, regions[{name, start, end, hash}]';
@@ -0,0 +1,26 @@
+-- Migration: Trigram (pg_trgm) indexes for substring firmware search
+-- Date: 2026-10-18
+
+-- Поиск по подстроке (ILIKE '%...%') без индекса - полный проход по таблице.
+-- GIN индексы pg_trgm позволяют планировщику использовать Bitmap Index Scan.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_firmwares_software_id_trgm
+    ON firmwares USING gin (software_id gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_firmwares_hardware_id_trgm
+    ON firmwares USING gin (hardware_id gin_trgm_ops);
+
+-- Нормализованная форма (верхний регистр, без разделителей).
+-- Поиск теперь идёт по генерируемому столбцу software_id_norm
+-- (migrations/006_add_software_id_norm.sql; то же выражение плюс замена
+-- OCR-двойников, в Python - app/services/firmware_ids.normalize_id)
+CREATE INDEX IF NOT EXISTS idx_firmwares_software_id_compact_trgm
+    ON firmwares USING gin ((upper(regexp_replace(software_id, '[^A-Za-z0-9]', '', 'g'))) gin_trgm_ops);
+
+ANALYZE firmwares;
+
+-- Проверка:
+-- EXPLAIN ANALYZE SELECT id FROM firmwares
+--   WHERE upper(regexp_replace(software_id, '[^A-Za-z0-9]', '', 'g')) LIKE '%8966347351%';
+-- -> Bitmap Index Scan on idx_firmwares_software_id_compact_trgm
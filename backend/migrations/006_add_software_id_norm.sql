@@ -0,0 +1,28 @@
+-- Migration: Normalized software_id column
+-- Date: 2026-10-18
+
+-- software_id_norm: верхний регистр, без разделителей, OCR-двойники свёрнуты
+-- (O,Q -> 0; I,L -> 1; S -> 5; B -> 8; Z -> 2).
+-- Выражение должно совпадать с app/services/firmware_ids.py::normalize_id
+ALTER TABLE firmwares ADD COLUMN IF NOT EXISTS software_id_norm VARCHAR(255)
+    GENERATED ALWAYS AS (
+        translate(upper(regexp_replace(software_id, '[^A-Za-z0-9]', '', 'g')), 'OQILSBZ', '0011582')
+    ) STORED;
+
+-- Точный поиск и поиск по префиксу (= и LIKE 'X%') - один btree probe
+CREATE INDEX IF NOT EXISTS idx_firmwares_software_id_norm
+    ON firmwares (software_id_norm text_pattern_ops);
+
+-- Поиск подстроки по нормализованной форме (заменяет индекс по выражению из 005)
+CREATE INDEX IF NOT EXISTS idx_firmwares_software_id_norm_trgm
+    ON firmwares USING gin (software_id_norm gin_trgm_ops);
+
+DROP INDEX IF EXISTS idx_firmwares_software_id_compact_trgm;
+
+ANALYZE firmwares;
+
+COMMENT ON COLUMN firmwares.software_id_norm IS 'Normalized software_id: upper, alphanumeric only, OCR confusables folded';
+
+-- Проверка:
+-- EXPLAIN ANALYZE SELECT id FROM firmwares WHERE software_id_norm LIKE '8966347351%';
+-- -> Index Scan using idx_firmwares_software_id_norm
@@ -0,0 +1,20 @@
+-- Migration: Tokenized compound firmware IDs
+-- Date: 2026-10-18
+
+-- Токены составных ID из software_id и versions_info
+-- (app/services/firmware_ids.py::split_id_tokens).
+-- Заполняются при импорте, пересборка: python3 build_id_tokens.py
+CREATE TABLE IF NOT EXISTS firmware_id_tokens (
+    id SERIAL PRIMARY KEY,
+    firmware_id INTEGER NOT NULL REFERENCES firmwares(id) ON DELETE CASCADE,
+    token VARCHAR(255) NOT NULL,
+    source_field VARCHAR(50) NOT NULL,  -- "software_id", "versions_info"
+    position INTEGER NOT NULL DEFAULT 0
+);
+
+-- Поиск по точному совпадению токена
+CREATE INDEX IF NOT EXISTS idx_firmware_id_tokens_token ON firmware_id_tokens(token);
+CREATE INDEX IF NOT EXISTS idx_firmware_id_tokens_firmware_id ON firmware_id_tokens(firmware_id);
+
+COMMENT ON TABLE firmware_id_tokens IS 'Нормализованные токены составных ID прошивок для точного поиска';
+COMMENT ON COLUMN firmware_id_tokens.token IS 'normalize_id(): верхний регистр, без разделителей, OCR-двойники свёрнуты';
@@ -0,0 +1,47 @@
+-- Migration: Catalog change notifications
+-- Date: 2026-10-19
+
+-- Изменения firmwares и firmware_variants публикуются в канал
+-- catalog_changed: {"table": ..., "op": ..., "firmware_id": ...}.
+-- Бэкенд слушает канал (app/services/catalog_snapshot.py) и обновляет
+-- снимок каталога в памяти и индексы поиска.
+CREATE OR REPLACE FUNCTION notify_catalog_changed() RETURNS trigger AS $$
+DECLARE
+    changed_id INTEGER;
+BEGIN
+    IF TG_TABLE_NAME = 'firmwares' THEN
+        IF TG_OP = 'DELETE' THEN
+            changed_id := OLD.id;
+        ELSE
+            changed_id := NEW.id;
+        END IF;
+    ELSE
+        IF TG_OP = 'DELETE' THEN
+            changed_id := OLD.firmware_id;
+        ELSE
+            changed_id := NEW.firmware_id;
+        END IF;
+        -- Вариант перенесён на другую прошивку - обновить обе
+        IF TG_OP = 'UPDATE' AND OLD.firmware_id IS DISTINCT FROM NEW.firmware_id THEN
+            PERFORM pg_notify('catalog_changed', json_build_object(
+                'table', TG_TABLE_NAME, 'op', TG_OP, 'firmware_id', OLD.firmware_id
+            )::text);
+        END IF;
+    END IF;
+
+    PERFORM pg_notify('catalog_changed', json_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'firmware_id', changed_id
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_firmwares_notify ON firmwares;
+CREATE TRIGGER trg_firmwares_notify
+    AFTER INSERT OR UPDATE OR DELETE ON firmwares
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_changed();
+
+DROP TRIGGER IF EXISTS trg_firmware_variants_notify ON firmware_variants;
+CREATE TRIGGER trg_firmware_variants_notify
+    AFTER INSERT OR UPDATE OR DELETE ON firmware_variants
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_changed();
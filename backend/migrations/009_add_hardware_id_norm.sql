@@ -0,0 +1,23 @@
+-- Migration: Normalized hardware_id and composite SW+HW index
+-- Date: 2026-10-19
+
+-- hardware_id_norm: та же нормализация, что у software_id_norm (migrations/006)
+ALTER TABLE firmwares ADD COLUMN IF NOT EXISTS hardware_id_norm VARCHAR(255)
+    GENERATED ALWAYS AS (
+        translate(upper(regexp_replace(hardware_id, '[^A-Za-z0-9]', '', 'g')), 'OQILSBZ', '0011582')
+    ) STORED;
+
+-- Один и тот же software_id бывает на разных блоках: пара (SW, HW) находит
+-- нужную прошивку одним probe (software_id_norm = X AND hardware_id_norm LIKE 'Y%')
+CREATE INDEX IF NOT EXISTS idx_firmwares_software_hardware_norm
+    ON firmwares (software_id_norm text_pattern_ops, hardware_id_norm text_pattern_ops);
+
+-- Заменён hardware_id_norm (фильтр по префиксу нормализованного HW)
+DROP INDEX IF EXISTS idx_firmwares_hardware_id_trgm;
+
+ANALYZE firmwares;
+
+-- Проверка:
+-- EXPLAIN ANALYZE SELECT id FROM firmwares
+--   WHERE software_id_norm = '1037512345' AND hardware_id_norm LIKE '0261208123%';
+-- -> Index Scan using idx_firmwares_software_hardware_norm
@@ -0,0 +1,25 @@
+-- Migration: Dedup store reference counts in Postgres
+-- Date: 2026-10-19
+
+-- Счётчики ссылок дедуплицирующего хранилища (app/services/chunk_store.py)
+-- вместо refcounts.json в хранилище: файл учитывается один раз,
+-- блок считает ссылающиеся на него файлы, обновления атомарны.
+-- После применения счётчики пересобираются по манифестам:
+-- POST /api/v1/admin/originals/gc?rebuild_counts=true
+CREATE TABLE IF NOT EXISTS dedup_files (
+    file_id VARCHAR(64) PRIMARY KEY,  -- SHA-256 файла
+    filename VARCHAR(500),
+    size BIGINT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS dedup_chunks (
+    digest VARCHAR(64) PRIMARY KEY,  -- SHA-256 блока
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+
+-- Кандидаты на удаление сборкой мусора
+CREATE INDEX IF NOT EXISTS idx_dedup_chunks_unreferenced ON dedup_chunks(digest) WHERE refcount <= 0;
+
+COMMENT ON TABLE dedup_chunks IS 'Блоки дедуплицирующего хранилища; refcount - число файлов, ссылающихся на блок';
@@ -0,0 +1,418 @@
+"""
+Повтор реальных поисковых запросов против движка поиска
+
+Нагрузка берётся из истории:
+- user_activity.details (search_text / search_ocr - поиск по ID,
+  search_bin - имя загруженного файла);
+- строки "Searching with IDs: [...]" из логов бэкенда (кандидаты
+  из загруженных BIN файлов).
+
+Запросы выполняются в процессе теми же функциями, что и API
+(resolve_software_id, lookup_candidates, smart_search_by_filename),
+с заданной параллельностью. Для каждого уровня печатается доля
+найденных, латентность (p50/p95/p99) и число запросов к БД на один
+поиск (счётчик app/core/metrics.py) - всего и по типам запросов, плюс
+число поисков, исход которых разошёлся с записанным в user_activity.
+
+Цель - Postgres (DATABASE_URL или --database-url) либо SQLite-замена:
+--sqlite PATH собирает файл из firmwares.csv (нужен драйвер aiosqlite).
+Нагрузку можно сохранить (--save-workload) и повторять без доступа
+к продовой БД (--workload). Сравнение до/после - --save / --compare.
+
+Usage: python3 replay_search.py [--from-activity] [--from-log backend.log ...]
+           [--workload queries.jsonl] [--save-workload queries.jsonl]
+           [--database-url URL | --sqlite replay.db [--csv ../firmwares.csv]]
+           [--concurrency 1 10 50] [--limit 5000] [--no-indexes] [--cache]
+           [--save out.json] [--compare before.json]
+"""
+import argparse
+import ast
+import asyncio
+import csv
+import json
+import os
+import re
+import sqlite3
+import statistics
+import time
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.core.metrics import track_request
+from app.models.firmware import Firmware
+from app.models.user_activity import ActivityType, UserActivity
+from app.api.endpoints.firmware_search import resolve_software_id, smart_search_by_filename
+from app.services.firmware_ids import normalize_id, split_id_tokens
+from app.services.firmware_lookup import CandidateSource, lookup_candidates, make_candidate
+from app.services.fuzzy_index import fuzzy_index
+from app.services.id_filter import id_filter
+from app.services.search_cache import search_cache
+from app.services.trigram_index import trigram_index
+
+
+SEARCHING_RE = re.compile(r"Searching with IDs: (\[.*\])")
+
+ACTIVITY_KINDS = {
+    ActivityType.SEARCH_TEXT: "id",
+    ActivityType.SEARCH_SCREENSHOT: "id",
+    ActivityType.SEARCH_BIN: "filename",
+}
+
+
+# =========================================================================
+# НАГРУЗКА
+# =========================================================================
+
+def from_activity(limit: int) -> list:
+    """Поиски из user_activity (по времени)"""
+    from app.core.database_sync import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(UserActivity.activity_type, UserActivity.details)
+            .where(UserActivity.activity_type.in_(list(ACTIVITY_KINDS)))
+            .order_by(UserActivity.created_at)
+            .limit(limit)
+        ).all()
+    finally:
+        db.close()
+
+    workload = []
+    for activity_type, details in rows:
+        query = (details or {}).get("query")
+        if query:
+            workload.append({
+                "kind": ACTIVITY_KINDS[activity_type],
+                "terms": [query],
+                "found": details.get("found"),
+            })
+    return workload
+
+
+def from_logs(paths: list) -> list:
+    """Списки кандидатов из строк 'Searching with IDs: [...]'"""
+    workload = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = SEARCHING_RE.search(line)
+                if not match:
+                    continue
+                try:
+                    terms = ast.literal_eval(match.group(1))
+                except (ValueError, SyntaxError):
+                    continue
+                if terms:
+                    workload.append({"kind": "candidates", "terms": [str(t) for t in terms], "found": None})
+    return workload
+
+
+WORKLOAD_KINDS = {"id", "filename", "candidates"}
+
+
+def workload_item(raw) -> dict:
+    """
+    Проверенный элемент нагрузки: kind и непустой список строк terms
+    ("query": "..." - сокращение для одного term; без kind - id для
+    одного term, иначе candidates). ValueError - не годится.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("not an object")
+    terms = raw.get("terms")
+    if terms is None and raw.get("query"):
+        terms = [raw["query"]]
+    if not isinstance(terms, list) or not terms or not all(isinstance(t, str) and t for t in terms):
+        raise ValueError("expected non-empty 'terms' list of strings or 'query' string")
+    kind = raw.get("kind", "id" if len(terms) == 1 else "candidates")
+    if kind not in WORKLOAD_KINDS:
+        raise ValueError(f"unknown kind {kind!r}")
+    return {"kind": kind, "terms": terms, "found": raw.get("found")}
+
+
+def load_workload(path: str) -> list:
+    workload = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                workload.append(workload_item(json.loads(line)))
+            except ValueError as e:  # json.JSONDecodeError - тоже ValueError
+                logger.warning(f"{path}:{number}: skipped workload item ({e})")
+    return workload
+
+
+def save_workload(path: str, workload: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for item in workload:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+# =========================================================================
+# SQLITE-ЗАМЕНА
+# =========================================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE firmwares (
+    id INTEGER PRIMARY KEY, winols_id TEXT, winols_file TEXT, brand TEXT NOT NULL,
+    series TEXT, ecu_brand TEXT, software_id TEXT, hardware_id TEXT,
+    software_id_norm TEXT, hardware_id_norm TEXT, file_path TEXT, file_size TEXT,
+    price NUMERIC, maps_count TEXT, versions_info TEXT, winols_created_at TEXT,
+    winols_updated_at TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE INDEX idx_firmwares_software_id_norm ON firmwares (software_id_norm);
+CREATE INDEX idx_firmwares_software_hardware_norm ON firmwares (software_id_norm, hardware_id_norm);
+CREATE TABLE firmware_variants (
+    id INTEGER PRIMARY KEY, firmware_id INTEGER NOT NULL REFERENCES firmwares(id),
+    stage TEXT NOT NULL, stage_name TEXT NOT NULL, description TEXT, power_increase TEXT,
+    torque_increase TEXT, modifications TEXT, price NUMERIC NOT NULL, s3_key TEXT,
+    file_size INTEGER, stock_profile TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+);
+CREATE TABLE firmware_id_tokens (
+    id INTEGER PRIMARY KEY, firmware_id INTEGER NOT NULL REFERENCES firmwares(id),
+    token TEXT NOT NULL, source_field TEXT NOT NULL, position INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX idx_firmware_id_tokens_token ON firmware_id_tokens (token);
+"""
+
+
+def build_sqlite(path: str, csv_path: str) -> int:
+    """
+    SQLite с каталогом из CSV. Сгенерированные в Postgres колонки
+    (software_id_norm, hardware_id_norm) и токены считаются здесь теми же
+    функциями (normalize_id, split_id_tokens).
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SQLITE_SCHEMA)
+        with open(csv_path, encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        for firmware_id, row in enumerate(rows, start=1):
+            software_id = row.get("software_id") or None
+            hardware_id = row.get("hardware_id") or None
+            conn.execute(
+                "INSERT INTO firmwares (id, winols_file, brand, series, ecu_brand, software_id, hardware_id,"
+                " software_id_norm, hardware_id_norm, file_size, price, maps_count, versions_info,"
+                " winols_created_at, winols_updated_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))",
+                (
+                    firmware_id, row.get("winols_file"), row.get("brand") or "-", row.get("series"),
+                    row.get("ecu_brand"), software_id, hardware_id,
+                    normalize_id(software_id) or None, normalize_id(hardware_id) or None,
+                    row.get("file_size"), float(row.get("price") or settings.DEFAULT_PRICE),
+                    row.get("maps_count"), row.get("versions_info"),
+                    row.get("winols_created_at"), row.get("winols_updated_at"),
+                ),
+            )
+            position = 0
+            for field in ("software_id", "versions_info"):
+                for token in split_id_tokens(row.get(field)):
+                    conn.execute(
+                        "INSERT INTO firmware_id_tokens (firmware_id, token, source_field, position)"
+                        " VALUES (?, ?, ?, ?)",
+                        (firmware_id, token, field, position),
+                    )
+                    position += 1
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
+
+# =========================================================================
+# ПОВТОР
+# =========================================================================
+
+async def load_indexes(session_maker) -> None:
+    """In-memory индексы поиска, как при старте API (фильтр ID - без записи на диск)"""
+    async with session_maker() as session:
+        rows = (await session.execute(
+            select(Firmware.id, Firmware.software_id, Firmware.versions_info)
+        )).all()
+    trigram_index.rebuild((firmware_id, software_id) for firmware_id, software_id, _ in rows)
+    fuzzy_index.rebuild((firmware_id, software_id) for firmware_id, software_id, _ in rows)
+    id_filter.rebuild(((software_id, versions_info) for _, software_id, versions_info in rows), save=False)
+    logger.info(f"Indexes loaded: {len(rows)} firmwares")
+
+
+async def replay_one(db: AsyncSession, item: dict, use_cache: bool) -> bool:
+    """Один поиск тем же путём, что и API; True - найдено"""
+    terms = item["terms"]
+    if item["kind"] == "id":
+        if use_cache:
+            key = search_cache.id_key(terms[0], fuzzy=True, include_variants=False)
+            result, version = await search_cache.aget(key)
+            if result is None:
+                result = await resolve_software_id(terms[0], True, db)
+                await search_cache.aset(key, result, version)
+        else:
+            result = await resolve_software_id(terms[0], True, db)
+        return bool(result["found"])
+
+    if item["kind"] == "filename":
+        return await smart_search_by_filename(terms[0], db) is not None
+
+    candidates = [make_candidate(terms[0], CandidateSource.PARSER)]
+    candidates += [make_candidate(term, CandidateSource.PARSER_MATCH) for term in terms[1:]]
+    return bool(await lookup_candidates(db, candidates, k=5))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_level(session_maker, workload: list, concurrency: int, use_cache: bool) -> dict:
+    """Вся нагрузка через concurrency одновременных поисков"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, queries, errors = [], [], 0
+    # kind -> [(found, latency_ms)]
+    by_kind = {}
+    # Исход отличается от записанного в user_activity
+    changed = 0
+
+    async def one(item):
+        nonlocal errors, changed
+        async with semaphore:
+            async with session_maker() as db:
+                try:
+                    with track_request("replay") as timings:
+                        found = await replay_one(db, item, use_cache)
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Replay failed for {(item.get('terms') or [])[:3]}: {e}")
+                    return
+            latencies.append(timings.total_ms)
+            queries.append(timings.db_queries)
+            by_kind.setdefault(item["kind"], []).append((found, timings.total_ms))
+            if item.get("found") is not None and bool(item["found"]) != found:
+                changed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in workload))
+    elapsed = time.perf_counter() - started
+
+    done = max(len(latencies), 1)
+    hits = sum(found for outcomes in by_kind.values() for found, _ in outcomes)
+    return {
+        "concurrency": concurrency,
+        "requests": len(workload),
+        "errors": errors,
+        "hit_rate": hits / done,
+        "rps": len(workload) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": percentile(latencies, 0.95) if latencies else 0.0,
+        "p99": percentile(latencies, 0.99) if latencies else 0.0,
+        "queries_avg": sum(queries) / done,
+        "queries_max": max(queries, default=0),
+        "changed": changed,
+        "kinds": {
+            kind: {
+                "requests": len(outcomes),
+                "hit_rate": sum(found for found, _ in outcomes) / len(outcomes),
+                "p95": percentile([ms for _, ms in outcomes], 0.95),
+            }
+            for kind, outcomes in sorted(by_kind.items())
+        },
+    }
+
+
+async def run(args, workload: list) -> list:
+    if args.sqlite:
+        url = f"sqlite+aiosqlite:///{args.sqlite}"
+        engine = create_async_engine(url)
+    else:
+        url = args.database_url or settings.DATABASE_URL
+        engine = create_async_engine(url, pool_size=max(args.concurrency), max_overflow=0)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    try:
+        if not args.no_indexes:
+            await load_indexes(session_maker)
+
+        results = []
+        for concurrency in args.concurrency:
+            result = await run_level(session_maker, workload, concurrency, args.cache)
+            logger.info(
+                f"concurrency {concurrency}: hit rate {result['hit_rate']:.1%}, "
+                f"p99 {result['p99']:.1f} ms, {result['queries_avg']:.2f} queries/request"
+            )
+            results.append(result)
+        return results
+    finally:
+        await engine.dispose()
+
+
+def print_results(results: list, workload: list, before: list = None):
+    kinds = {}
+    for item in workload:
+        kinds[item["kind"]] = kinds.get(item["kind"], 0) + 1
+    print(f"\nWorkload: {len(workload)} searches ({', '.join(f'{k}: {n}' for k, n in sorted(kinds.items()))})")
+
+    before = {r["concurrency"]: r for r in before or []}
+    print(f"{'conc':>5} {'hit %':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          f" {'q/req':>6} {'q max':>6} {'changed':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['concurrency']:>5} {r['hit_rate'] * 100:>7.1f} {r['rps']:>9.1f} {r['p50']:>8.1f}"
+              f" {r['p95']:>8.1f} {r['p99']:>8.1f} {r['queries_avg']:>6.2f} {r['queries_max']:>6}"
+              f" {r['changed']:>8} {r['errors']:>7}", end="")
+        old = before.get(r["concurrency"])
+        if old:
+            print(f"  (before: hit {old['hit_rate'] * 100:.1f}%, p99 {old['p99']:.1f} ms,"
+                  f" {old['queries_avg']:.2f} q/req)")
+        else:
+            print()
+        for kind, k in r["kinds"].items():
+            print(f"      {kind:<11} {k['requests']:>6} req  hit {k['hit_rate'] * 100:5.1f}%  p95 {k['p95']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-activity", action="store_true", help="Поиски из user_activity (DATABASE_URL)")
+    parser.add_argument("--from-log", nargs="+", default=[], help="Логи бэкенда со строками 'Searching with IDs'")
+    parser.add_argument("--workload", help="Сохранённая нагрузка (JSONL)")
+    parser.add_argument("--save-workload", help="Сохранить собранную нагрузку в JSONL")
+    parser.add_argument("--limit", type=int, default=5000, help="Сколько поисков взять из user_activity")
+    parser.add_argument("--database-url", help="Async URL целевой БД (по умолчанию DATABASE_URL)")
+    parser.add_argument("--sqlite", help="Файл SQLite-замены (собирается из --csv, если его нет)")
+    parser.add_argument("--csv", default="../firmwares.csv", help="CSV каталога для SQLite-замены")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50], help="Уровни параллельности")
+    parser.add_argument("--no-indexes", action="store_true", help="Без in-memory индексов (только БД)")
+    parser.add_argument("--cache", action="store_true", help="Поиск по ID через кеш Redis, как в API")
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    workload = []
+    if args.workload:
+        workload += load_workload(args.workload)
+    if args.from_activity:
+        workload += from_activity(args.limit)
+    if args.from_log:
+        workload += from_logs(args.from_log)
+    if not workload:
+        raise SystemExit("Нет нагрузки: укажите --from-activity, --from-log или --workload")
+    logger.info(f"Workload: {len(workload)} searches")
+
+    if args.save_workload:
+        save_workload(args.save_workload, workload)
+
+    if args.sqlite and not os.path.exists(args.sqlite):
+        count = build_sqlite(args.sqlite, args.csv)
+        logger.info(f"SQLite stand-in {args.sqlite}: {count} firmwares from {args.csv}")
+
+    results = asyncio.run(run(args, workload))
+
+    before = None
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+    print_results(results, workload, before)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
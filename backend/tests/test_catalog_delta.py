@@ -0,0 +1,86 @@
+"""
+Инкрементальное чтение каталога для индексов поиска: изменения, удаления
+и строки, закоммиченные позже водяного знака.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.services.catalog_delta import CatalogDeltaLoader, CatalogRow
+from app.services.trigram_index import TrigramIndex
+
+
+SCHEMA = """
+CREATE TABLE firmwares (
+    id INTEGER PRIMARY KEY, software_id TEXT, versions_info TEXT,
+    brand TEXT, series TEXT, updated_at TIMESTAMP
+)
+"""
+
+
+async def run_scenario(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_maker = async_sessionmaker(engine)
+    loader = CatalogDeltaLoader()
+    index = TrigramIndex()
+
+    async def execute(sql):
+        async with session_maker() as db:
+            await db.execute(text(sql))
+            await db.commit()
+
+    async def load(**kwargs):
+        async with session_maker() as db:
+            delta = await loader.load(db, **kwargs)
+        index.apply(delta)
+        return delta
+
+    await execute(SCHEMA)
+    await execute(
+        "INSERT INTO firmwares VALUES "
+        "(1, '89663-47351', NULL, 'Toyota', 'Prius', datetime('now', '-1 day')), "
+        "(2, '0261S04567', NULL, 'BMW', 'X5', datetime('now', '-1 day')), "
+        "(3, '37805-5J6-R870', NULL, 'Honda', 'Pilot', datetime('now', '-1 day'))"
+    )
+
+    full = await load()
+    assert full.full and len(full.rows) == 3
+
+    await execute("UPDATE firmwares SET software_id = '0261S09999', updated_at = datetime('now') WHERE id = 2")
+    await execute("DELETE FROM firmwares WHERE id = 3")
+    # Долгая транзакция: updated_at раньше водяного знака, коммит - позже
+    await execute("INSERT INTO firmwares VALUES (4, 'GAPS-DG46FS01600', NULL, 'Kia', 'Soul', datetime('now', '-1 day'))")
+
+    delta = await load()
+    assert not delta.full
+    assert {row.id for row in delta.rows} == {2, 4}
+    assert delta.removed == {3}
+    assert index.search("378055J6") == []
+    assert index.search("DG46FS") == [4]
+    assert index.search("026150999") == [2]
+
+    # Перечитанные в окне WATERMARK_OVERLAP строки без изменений - не изменения
+    assert not await load()
+
+    # Изменения, уже применённые по NOTIFY, следующий load() не повторяет
+    await execute("UPDATE firmwares SET series = 'Camry', updated_at = datetime('now') WHERE id = 1")
+    await execute("DELETE FROM firmwares WHERE id = 4")
+    camry = CatalogRow(1, "89663-47351", None, "Toyota", "Camry")
+    notified = await loader.merge([camry], {3, 4})
+    index.apply(notified)
+    assert notified.rows == [camry]
+    assert notified.removed == {4}  # 3 удалена раньше
+    assert not await loader.merge([camry], set())
+    assert not await load()
+    assert index.search("DG46FS") == []
+
+    await engine.dispose()
+
+
+def test_incremental_changes_and_deletions(tmp_path):
+    asyncio.run(run_scenario(tmp_path / "catalog.db"))
@@ -0,0 +1,80 @@
+"""
+Снимок каталога: apply() сообщает только реально изменившиеся прошивки,
+is_stale() замечает изменения, пришедшие без NOTIFY.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import Integer, Numeric, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.models.firmware import Firmware
+from app.models.firmware_variant import FirmwareVariant
+from app.services.catalog_snapshot import CatalogSnapshot
+
+
+def create_table(model) -> str:
+    # Вычисляемые столбцы Postgres в SQLite - обычные
+    def affinity(column) -> str:
+        if isinstance(column.type, Integer):
+            return "INTEGER PRIMARY KEY" if column.primary_key else "INTEGER"
+        return "NUMERIC" if isinstance(column.type, Numeric) else "TEXT"
+
+    columns = ", ".join(f"{column.name} {affinity(column)}" for column in model.__table__.columns)
+    return f"CREATE TABLE {model.__tablename__} ({columns})"
+
+
+async def scenario():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine)
+    snapshot = CatalogSnapshot()
+
+    async def execute(*statements):
+        async with engine.begin() as connection:
+            for statement in statements:
+                await connection.execute(text(statement))
+
+    async def call(method, *args):
+        async with session_maker() as db:
+            return await method(db, *args)
+
+    await execute(
+        create_table(Firmware),
+        create_table(FirmwareVariant),
+        "INSERT INTO firmwares (id, brand, software_id, price, updated_at) VALUES "
+        "(1, 'Toyota', '89663-47351', 50, '2026-01-01 00:00:01'), "
+        "(2, 'BMW', '0261S04567', 70, '2026-01-01 00:00:02')",
+        "INSERT INTO firmware_variants (id, firmware_id, stage, stage_name, price, updated_at) VALUES "
+        "(1, 1, 'stage1', 'Stage 1', 100, '2026-01-01 00:00:01')",
+    )
+    try:
+        await call(snapshot.load)
+        assert not await call(snapshot.is_stale)
+
+        # NOTIFY без изменений (повторное сохранение той же строки)
+        assert await call(snapshot.apply, {1, 2}) == set()
+
+        # Изменился только вариант - прошивка всё равно сообщается
+        await execute("UPDATE firmware_variants SET price = 120, updated_at = '2026-01-01 00:00:03' WHERE id = 1")
+        assert await call(snapshot.apply, {1, 2}) == {1}
+        assert snapshot.variant(1, "stage1").price == 120.0
+        assert not await call(snapshot.is_stale)
+
+        # Изменения без NOTIFY: новая строка, удаление
+        await execute("INSERT INTO firmwares (id, brand, software_id, updated_at) VALUES "
+                      "(3, 'Kia', 'GAPS-DG46FS01600', '2026-01-01 00:00:04')")
+        assert await call(snapshot.is_stale)
+        await call(snapshot.load)
+        assert not await call(snapshot.is_stale)
+        await execute("DELETE FROM firmwares WHERE id = 2")
+        assert await call(snapshot.is_stale)
+    finally:
+        await engine.dispose()
+
+
+def test_apply_reports_changes_and_is_stale_detects_missed_ones():
+    asyncio.run(scenario())
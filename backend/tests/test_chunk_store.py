@@ -0,0 +1,100 @@
+"""
+Дедуплицирующее хранилище: счётчики ссылок в БД (SQLite вместо Postgres),
+блоки и манифесты - на локальном диске.
+"""
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.models.dedup import DedupChunk, DedupFile
+from app.services.chunk_store import ChunkStore, LocalChunkBackend
+
+
+@pytest.fixture
+def run():
+    # Один цикл событий на тест: соединение StaticPool привязано к нему
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def store(tmp_path, run):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def create_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(DedupFile.__table__.create)
+            await connection.run_sync(DedupChunk.__table__.create)
+
+    run(create_tables())
+    yield ChunkStore(LocalChunkBackend(str(tmp_path)), async_sessionmaker(engine), avg_chunk_size=1024)
+    run(engine.dispose())
+
+
+def random_bytes(size: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def refcounts(store: ChunkStore, run) -> dict:
+    async def read():
+        async with store._session() as db:
+            return dict((await db.execute(select(DedupChunk.digest, DedupChunk.refcount))).all())
+    return run(read())
+
+
+def test_put_same_file_twice_adds_no_references(store, run):
+    data = random_bytes(50_000, 1)
+    first = run(store.put_file(data, "stock.bin"))
+    counts = refcounts(store, run)
+
+    second = run(store.put_file(data, "stock.bin"))
+    assert second["file_id"] == first["file_id"]
+    assert second["stored_bytes"] == 0
+    assert refcounts(store, run) == counts
+    assert set(counts.values()) == {1}
+    assert store.get_file(first["file_id"]) == data
+
+
+def test_shared_chunks_survive_delete_and_gc(store, run):
+    base = random_bytes(60_000, 2)
+    revision = base[:30_000] + b"\x00" * 100 + base[30_100:]
+    a = run(store.put_file(base))
+    b = run(store.put_file(revision))
+    assert b["stored_bytes"] < len(revision) // 2
+
+    assert run(store.delete_file(a["file_id"]))
+    assert not run(store.delete_file(a["file_id"]))
+    result = run(store.gc())
+    assert result["removed_chunks"] > 0
+    assert result["files"] == 1
+
+    assert store.get_file(b["file_id"]) == revision
+    assert store.get_manifest(a["file_id"]) is None
+
+
+def test_rebuild_counts_from_manifests(store, run):
+    a = run(store.put_file(random_bytes(40_000, 3)))
+    run(store.put_file(random_bytes(40_000, 4)))
+    counts = refcounts(store, run)
+
+    # Осиротевший блок (запись упала после загрузки) и потерянные счётчики
+    store.backend.put(store._chunk_key("ff" * 32), b"orphan")
+
+    async def lose_counts():
+        async with store._session() as db, db.begin():
+            await db.execute(DedupChunk.__table__.delete())
+    run(lose_counts())
+
+    result = run(store.gc(rebuild_counts=True))
+    assert result["removed_chunks"] == 1
+    assert refcounts(store, run) == counts
+    assert store.get_file(a["file_id"])
@@ -0,0 +1,80 @@
+"""
+Разбиение на блоки и MinHash-сигнатуры - сохраняемые форматы
+(манифесты chunk store, similarity.npz): значения не должны
+меняться между запусками и версиями библиотек.
+"""
+import random
+
+import numpy as np
+
+from app.services.chunking import _GEAR_TABLE, chunk_boundaries, hash_constants
+from app.services.firmware_similarity import FirmwareSimilarityIndex
+
+
+def firmware_like(size: int, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def test_gear_table_is_pinned():
+    # Смена таблицы меняет все границы блоков - только вместе с CHUNKING_SCHEME
+    assert _GEAR_TABLE[:4].tolist() == [3391435751, 3426110835, 1540352372, 2443727109]
+    assert len(set(_GEAR_TABLE.tolist())) == 256
+
+
+def test_minhash_coefficients_are_pinned():
+    index = FirmwareSimilarityIndex()
+    assert index._a[:3].tolist() == [2145617279, 2322486531, 3296870750]
+    assert (index._a >= 1).all()
+    assert np.array_equal(hash_constants("minhash-b", 128, 4294967291), index._b)
+
+
+def test_boundaries_cover_data():
+    data = firmware_like(100_000)
+    boundaries = chunk_boundaries(data, avg_size=1024, min_size=256, max_size=4096)
+    assert boundaries[0][0] == 0 and boundaries[-1][1] == len(data)
+    for (_, end), (start, _) in zip(boundaries, boundaries[1:]):
+        assert end == start
+    assert all(end - start <= 4096 for start, end in boundaries)
+
+
+def test_local_edit_keeps_other_chunks():
+    data = firmware_like(100_000)
+    edited = data[:50_000] + b"\x00" * 37 + data[50_000:]
+
+    def chunks(blob):
+        return {blob[s:e] for s, e in chunk_boundaries(blob, avg_size=1024, min_size=256, max_size=4096)}
+
+    original = chunks(data)
+    assert len(original & chunks(edited)) >= len(original) - 3
+
+
+def test_similarity_save_load_round_trip(tmp_path):
+    index = FirmwareSimilarityIndex()
+    base = firmware_like(60_000)
+    revision = base[:30_000] + b"\xff" * 64 + base[30_064:]
+    for firmware_id in range(100):
+        index.add(firmware_id, firmware_like(20_000, seed=firmware_id + 10))
+    index.add(500, base)
+
+    path = str(tmp_path / "similarity.npz")
+    index.save(path)
+    loaded = FirmwareSimilarityIndex()
+    assert loaded.load(path)
+    assert len(loaded) == 101
+
+    matches = loaded.query_signature(loaded.signature(revision), k=1)
+    assert matches[0]["firmware_id"] == 500
+    assert matches[0]["similarity"] > 0.8
+
+
+def test_similarity_ignores_other_scheme(tmp_path):
+    path = str(tmp_path / "similarity.npz")
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            ids=np.array([1], dtype=np.int64),
+            signatures=np.zeros((1, 128), dtype=np.uint32),
+            params=np.array([128, 32, 1024]),
+        )
+    assert not FirmwareSimilarityIndex().load(path)
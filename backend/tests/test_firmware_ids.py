@@ -0,0 +1,93 @@
+"""
+Нормализация ID: normalize_id() должна давать ровно то же, что
+генерируемые колонки software_id_norm / hardware_id_norm в Postgres,
+иначе точный поиск по нормализованной форме промахивается.
+"""
+import os
+import re
+
+import pytest
+
+from app.models.firmware import Firmware
+from app.services.firmware_ids import CONFUSABLE_FROM, CONFUSABLE_TO, normalize_id
+
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), "..", "migrations")
+
+_SQL_EXPRESSION_RE = re.compile(
+    r"translate\(upper\(regexp_replace\((\w+), '([^']*)', '', 'g'\)\), '(\w+)', '(\w+)'\)"
+)
+
+# Разделители, регистр, OCR-двойники и не-ASCII символы, у которых
+# upper() даёт ASCII ('ß' -> 'SS', 'ı' -> 'I')
+SAMPLE_IDS = [
+    "89663-47351",
+    "37805-5J6-R870(R810)",
+    "gata-be42qs09a00",
+    "GAPS-DG46FS01600",
+    "0261S04567",
+    "O0 Q0 I1 L1 S5 B8 Z2",
+    "1037/512.345",
+    "  f01r_0ad3g0\t",
+    "Straße-1234",
+    "ıd-5678",
+    "ﬁ99",
+    "Ｋ12-KIA",
+    "Пежо-9663",
+    "",
+]
+
+
+def sql_expressions():
+    """(источник, колонка, выражение) из миграций и модели."""
+    found = []
+    for name in ("006_add_software_id_norm.sql", "009_add_hardware_id_norm.sql"):
+        with open(os.path.join(MIGRATIONS, name), encoding="utf-8") as f:
+            found.extend((name, *match) for match in _SQL_EXPRESSION_RE.findall(f.read()))
+    for column in (Firmware.__table__.c.software_id_norm, Firmware.__table__.c.hardware_id_norm):
+        found.extend(
+            (f"model.{column.name}", *match)
+            for match in _SQL_EXPRESSION_RE.findall(str(column.computed.sqltext))
+        )
+    return found
+
+
+def emulate_sql(value: str, pattern: str, source: str, target: str) -> str:
+    """regexp_replace(v, pattern, '', 'g') -> upper() -> translate() (для ASCII - как в Postgres)."""
+    stripped = re.sub(pattern, "", value)
+    return stripped.upper().translate(str.maketrans(source, target))
+
+
+def test_sql_expressions_match_python_constants():
+    expressions = sql_expressions()
+    assert {column for _, column, *_ in expressions} == {"software_id", "hardware_id"}
+    assert len(expressions) == 4
+    for origin, _, pattern, source, target in expressions:
+        assert pattern == "[^A-Za-z0-9]", origin
+        assert (source, target) == (CONFUSABLE_FROM, CONFUSABLE_TO), origin
+
+
+@pytest.mark.parametrize("value", SAMPLE_IDS)
+def test_normalize_id_matches_sql_expression(value):
+    _, _, pattern, source, target = sql_expressions()[0]
+    assert normalize_id(value) == emulate_sql(value, pattern, source, target)
+
+
+def test_normalize_id_examples():
+    assert normalize_id("89663-47351") == "8966347351"
+    assert normalize_id("GATA-BE42QS09") == "GATA8E420509"
+    assert normalize_id("Straße-1234") == "5TRAE1234"
+    assert normalize_id(None) == ""
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_normalize_id_matches_postgres():
+    """Та же проверка на живом Postgres (TEST_DATABASE_URL=postgresql://...)."""
+    from sqlalchemy import create_engine, text
+
+    expression = str(Firmware.__table__.c.software_id_norm.computed.sqltext).replace("software_id", ":value")
+    engine = create_engine(os.environ["TEST_DATABASE_URL"].replace("+asyncpg", ""))
+    with engine.connect() as connection:
+        for value in SAMPLE_IDS:
+            assert connection.execute(text(f"SELECT {expression}"), {"value": value}).scalar() == normalize_id(value), value
+    engine.dispose()
@@ -0,0 +1,117 @@
+"""
+Ранжированный поиск по одному ID: автоматический выбор совпадения и
+одинаковый top-k через in-memory триграммный индекс и через SQL.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.models.firmware import Firmware
+from app.services import firmware_lookup
+from app.services.firmware_ids import normalize_id
+from app.services.firmware_lookup import accepted_match, ranked_search
+from app.services.trigram_index import TrigramIndex
+
+
+# (software_id, hardware_id)
+CATALOG = (
+    [("89663-47351", "0261208123"), ("1TV1B", None), ("0261S04567", "0281010111"), ("A8", None)]
+    + [(f"8966{i:04d}", "0261208999" if i % 3 else "0281013000") for i in range(150)]
+)
+
+
+def schema() -> str:
+    # Вычисляемые *_norm в SQLite - обычные столбцы, заполняются normalize_id()
+    columns = ", ".join(
+        "id INTEGER PRIMARY KEY" if column.name == "id" else f"{column.name} TEXT"
+        for column in Firmware.__table__.columns
+    )
+    return f"CREATE TABLE firmwares ({columns})"
+
+
+async def with_catalog(scenario):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.execute(text(schema()))
+        await connection.execute(text(
+            "CREATE TABLE firmware_id_tokens (id INTEGER PRIMARY KEY, firmware_id INTEGER, "
+            "token TEXT, source_field TEXT, position INTEGER)"
+        ))
+        await connection.execute(
+            text(
+                "INSERT INTO firmwares (id, brand, software_id, software_id_norm, hardware_id, hardware_id_norm) "
+                "VALUES (:id, 'Test', :software_id, :software_id_norm, :hardware_id, :hardware_id_norm)"
+            ),
+            [
+                {
+                    "id": i, "software_id": software_id, "software_id_norm": normalize_id(software_id),
+                    "hardware_id": hardware_id, "hardware_id_norm": normalize_id(hardware_id) or None,
+                }
+                for i, (software_id, hardware_id) in enumerate(CATALOG, start=1)
+            ],
+        )
+    try:
+        async with async_sessionmaker(engine)() as db:
+            return await scenario(db)
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture(params=["sql", "memory"])
+def search(request, monkeypatch):
+    index = TrigramIndex()
+    if request.param == "memory":
+        index.rebuild(enumerate((software_id for software_id, _ in CATALOG), start=1))
+    monkeypatch.setattr(firmware_lookup, "trigram_index", index)
+
+    def run(term, **kwargs):
+        kwargs.setdefault("fuzzy", False)
+        return asyncio.run(with_catalog(lambda db: ranked_search(db, term, **kwargs)))
+    return run
+
+
+def test_short_or_ambiguous_partial_matches_are_not_accepted(search):
+    for term in ("1", "8966", "a%b"):
+        ranked = search(term)
+        assert ranked["results"], term
+        assert ranked["accepted"] is None, term
+
+
+def test_exact_and_unique_partial_matches_are_accepted(search):
+    exact = search("89663 47351")
+    assert exact["accepted"]["match"] == "normalized"
+    assert exact["accepted"]["firmware"].software_id == "89663-47351"
+
+    unique = search("0261S045")
+    assert unique["total_estimate"] == 1
+    assert unique["accepted"]["match"] == "prefix"
+
+
+def test_limit_is_not_capped_by_memory_index(search):
+    ranked = search("8966", k=100)
+    assert len(ranked["results"]) == 100
+    assert ranked["total_estimate"] == 151
+
+
+def test_accepted_match_prefers_direct_over_ambiguous_partial():
+    def match(kind, matched_id, firmware_id):
+        return {"match": kind, "matched_id": matched_id, "firmware": firmware_id}
+
+    ambiguous = [match("prefix", "0261S045", 1), match("prefix", "0261S045", 2)]
+    assert accepted_match(ambiguous) is None
+    assert accepted_match(ambiguous + [match("token", "GAPSDG46", 3)])["firmware"] == 3
+    assert accepted_match([match("fuzzy", "0261S04567", 4)]) is None
+
+
+def test_hardware_filter_keeps_every_matching_firmware(search):
+    ranked = search("8966", k=100, hardware_id="0281-013000")
+    # Каждая третья прошивка 8966xxxx - с этим HW (и ни одна другая)
+    assert len(ranked["results"]) == 50
+    assert ranked["total_estimate"] == 50
+    assert all(match["hardware_match"] for match in ranked["results"])
@@ -0,0 +1,58 @@
+"""
+HW номера блока (HARDWARE_PATTERNS): находятся отдельно от software_id
+и не попадают в кандидаты SW.
+"""
+from app.services.firmware_parser import FirmwareParser
+
+
+def parse(*fields: bytes) -> dict:
+    # Поля разделены бинарным мусором, как в дампе
+    return FirmwareParser().parse_data(b"\xff\x00" + b"\x00\xff\x13".join(fields) + b"\x00\xff")
+
+
+def hardware_patterns(result: dict) -> dict:
+    return {m["pattern"]: m["match"] for m in result["hardware_matches"]}
+
+
+def test_bosch_petrol_and_diesel_hardware():
+    petrol = parse(b"0261208123", b"1037512345")
+    assert petrol["hardware_id"] == "0261208123"
+    assert hardware_patterns(petrol) == {"bosch_hw": "0261208123"}
+    assert petrol["software_id"] == "1037512345"
+
+    diesel = parse(b"0281013000")
+    assert diesel["hardware_id"] == "0281013000"
+
+
+def test_bosch_hardware_needs_digit_boundaries():
+    # Часть более длинного числа - не HW номер
+    assert parse(b"902612081234")["hardware_id"] is None
+    assert parse(b"0261208123456")["hardware_id"] is None
+    assert parse(b"0271208123")["hardware_id"] is None
+
+
+def test_denso_and_continental_hardware():
+    denso = parse(b"275700-1234", b"89663-47351")
+    assert hardware_patterns(denso) == {"denso_hw": "275700-1234"}
+    assert denso["software_id"] == "89663-47351"
+
+    continental = parse(b"A2C53412345")
+    assert hardware_patterns(continental) == {"continental_hw": "A2C53412345"}
+
+
+def test_first_hardware_pattern_wins():
+    result = parse(b"A2C53412345", b"0281013000")
+    assert result["hardware_id"] == "0281013000"
+    assert set(hardware_patterns(result)) == {"bosch_hw", "continental_hw"}
+
+
+def test_software_matches_inside_hardware_numbers_are_excluded():
+    # 10 цифр HW номера - тоже bosch_10digit, цифры A2C - тоже
+    result = parse(b"0261208123", b"A2C1234567890")
+    assert result["software_id"] is None
+    assert result["all_matches"] == []
+
+    # Номера вне HW остаются кандидатами SW
+    result = parse(b"0261208123", b"1037512345", b"2612345678")
+    assert result["software_id"] == "1037512345"
+    assert {m["match"] for m in result["all_matches"]} == {"1037512345", "2612345678"}
@@ -0,0 +1,121 @@
+"""
+Нечёткий поиск ID: индекс удалений должен находить ровно те ID, что
+полный перебор с тем же ограничением расстояния.
+"""
+import random
+import string
+from functools import lru_cache
+
+import pytest
+
+from app.services.firmware_ids import compact_id, normalize_id
+from app.services.fuzzy_index import (
+    CONFUSION_COST,
+    DEFAULT_MAX_DISTANCE,
+    FuzzyIdIndex,
+    confusion_distance,
+    deletes,
+)
+
+
+ALPHABET = string.ascii_uppercase + string.digits
+
+
+def osa_distance(a: str, b: str) -> int:
+    """Невзвешенное расстояние OSA (эталон для границы индекса)."""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+@lru_cache(maxsize=None)
+def variants(value: str) -> frozenset:
+    return frozenset(deletes(value) | {value})
+
+
+def share_delete(a: str, b: str) -> bool:
+    """Граница кандидатов индекса: совпадение после удаления не более одного символа с каждой стороны."""
+    return bool(variants(a) & variants(b))
+
+
+def random_edit(rnd: random.Random, value: str) -> str:
+    position = rnd.randrange(len(value))
+    kind = rnd.choice(["delete", "insert", "replace", "swap"])
+    if kind == "delete":
+        return value[:position] + value[position + 1:]
+    if kind == "insert":
+        return value[:position] + rnd.choice(ALPHABET) + value[position:]
+    if kind == "replace":
+        return value[:position] + rnd.choice(ALPHABET) + value[position + 1:]
+    position = min(position, len(value) - 2)
+    return value[:position] + value[position + 1] + value[position] + value[position + 2:]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    rnd = random.Random(42)
+    ids = {}
+    for firmware_id in range(1, 401):
+        base = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(8, 12)))
+        # Близкие ревизии одного ID - как в реальном каталоге
+        ids[firmware_id] = base if firmware_id % 3 else random_edit(rnd, ids[firmware_id - 1])
+    index = FuzzyIdIndex()
+    index.rebuild(ids.items())
+    return ids, index
+
+
+def test_confusion_distance():
+    assert confusion_distance("8966347351", "8966347351") == 0
+    assert confusion_distance("GATABE42", "GATA8E42") == CONFUSION_COST
+    assert confusion_distance("AB12", "BA12") == 1
+    assert confusion_distance("ABC123", "AC123") == 1
+    assert confusion_distance("ABC123", "XBC123") == confusion_distance("XBC123", "ABC123") == 1
+
+
+def test_search_matches_brute_force(catalog):
+    ids, index = catalog
+    rnd = random.Random(7)
+    for _ in range(100):
+        query = random_edit(rnd, ids[rnd.randint(1, len(ids))])
+        if len(query) < 5:
+            continue
+        expected = sorted(
+            (round(confusion_distance(compact_id(query), compact_id(value)), 2), firmware_id)
+            for firmware_id, value in ids.items()
+            if share_delete(normalize_id(query), normalize_id(value))
+            and confusion_distance(compact_id(query), compact_id(value)) <= DEFAULT_MAX_DISTANCE
+        )
+        hits = index.search(query, k=len(ids))
+        assert [(hit["distance"], hit["firmware_id"]) for hit in hits] == expected, query
+
+        # Всё в пределах одной правки после нормализации находится всегда
+        found = {hit["firmware_id"] for hit in hits}
+        norm = normalize_id(query)
+        for firmware_id, value in ids.items():
+            # OSA <= 1 влечёт общее удаление - расстояние считаем только для них
+            if share_delete(norm, normalize_id(value)) and osa_distance(norm, normalize_id(value)) <= 1:
+                assert firmware_id in found, (query, value)
+
+
+def test_ocr_confusables_and_one_edit_found(catalog):
+    ids, index = catalog
+    target = ids[1]
+    ocr = target.replace("0", "O").replace("1", "I").replace("5", "S").replace("8", "B")
+    hits = index.search(ocr[:-1], k=len(ids))
+    assert any(hit["firmware_id"] == 1 for hit in hits)
+    assert all(hit["distance"] <= DEFAULT_MAX_DISTANCE for hit in hits)
+
+
+def test_removed_ids_not_found(catalog):
+    ids, _ = catalog
+    index = FuzzyIdIndex()
+    index.rebuild(list(ids.items())[:10])
+    index.remove(1)
+    assert all(hit["firmware_id"] != 1 for hit in index.search(ids[1], k=100))
+    assert index.search("AB1") == []
@@ -0,0 +1,86 @@
+"""
+Bloom-фильтр ID каталога: ложноотрицательных ответов нет, в том числе
+после сохранения на диск и загрузки.
+"""
+import random
+import string
+
+from app.services.catalog_delta import CatalogDelta, CatalogRow
+from app.services.id_filter import BloomFilter, CatalogIdFilter, catalog_ids
+
+
+def random_ids(count: int, seed: int):
+    rnd = random.Random(seed)
+    alphabet = string.ascii_uppercase + string.digits
+    return ["".join(rnd.choice(alphabet) for _ in range(10)) + "-" + str(i) for i in range(count)]
+
+
+def test_bloom_save_load_round_trip(tmp_path):
+    values = random_ids(5000, 1)
+    bloom = BloomFilter(len(values))
+    for value in values:
+        bloom.add(value)
+
+    path = str(tmp_path / "bloom.npz")
+    bloom.save(path, note="test")
+    loaded, meta = BloomFilter.load(path)
+
+    assert meta == {"note": "test"}
+    assert (loaded.capacity, loaded.num_bits, loaded.num_hashes, loaded.count) == (
+        bloom.capacity, bloom.num_bits, bloom.num_hashes, bloom.count
+    )
+    assert (loaded.bits == bloom.bits).all()
+    assert all(value in loaded for value in values)
+
+    misses = random_ids(5000, 2)
+    false_positives = sum(value in loaded for value in misses)
+    assert false_positives / len(misses) < bloom.error_rate * 5
+
+
+def test_catalog_filter_contains_every_catalog_id(tmp_path):
+    rows = [
+        ("89663-47351", None),
+        ("37805-5J6-R870(R810)", "KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600"),
+        ("0261S04567", "2 (Оригинал, 1037512345)"),
+    ]
+    id_filter = CatalogIdFilter(str(tmp_path / "id_filter.npz"))
+    assert id_filter.might_contain("anything")  # Не загружен - пропускает всё
+
+    id_filter.rebuild(rows)
+    loaded = CatalogIdFilter(id_filter.path)
+    assert loaded.load()
+
+    for software_id, versions_info in rows:
+        for value in catalog_ids(software_id, versions_info):
+            assert loaded.might_contain(value)
+    # Запросы в другом написании нормализуются так же
+    assert loaded.might_contain("8966347351")
+    assert loaded.might_contain("gaps dg46fs0I6OO")
+    assert loaded.might_contain("37805-5j6-r810")
+    assert not loaded.might_contain("ZZZZ99999999")
+
+
+def test_apply_delta(tmp_path):
+    id_filter = CatalogIdFilter(str(tmp_path / "id_filter.npz"))
+    id_filter.rebuild([("89663-47351", None)], save=False)
+    id_filter.apply(CatalogDelta(False, [CatalogRow(2, "1037512345", None, "BMW", None)], set()))
+    assert id_filter.might_contain("1037512345")
+    assert not id_filter.overfilled
+
+
+def test_readding_known_ids_does_not_fill_the_filter(tmp_path):
+    id_filter = CatalogIdFilter(str(tmp_path / "id_filter.npz"))
+    id_filter.rebuild([("89663-47351", "KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600")], save=False)
+    count = id_filter._bloom.count
+
+    row = CatalogRow(1, "89663-47351", "KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600", "Kia", "Soul")
+    for _ in range(1000):
+        id_filter.apply(CatalogDelta(False, [row], set()))
+    assert id_filter._bloom.count == count
+    assert not (tmp_path / "id_filter.npz").exists()  # Нечего сохранять
+    assert not id_filter.overfilled
+
+    bloom = BloomFilter(100)
+    assert bloom.add("0261S04567")
+    assert not bloom.add("0261S04567")
+    assert bloom.count == 1
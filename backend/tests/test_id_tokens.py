@@ -0,0 +1,41 @@
+"""
+Токены составных ID (firmware_id_tokens): поиск сравнивает normalize_id()
+запроса с токеном, поэтому каждый ID из поля должен давать ровно свою
+нормализованную форму.
+"""
+import pytest
+
+from app.services.firmware_ids import normalize_id, split_id_tokens
+
+
+@pytest.mark.parametrize("field, tokens", [
+    ("37805-5J6-R870(R810)", ["378055J6R870", "378055J6R810"]),
+    ("KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600", ["GAP5DG46F501600"]),
+    ("89663-47351/89663-47352", ["8966347351", "8966347352"]),
+    ("0261S04567;1037512345", ["0261504567", "1037512345"]),
+    # versions_info из WinOLS: повторы и кириллица
+    (
+        "2 (Оригинал, KIA_SOUL_(#E2)]_GAPS-DG46FS01600, KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600)",
+        ["GAP5DG46F501600"],
+    ),
+])
+def test_split_id_tokens(field, tokens):
+    assert split_id_tokens(field) == tokens
+
+
+@pytest.mark.parametrize("field", [None, "", "E2 KIA", "Toyota Prius", 12345])
+def test_no_tokens(field):
+    assert split_id_tokens(field) == []
+
+
+@pytest.mark.parametrize("field, ids", [
+    ("37805-5J6-R870(R810)", ["37805-5J6-R870", "378055j6r810"]),
+    ("KIA_SOUL_(GN28#E2)]_GAPS-DG46FS01600", ["gaps-dg46fs01600", "GAPSDG46FSO16OO"]),
+    ("89663-47351 | 89663-O7352", ["8966347351", "89663 07352"]),
+])
+def test_query_forms_hit_tokens(field, ids):
+    tokens = split_id_tokens(field)
+    for value in ids:
+        assert normalize_id(value) in tokens
+    # Токены уже нормализованы
+    assert all(normalize_id(token) == token for token in tokens)
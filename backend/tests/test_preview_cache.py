@@ -0,0 +1,37 @@
+"""
+Ограничение размера блочного кеша просмотра прошивок.
+"""
+import os
+import time
+
+from app.services.firmware_preview import BlockCache
+
+
+def make_object(cache: BlockCache, key: str, size: int, age: float) -> str:
+    directory = cache._object_dir(key, "etag")
+    os.makedirs(directory)
+    with open(os.path.join(directory, "0"), "wb") as f:
+        f.write(b"\x00" * size)
+    stamp = time.time() - age
+    os.utime(directory, (stamp, stamp))
+    return directory
+
+
+def test_prune_removes_least_recently_read(tmp_path):
+    cache = BlockCache(str(tmp_path), max_bytes=700)
+    oldest = make_object(cache, "a.bin", 400, age=3000)
+    older = make_object(cache, "b.bin", 400, age=2000)
+    recent = make_object(cache, "c.bin", 400, age=1000)
+
+    result = cache.prune()
+    assert result == {"removed": 2, "size": 400}
+    assert not os.path.exists(oldest) and not os.path.exists(older)
+    assert os.path.exists(recent)
+
+
+def test_prune_keeps_objects_in_use(tmp_path):
+    cache = BlockCache(str(tmp_path), max_bytes=100)
+    in_use = make_object(cache, "a.bin", 400, age=1)
+
+    assert cache.prune()["removed"] == 0
+    assert os.path.exists(in_use)
@@ -0,0 +1,55 @@
+"""
+Инвалидация кеша поиска: сбой Redis не повторяется на каждом коммите,
+а в event loop версия увеличивается асинхронно.
+"""
+import asyncio
+
+import redis
+
+from app.services import search_cache as search_cache_module
+from app.services.search_cache import SearchCache
+
+
+class FailingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def incr(self, key):
+        self.calls += 1
+        raise redis.ConnectionError("connection refused")
+
+
+class AsyncCounter:
+    def __init__(self):
+        self.value = 0
+
+    async def incr(self, key):
+        self.value += 1
+        return self.value
+
+
+def test_bump_version_backs_off_after_failure():
+    cache = SearchCache("redis://localhost:1", ttl=60, negative_ttl=10)
+    cache._client = FailingClient()
+
+    assert cache.bump_version() is None
+    assert cache.bump_version() is None
+    assert cache._client.calls == 1  # Второй вызов не ждёт таймаута соединения
+
+
+def test_commit_hook_bumps_off_event_loop(monkeypatch):
+    cache = SearchCache("redis://localhost:1", ttl=60, negative_ttl=10)
+    cache._client = FailingClient()
+    cache._async_client = AsyncCounter()
+    monkeypatch.setattr(search_cache_module, "search_cache", cache)
+
+    class FakeSession:
+        info = {"catalog_changed": True}
+
+    async def commit():
+        search_cache_module._bump_on_commit(FakeSession())
+        await asyncio.gather(*search_cache_module._pending_bumps)
+
+    asyncio.run(commit())
+    assert cache._async_client.value == 1
+    assert cache._client.calls == 0
@@ -0,0 +1,50 @@
+"""
+Лимиты размера загрузок: отдельный файл и суммарный размер пакета.
+"""
+import io
+import zipfile
+
+import pytest
+
+from app.services.batch_search import BatchLimitExceeded, unpack_archive
+from app.services.uploads import UploadTooLarge, UploadedFile, read_upload
+
+
+def test_zero_limit_is_a_limit():
+    with pytest.raises(UploadTooLarge):
+        read_upload(io.BytesIO(b"x"), max_size=0)
+    assert read_upload(io.BytesIO(b"x" * 10)).size == 10
+
+
+def test_limit_checked_while_reading_when_size_unknown():
+    class Stream(io.RawIOBase):
+        # Без seek/tell - как член ZIP архива
+        def __init__(self, size):
+            self.left = size
+
+        def read(self, n=-1):
+            n = min(self.left, 4096 if n < 0 else n)
+            self.left -= n
+            return b"\x00" * n
+
+    with pytest.raises(UploadTooLarge):
+        read_upload(Stream(100), max_size=99)
+    assert read_upload(Stream(99), max_size=99).size == 99
+
+
+def archive(*sizes: int) -> UploadedFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for i, size in enumerate(sizes):
+            zf.writestr(f"file{i}.bin", b"\x00" * size)
+    return UploadedFile(content=buffer.getvalue(), sha256="", filename="batch.zip")
+
+
+def test_archive_total_size_limit():
+    assert [f.size for f in unpack_archive(archive(60, 40), max_files=10, max_total_size=100)] == [60, 40]
+
+    # Лимит исчерпан ровно - следующий файл уже не читается
+    with pytest.raises(BatchLimitExceeded):
+        unpack_archive(archive(60, 40, 10), max_files=10, max_total_size=100)
+    with pytest.raises(UploadTooLarge):
+        unpack_archive(archive(60, 50), max_files=10, max_total_size=100)
@@ -0,0 +1,56 @@
+"""
+Профили стока для Stage вариантов: хранятся в firmware_variants.stock_profile,
+поэтому хеш блока и формат профиля не должны меняться незаметно.
+"""
+import json
+import random
+
+import pytest
+
+from app.services import variant_verifier
+
+
+def stock_file(size: int = 64 * 1024, seed: int = 7) -> bytes:
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def patched(data: bytes, offset: int, length: int) -> bytes:
+    return data[:offset] + bytes(b ^ 0xFF for b in data[offset:offset + length]) + data[offset + length:]
+
+
+def test_block_hash_is_pinned():
+    assert int(variant_verifier.block_hashes(bytes(range(256)) * 2)[0]) == 0xE00AADA946447A40
+    # Неполный блок дополняется нулями: хеш 0x01 - первый вес
+    assert int(variant_verifier.block_hashes(b"\x01")[0]) == 0x5B9AA4F2A93FD6F5
+
+
+def test_profile_round_trip():
+    stock = stock_file()
+    stage1 = patched(stock, 10_000, 300)
+    profile = variant_verifier.build_profile(
+        stock,
+        regions=[{"name": "code", "start": 0, "end": 32768}, {"name": "calibration", "start": 32768, "end": 65536}],
+        modified=stage1,
+    )
+    # Как после записи в JSONB и чтения обратно
+    stored = json.loads(json.dumps(profile))
+    assert stored["version"] == variant_verifier.PROFILE_VERSION
+
+    assert variant_verifier.verify(stored, stock)["exact"]
+    # Пропатченные блоки не входят в хеш - сам Stage файл тоже совместим
+    assert variant_verifier.verify(stored, stage1)["compatible"]
+
+    other_calibration = patched(stock, 40_000, 16)
+    result = variant_verifier.verify(stored, other_calibration)
+    assert not result["compatible"]
+    assert {r["name"]: r["match"] for r in result["regions"]} == {"code": True, "calibration": False}
+
+    assert not variant_verifier.verify(stored, stock[:-256])["compatible"]
+
+
+def test_unknown_profile_version():
+    profile = variant_verifier.build_profile(stock_file(4096))
+    profile["version"] = 99
+    with pytest.raises(variant_verifier.UnsupportedProfile):
+        variant_verifier.verify(profile, stock_file(4096))
@@ -173,15 +173,15 @@ async def guest_handle_document(message: Message, state: FSMContext, bot: Bot):
     if result.get("found"):
         firmware = result["firmware"]
         
-        # Get variants
-        variants_result = await api_client.get_firmware_variants(firmware.get('id'))
-        variants = variants_result.get("variants", [])
+        # Variants come with the search response
+        variants = await api_client.variants_for(result)
         
         # Save to state for later
         await state.update_data(
             firmware=firmware,
             variants=variants,
-            original_filename=document.file_name
+            original_filename=document.file_name,
+            original_file_path=result.get("original_ref")
         )
         
         # Build variants text
@@ -128,16 +128,19 @@ async def handle_photo(message: Message, state: FSMContext, bot: Bot):
     best = result["best_match"]
     all_ids = result["firmware_ids"]
     
-    # Search in database
-    search_result = await api_client.search_firmware(best["id"])
+    # Search all recognized IDs in one call (best match first)
+    search_result = await api_client.search_firmware_ids([item["id"] for item in all_ids])
     
     if search_result.get("found"):
-        # Found in database! Get Stage variants
+        # Found in database - possibly by a less confident OCR candidate
         firmware = search_result["firmware"]
+        best = next(
+            (item for item in all_ids if item["id"] == search_result.get("extracted_id")),
+            best
+        )
         
-        # Get Stage variants (Stage 1/2/3)
-        variants_result = await api_client.get_firmware_variants(firmware.get('id'))
-        variants = variants_result.get("variants", [])
+        # Stage variants (Stage 1/2/3) come with the search response
+        variants = await api_client.variants_for(search_result)
         
         # Save to state for later
         await state.update_data(
@@ -172,6 +175,13 @@ async def handle_photo(message: Message, state: FSMContext, bot: Bot):
             for item in all_ids[:5]
         ])
         
+        # Похожие ID из базы (нечёткий поиск с учётом ошибок OCR)
+        suggestions = search_result.get("suggestions", [])
+        if suggestions:
+            ids_text += "\n\n🔎 <b>Похожие в базе:</b>\n" + "\n".join(
+                f"• <code>{item['software_id']}</code>" for item in suggestions[:3]
+            )
+        
         # Отправляем запрос операторам
         for operator_id in settings.OPERATOR_IDS:
             try:
@@ -279,16 +289,16 @@ async def handle_document(message: Message, state: FSMContext, bot: Bot):
         firmware = result["firmware"]
         parse_result = result.get("parse_result", {})
         
-        # Get Stage variants (Stage 1/2/3)
-        variants_result = await api_client.get_firmware_variants(firmware.get('id'))
-        variants = variants_result.get("variants", [])
+        # Stage variants (Stage 1/2/3) come with the search response
+        variants = await api_client.variants_for(result)
         
         # Save to state
         await state.update_data(
             firmware=firmware,
             variants=variants,
             original_filename=document.file_name,
-            original_file_path=temp_path
+            # Оригинал уже сохранён бэкендом (dedup://...), локальный путь - запасной вариант
+            original_file_path=result.get("original_ref") or temp_path
         )
         
         text = f"""
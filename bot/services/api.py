@@ -3,11 +3,14 @@ API Client for backend communication
 """
 
 import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from loguru import logger
 
 from config import settings
 
+# Backend limit for POST /api/firmware/search/ids
+MAX_SEARCH_IDS = 20
+
 
 class APIClient:
     """Client for backend API communication"""
@@ -72,17 +75,20 @@ class APIClient:
         file_path: str,
         filename: str,
         user_id: int,
-        is_guest: bool = False
+        is_guest: bool = False,
+        include_variants: bool = True
     ) -> Dict:
         """
         Upload firmware file and search in database.
-        Returns: {found, extracted_id, parse_result, firmware?, similar_firmwares?}
+        Returns: {found, extracted_id, parse_result, firmware?, variants?, similar_firmwares?}
         """
         with open(file_path, "rb") as f:
             files = {"file": (filename, f, "application/octet-stream")}
             params = {}
             if is_guest:
                 params["is_guest"] = "true"
+            if include_variants:
+                params["include_variants"] = "true"
             return await self._request(
                 "POST",
                 "/api/firmware/search",
@@ -90,12 +96,26 @@ class APIClient:
                 params=params if params else None
             )
     
-    async def search_firmware(self, software_id: str) -> Dict:
-        """Search firmware by software ID"""
+    async def search_firmware(self, software_id: str, include_variants: bool = True) -> Dict:
+        """Search firmware by software ID (with Stage variants in the same response)"""
+        params = {"software_id": software_id}
+        if include_variants:
+            params["include_variants"] = "true"
         return await self._request(
             "GET",
             "/api/firmware/search",
-            params={"software_id": software_id}
+            params=params
+        )
+    
+    async def search_firmware_ids(self, software_ids: List[str], include_variants: bool = True) -> Dict:
+        """
+        Search several candidate IDs (e.g. all OCR results) in one call.
+        The first ID (in the given order) that matches wins: extracted_id.
+        """
+        return await self._request(
+            "POST",
+            "/api/firmware/search/ids",
+            json={"ids": software_ids[:MAX_SEARCH_IDS], "include_variants": include_variants}
         )
     
     async def get_firmware_variants(self, firmware_id: int) -> Dict:
@@ -105,6 +125,13 @@ class APIClient:
             f"/api/firmware/{firmware_id}/variants"
         )
     
+    async def variants_for(self, search_result: Dict) -> List[Dict]:
+        """Stage variants from a search response; separate request only if missing"""
+        if "variants" in search_result:
+            return search_result["variants"]
+        variants_result = await self.get_firmware_variants(search_result["firmware"].get("id"))
+        return variants_result.get("variants", [])
+    
     async def get_firmware_stats(self) -> Dict:
         """Get firmware database statistics"""
         return await self._request("GET", "/api/firmware/stats")
@@ -192,6 +192,51 @@ export async function uploadFirmware(formData: FormData): Promise<{ success: boo
   return response.json();
 }
 
+export interface HexTileRow {
+  offset: string;
+  hex: string;
+  ascii: string;
+}
+
+export interface HexTile {
+  key: string;
+  offset: number;
+  length: number;
+  file_size: number;
+  rows: HexTileRow[];
+}
+
+export async function getFirmwareHexTile(key: string, offset: number = 0, length: number = 4096): Promise<HexTile> {
+  const params = new URLSearchParams({ key, offset: String(offset), length: String(length) });
+  return fetchWithAuth(`${API_BASE_URL}/admin/firmwares/preview/hex?${params}`);
+}
+
+export async function getFirmwareHeatmapTile(
+  key: string,
+  offset: number = 0,
+  length: number = 65536,
+  width: number = 256,
+  wordSize: 1 | 2 = 1,
+): Promise<Blob> {
+  const token = typeof window !== 'undefined' ? localStorage.getItem('admin_token') : null;
+  const params = new URLSearchParams({
+    key,
+    offset: String(offset),
+    length: String(length),
+    width: String(width),
+    word_size: String(wordSize),
+  });
+  const response = await fetch(`${API_BASE_URL}/admin/firmwares/preview/heatmap?${params}`, {
+    headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Heatmap request failed: ${response.status}`);
+  }
+  
+  return response.blob();
+}
+
 // === STAFF ===
 
 export async function getStaff(): Promise<StaffMember[]> {